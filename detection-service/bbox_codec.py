@@ -0,0 +1,180 @@
+"""
+Bbox Codec Module for S-Pavilion Detection Service
+
+Compact binary encoding for bbox uploads (BBOX_WIRE_FORMAT=binary). Boxes are
+stored as fixed-width int16 columns instead of a JSON list of lists, frame
+timestamps are delta-coded, and larger bodies are compressed with gzip or
+zstd, so payloads and serialization CPU stay small when many cameras upload
+often.
+
+Wire format v1, all integers little-endian, sent as
+Content-Type: application/x-spavilion-bbox, with Content-Encoding gzip or
+zstd when the body is at least COMPRESS_MIN_BYTES:
+
+    header         "<4sBBHqIH": magic b"SPBB", version 1, flags (0),
+                   frames F, base timestamp (ms since epoch), boxes N,
+                   camera id length L
+    camera_id      L bytes, UTF-8
+    frame_numbers  uint32[F]
+    ts_deltas      uint32[F]  ms since the previous frame (the first since base)
+    box_counts     uint16[F]
+    x, y, w, h     int16[N] each; the boxes of all frames in frame order
+
+nest/src/bbox-history/bbox-codec.ts is the decoder; keep the two in sync.
+"""
+
+import gzip
+import logging
+import struct
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SPBB"
+VERSION = 1
+HEADER = struct.Struct("<4sBBHqIH")
+CONTENT_TYPE = "application/x-spavilion-bbox"
+ENCODINGS = ("gzip", "zstd", "none")
+# Below this, compression costs more CPU than the bytes it saves
+COMPRESS_MIN_BYTES = 256
+
+INT16_MIN, INT16_MAX = -32768, 32767
+
+# (frame_number, timestamp in seconds since epoch, [[x, y, w, h], ...])
+Frame = Tuple[int, float, Sequence[Sequence[int]]]
+
+
+def _clip(values: Sequence[int]) -> List[int]:
+    return [min(max(int(v), INT16_MIN), INT16_MAX) for v in values]
+
+
+def encode(camera_id: str, frames: Sequence[Frame]) -> bytes:
+    """Encode one or more frames of one camera into a v1 payload"""
+    if not frames:
+        raise ValueError("At least one frame is required")
+    if len(frames) > 0xFFFF:
+        raise ValueError(f"Too many frames in one payload: {len(frames)}")
+
+    camera = camera_id.encode("utf-8")
+    count = len(frames)
+    timestamps = [round(ts * 1000) for _, ts, _ in frames]
+    deltas = [0] + [b - a for a, b in zip(timestamps, timestamps[1:])]
+    if min(deltas) < 0:
+        raise ValueError("Frames must be in timestamp order")
+
+    # struct.pack on a transposed list is several times faster than json.dumps
+    # (and than numpy) at the few dozen boxes of a typical upload
+    boxes = [box for _, _, frame_boxes in frames for box in frame_boxes]
+    x, y, w, h = zip(*boxes) if boxes else ((), (), (), ())
+    column_format = f"<{4 * len(boxes)}h"
+    try:
+        columns = struct.pack(column_format, *x, *y, *w, *h)
+    except struct.error:
+        # Coordinates beyond int16 do not occur at camera resolutions; clip rather than fail
+        columns = struct.pack(column_format, *_clip(x), *_clip(y), *_clip(w), *_clip(h))
+
+    return b"".join((
+        HEADER.pack(MAGIC, VERSION, 0, count, timestamps[0], len(boxes), len(camera)),
+        camera,
+        struct.pack(f"<{count}I{count}I{count}H", *(number for number, _, _ in frames), *deltas,
+                    *(len(frame_boxes) for _, _, frame_boxes in frames)),
+        columns,
+    ))
+
+
+def decode(data: bytes) -> Tuple[str, List[Tuple[int, int, List[List[int]]]]]:
+    """Decode a v1 payload into (camera_id, [(frame_number, timestamp_ms, bboxes), ...])"""
+    if len(data) < HEADER.size:
+        raise ValueError("Payload shorter than the header")
+    magic, version, _flags, count, base, box_total, camera_len = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError(f"Bad magic {magic!r}")
+    if version != VERSION:
+        raise ValueError(f"Unsupported version {version}")
+
+    expected = HEADER.size + camera_len + count * 10 + box_total * 8
+    if len(data) != expected:
+        raise ValueError(f"Payload is {len(data)} bytes, expected {expected}")
+
+    offset = HEADER.size
+    camera_id = bytes(data[offset:offset + camera_len]).decode("utf-8")
+    offset += camera_len
+    frame_columns = struct.unpack_from(f"<{count}I{count}I{count}H", data, offset)
+    offset += count * 10
+    numbers, deltas, counts = (frame_columns[:count], frame_columns[count:2 * count],
+                               frame_columns[2 * count:])
+    if sum(counts) != box_total:
+        raise ValueError("Box counts do not add up to the box total")
+    values = struct.unpack_from(f"<{4 * box_total}h", data, offset)
+    boxes = [list(box) for box in zip(values[:box_total], values[box_total:2 * box_total],
+                                      values[2 * box_total:3 * box_total], values[3 * box_total:])]
+
+    frames = []
+    ts = base
+    start = 0
+    for number, delta, box_count in zip(numbers, deltas, counts):
+        ts += delta
+        frames.append((number, ts, boxes[start:start + box_count]))
+        start += box_count
+    return camera_id, frames
+
+
+def resolve_encoding(encoding: str) -> str:
+    """Validate a Content-Encoding name, falling back to gzip when zstandard is not installed"""
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown bbox compression '{encoding}' (expected one of {', '.join(ENCODINGS)})")
+    if encoding == "zstd" and zstandard is None:
+        logger.warning("zstandard is not installed; compressing bbox uploads with gzip instead")
+        return "gzip"
+    return encoding
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a payload for the given Content-Encoding (as returned by resolve_encoding)"""
+    if encoding == "gzip":
+        # mtime=0 keeps the output deterministic; level 1 is plenty for small integer columns
+        return gzip.compress(data, compresslevel=level or 1, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=level or 3).compress(data)
+    return data
+
+
+def encode_request(camera_id: str, frames: Sequence[Frame], encoding: str) -> Tuple[bytes, dict]:
+    """Encode (and compress, if large enough) an upload; returns (body, HTTP headers)"""
+    body = encode(camera_id, frames)
+    headers = {"Content-Type": CONTENT_TYPE}
+    if encoding != "none" and len(body) >= COMPRESS_MIN_BYTES:
+        body = compress(body, encoding)
+        headers["Content-Encoding"] = encoding
+    return body, headers
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+    import timeit
+
+    # Size and CPU comparison against the JSON upload: python bbox_codec.py [boxes] [frames]
+    box_total = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    frame_total = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+    boxes = [[100 + 37 * i, 220 + 11 * i, 60 + i, 140 + 2 * i] for i in range(box_total)]
+    frames = [(1000 + n, time.time() + n / 15, boxes) for n in range(frame_total)]
+    documents = [{"bboxes": b, "frame_count": n, "camera_id": "camera_0"} for n, _, b in frames]
+
+    assert [f[2] for f in decode(encode("camera_0", frames))[1]] == [boxes] * frame_total
+    print(f"{box_total} boxes x {frame_total} frame(s)")
+    seconds = timeit.timeit(lambda: json.dumps(documents).encode(), number=2000) / 2000
+    print(f"  json          {len(json.dumps(documents).encode()):6d} bytes  {seconds * 1e6:7.1f} us")
+    for encoding in ENCODINGS:
+        if encoding == "zstd" and zstandard is None:
+            continue
+        body = compress(encode("camera_0", frames), encoding)
+        seconds = timeit.timeit(lambda: compress(encode("camera_0", frames), encoding), number=2000) / 2000
+        print(f"  binary+{encoding:5s}  {len(body):6d} bytes  {seconds * 1e6:7.1f} us")
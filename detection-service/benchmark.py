@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+"""
+End-to-end Benchmark Harness for S-Pavilion Detection Service
+
+Runs the real main.py pipeline headless in mock mode against a fixed local
+video file, once per configuration:
+- a local stand-in HTTP server answers POST /api/bbox_history
+- the stream goes to a null (or file) sink instead of RTMP/RTSP
+- sustained FPS is taken from the service's /metrics endpoint
+- per-stage latency percentiles come from the stage profiler trace
+- CPU% and peak RSS are read from /proc for the service and its encoder
+
+Results are written as JSON so runs of different releases can be compared.
+
+Usage:
+    python benchmark.py --video test-video.mp4 --duration 30 --output bench.json
+    python benchmark.py --configs my_matrix.json
+    python benchmark.py compare old.json new.json
+"""
+
+import argparse
+import glob
+import json
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import numpy as np
+
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+MAIN_SCRIPT = os.path.join(SERVICE_DIR, "main.py")
+
+# Default matrix: detection on/off x FFmpeg/GStreamer
+DEFAULT_CONFIGS = [
+    {"name": "ffmpeg-nodetect", "env": {"USE_DETECTION": "false", "USE_GSTREAMER": "false"}},
+    {"name": "ffmpeg-detect", "env": {"USE_DETECTION": "true", "USE_GSTREAMER": "false"}},
+    {"name": "gstreamer-nodetect", "env": {"USE_DETECTION": "false", "USE_GSTREAMER": "true"}},
+    {"name": "gstreamer-detect", "env": {"USE_DETECTION": "true", "USE_GSTREAMER": "true"}},
+    # Mock frames replayed from a pre-decoded cache instead of decoded per frame
+    {"name": "ffmpeg-nodetect-framecache", "env": {
+        "USE_DETECTION": "false", "USE_GSTREAMER": "false", "MOCK_FRAME_CACHE": "ram"}},
+    # Multi-source mode: four copies of the clip sharing one model, batched vs. one frame per call
+    {"name": "ffmpeg-detect-4src-batch", "env": {
+        "USE_DETECTION": "true", "USE_GSTREAMER": "false", "DETECTION_BATCH_SIZE": "4",
+        "SOURCES": json.dumps([{"id": f"cam{i}", "video": "{video}"} for i in range(4)])}},
+    {"name": "ffmpeg-detect-4src-nobatch", "env": {
+        "USE_DETECTION": "true", "USE_GSTREAMER": "false", "DETECTION_BATCH_SIZE": "1",
+        "SOURCES": json.dumps([{"id": f"cam{i}", "video": "{video}"} for i in range(4)])}},
+]
+
+
+# =========================
+# Stand-in backend API
+# =========================
+class _StubApiHandler(BaseHTTPRequestHandler):
+    """Accepts bbox uploads the way the Nest backend does (201 Created)"""
+
+    stats = None  # set per server
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.path.startswith("/api/bbox_history"):
+            with self.stats["lock"]:
+                self.stats["requests"] += 1
+                self.stats["bytes"] += length
+            body = b'{"success":true,"id":"0"}'
+            self.send_response(201)
+        else:
+            body = b'{"success":false}'
+            self.send_response(404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubApiServer:
+    """Local HTTP server standing in for the NestJS /api/bbox_history endpoint"""
+
+    def __init__(self):
+        self.stats = {"requests": 0, "bytes": 0, "lock": threading.Lock()}
+        handler = type("StubApiHandler", (_StubApiHandler,), {"stats": self.stats})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def reset(self):
+        with self.stats["lock"]:
+            self.stats["requests"] = 0
+            self.stats["bytes"] = 0
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.stats["lock"]:
+            return {"requests": self.stats["requests"], "bytes": self.stats["bytes"]}
+
+
+# =========================
+# Process measurement (/proc)
+# =========================
+_CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def _process_tree(pid: int) -> List[int]:
+    """pid plus all of its descendants (e.g. the ffmpeg encoder)"""
+    children: Dict[int, List[int]] = {}
+    for stat_path in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat_path) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(stat_path.split("/")[2]))
+        except (OSError, IndexError, ValueError):
+            continue
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending.extend(children.get(current, []))
+    return tree
+
+
+def _cpu_seconds(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        # utime and stime are fields 14 and 15 (1-based) of /proc/<pid>/stat
+        return (int(fields[11]) + int(fields[12])) / _CLOCK_TICKS
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def _peak_rss_bytes(pid: int) -> int:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return 0
+
+
+class ProcessSampler:
+    """Samples CPU time and peak RSS of a process tree in the background"""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        self.pid = pid
+        self.interval = interval
+        self.cpu: Dict[int, float] = {}
+        self.peak_rss: Dict[int, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+    def sample(self):
+        for pid in _process_tree(self.pid):
+            self.cpu[pid] = max(self.cpu.get(pid, 0.0), _cpu_seconds(pid))
+            self.peak_rss[pid] = max(self.peak_rss.get(pid, 0), _peak_rss_bytes(pid))
+
+    def total_cpu(self) -> float:
+        return sum(self.cpu.values())
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+
+# =========================
+# Helpers
+# =========================
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _scrape(port: int) -> Dict[str, float]:
+    """Parse the service's /metrics text into {series: value}"""
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as resp:
+            text = resp.read().decode("utf-8")
+    except OSError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        series, _, value = line.rpartition(" ")
+        try:
+            values[series] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+def _wait_for_metrics(port: int, proc: subprocess.Popen, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        if _scrape(port).get("detection_frames_captured_total", 0) > 0:
+            return True
+        time.sleep(0.2)
+    return False
+
+
+def _stage_percentiles(trace_path: str, since_ns: int) -> Dict[str, Dict[str, float]]:
+    """
+    Per-stage percentiles (ms) from a profiler Chrome trace, only for frames that
+    started after `since_ns`. perf_counter_ns is CLOCK_MONOTONIC on Linux, so the
+    harness and the service share a time base.
+    """
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+
+    since_us = since_ns / 1000.0
+    per_stage: Dict[str, List[float]] = {}
+    keep = False
+    for event in events:
+        if event["name"] == "frame":
+            keep = event["ts"] >= since_us
+            if keep:
+                per_stage.setdefault("total", []).append(event["dur"] / 1000.0)
+        elif keep:
+            per_stage.setdefault(event["name"], []).append(event["dur"] / 1000.0)
+
+    frames = len(per_stage.get("total", []))
+    result = {}
+    for name, values in per_stage.items():
+        # Stages skipped in a frame record no event; count them as 0 ms
+        arr = np.asarray(values, dtype=np.float64)
+        arr = np.pad(arr, (0, max(frames - len(arr), 0)))
+        result[name] = {
+            "p50": round(float(np.percentile(arr, 50)), 3),
+            "p90": round(float(np.percentile(arr, 90)), 3),
+            "p99": round(float(np.percentile(arr, 99)), 3),
+            "mean": round(float(arr.mean()), 3),
+            "max": round(float(arr.max()), 3),
+        }
+    return result
+
+
+def ensure_video(path: str, width: int = 1280, height: int = 720, fps: int = 30,
+                 seconds: int = 10) -> str:
+    """Generate a deterministic synthetic clip if the benchmark video is missing"""
+    if os.path.exists(path):
+        return path
+
+    import cv2
+
+    print(f"Video {path} not found; generating a {seconds}s synthetic clip")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    rng = np.random.default_rng(1234)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        frame = background.copy()
+        for k in range(4):
+            x = int((i * (3 + k) + k * 200) % (width - 120))
+            y = int(height / 2 + (height / 4) * np.sin((i + 10 * k) / 20.0)) - 120
+            cv2.rectangle(frame, (x, y), (x + 80, y + 240), (40 * k, 80, 200), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+# =========================
+# Benchmark runner
+# =========================
+def run_config(config: Dict, video: str, api: StubApiServer, duration: float,
+               warmup: float, sink: str, startup_timeout: float) -> Dict:
+    """Run main.py once with the given configuration and collect measurements"""
+    name = config["name"]
+    metrics_port = _free_port()
+    workdir = tempfile.mkdtemp(prefix=f"bench_{name}_")
+
+    env = dict(os.environ)
+    env.update({
+        "MOCK_MODE": "true",
+        "MOCK_VIDEO_FILE": os.path.abspath(video),
+        "API_URL": api.url,
+        "STREAM_SINK": sink,
+        "STREAM_SINK_FILE": os.path.join(workdir, "stream.ts"),
+        "METRICS_PORT": str(metrics_port),
+        "PROFILE_STAGES": "true",
+        "PROFILE_RING_SIZE": str(int((duration + warmup + startup_timeout) * 120)),
+        "PROFILE_DUMP_DIR": workdir,
+        "PYTHONUNBUFFERED": "1",
+    })
+    # "{video}" in a config value stands for the benchmark clip (e.g. inside SOURCES)
+    env.update({k: str(v).replace("{video}", os.path.abspath(video)) for k, v in config.get("env", {}).items()})
+
+    print(f"\n=== {name} ===")
+    log_path = os.path.join(workdir, "service.log")
+    with open(log_path, "w") as log:
+        proc = subprocess.Popen([sys.executable, MAIN_SCRIPT], cwd=workdir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+
+    result = {"name": name, "env": config.get("env", {}), "log": log_path}
+    sampler = ProcessSampler(proc.pid)
+    sampler.start()
+    try:
+        if not _wait_for_metrics(metrics_port, proc, startup_timeout):
+            result["error"] = "service did not start streaming (see log)"
+            print(f"  FAILED: {result['error']} -> {log_path}")
+            return result
+
+        time.sleep(warmup)
+        api.reset()
+        sampler.sample()
+        before = _scrape(metrics_port)
+        cpu_before = sampler.total_cpu()
+        since_ns = time.perf_counter_ns()
+        t0 = time.monotonic()
+
+        time.sleep(duration)
+
+        sampler.sample()
+        after = _scrape(metrics_port)
+        elapsed = time.monotonic() - t0
+        cpu_after = sampler.total_cpu()
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        sampler.stop()
+
+    def delta(series: str) -> float:
+        return after.get(series, 0.0) - before.get(series, 0.0)
+
+    frames = delta("detection_frames_captured_total")
+    result.update({
+        "duration_s": round(elapsed, 2),
+        "frames": int(frames),
+        "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+        "cpu_percent": round(100.0 * (cpu_after - cpu_before) / elapsed, 1) if elapsed > 0 else 0.0,
+        "peak_rss_bytes": sampler.peak_rss.get(proc.pid, 0),
+        "peak_rss_children_bytes": sum(v for pid, v in sampler.peak_rss.items() if pid != proc.pid),
+        "dropped_frames": {
+            series.split('"')[1]: int(delta(series))
+            for series in after if series.startswith("detection_frames_dropped_total{")
+        },
+        "uploads": api.snapshot(),
+    })
+    batches = delta("detection_inference_batch_size_count")
+    if batches > 0:
+        result["avg_batch_size"] = round(delta("detection_inference_batch_size_sum") / batches, 2)
+
+    traces = sorted(glob.glob(os.path.join(workdir, "profile_*.trace.json")))
+    if traces:
+        result["stages_ms"] = _stage_percentiles(traces[-1], since_ns)
+
+    print(f"  fps={result['fps']}  cpu={result['cpu_percent']}%  "
+          f"peak_rss={result['peak_rss_bytes'] / 2**20:.1f}MiB  uploads={result['uploads']['requests']}")
+    return result
+
+
+def run_benchmarks(args) -> Dict:
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+    else:
+        configs = DEFAULT_CONFIGS
+    if args.only:
+        configs = [c for c in configs if c["name"] in args.only]
+    if args.replay:
+        # Every configuration reads the same recorded frames instead of the mock video
+        replay_env = {"REPLAY_FILE": os.path.abspath(args.replay), "REPLAY_SPEED": args.replay_speed,
+                      "REPLAY_LOOP": "true"}
+        configs = [dict(c, env={**replay_env, **c.get("env", {})}) for c in configs]
+
+    video = ensure_video(args.video)
+    api = StubApiServer()
+    api.start()
+    try:
+        results = [run_config(c, video, api, args.duration, args.warmup, args.sink,
+                              args.startup_timeout) for c in configs]
+    finally:
+        api.stop()
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVICE_DIR,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.TimeoutExpired):
+        commit = ""
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit,
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "video": os.path.abspath(video),
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "sink": args.sink,
+        },
+        "results": results,
+    }
+
+
+def compare(old_path: str, new_path: str):
+    """Print FPS / CPU / RSS deltas between two result files"""
+    with open(old_path) as f:
+        old = {r["name"]: r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {r["name"]: r for r in json.load(f)["results"]}
+
+    print(f"{'config':<24}{'fps':>18}{'cpu %':>18}{'peak rss MiB':>22}")
+    for name in sorted(set(old) & set(new)):
+        o, n = old[name], new[name]
+        if "error" in o or "error" in n:
+            print(f"{name:<24}{'(error)':>18}")
+            continue
+        print(f"{name:<24}"
+              f"{o['fps']:>8.1f} -> {n['fps']:<7.1f}"
+              f"{o['cpu_percent']:>8.1f} -> {n['cpu_percent']:<7.1f}"
+              f"{o['peak_rss_bytes'] / 2**20:>10.1f} -> {n['peak_rss_bytes'] / 2**20:<9.1f}")
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        if len(sys.argv) != 4:
+            print("Usage: python benchmark.py compare <old.json> <new.json>")
+            sys.exit(1)
+        compare(sys.argv[2], sys.argv[3])
+        return
+
+    parser = argparse.ArgumentParser(description="Detection pipeline benchmark")
+    parser.add_argument("--video", default=os.getenv("MOCK_VIDEO_FILE", "test-video.mp4"),
+                        help="Local video file (generated if missing)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds per config")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds ignored after first frame")
+    parser.add_argument("--startup-timeout", type=float, default=120.0,
+                        help="Max seconds to wait for the first frame (model download/load)")
+    parser.add_argument("--sink", choices=["null", "file"], default="null", help="Stream sink")
+    parser.add_argument("--configs", help="JSON list of {name, env} configurations")
+    parser.add_argument("--only", nargs="*", help="Run only these configuration names")
+    parser.add_argument("--output", default="benchmark_results.json", help="Result JSON path")
+    parser.add_argument("--replay", help="Recording (RECORD_PATH output) to replay instead of the video")
+    parser.add_argument("--replay-speed", default="1", help="Replay speed: 1, N (times faster) or max")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
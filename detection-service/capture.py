@@ -0,0 +1,193 @@
+"""
+Camera Capture Module for S-Pavilion Detection Service
+
+Low-latency V4L2 capture backend. The driver queue is limited with
+CAP_PROP_BUFFERSIZE and a grab thread drains it continuously, keeping only
+the newest decoded frame, so the detection loop never works on frames that
+sat in the driver queue while it was busy. Each frame carries the driver
+(V4L2 buffer) timestamp, which is what glass-to-detection latency is measured
+from.
+"""
+
+import logging
+import threading
+import time
+from typing import Optional, Tuple
+
+import cv2
+
+import metrics
+from frame_pool import FramePool, PooledFrame
+
+
+logger = logging.getLogger(__name__)
+
+# Driver timestamps further than this from the host clock are treated as
+# coming from a different clock (e.g. CLOCK_REALTIME or a device clock)
+MAX_TIMESTAMP_SKEW = 1.0
+
+
+class LowLatencyCapture:
+    """
+    cv2.VideoCapture wrapper that always serves the newest frame.
+
+    read_pooled() blocks until a frame newer than the previously returned one is
+    available. Frames the consumer was too slow to pick up are dropped (and
+    counted as "stale") instead of queueing up.
+    """
+
+    def __init__(self, index: int, width: int = 0, height: int = 0, fps: float = 15,
+                 fourcc: str = "YUYV", buffer_size: int = 1, pool_size: int = 4,
+                 pool_name: str = "frame_pool"):
+        """
+        Initialize the capture settings.
+
+        Args:
+            index: V4L2 camera index
+            width: Requested frame width (0 keeps the driver default)
+            height: Requested frame height (0 keeps the driver default)
+            fps: Requested frame rate
+            fourcc: Requested pixel format (e.g. YUYV, MJPG)
+            buffer_size: Number of driver buffers (CAP_PROP_BUFFERSIZE)
+            pool_size: Number of preallocated frame buffers
+            pool_name: Metrics name of the frame pool
+        """
+        self.index = index
+        self.requested_width = width
+        self.requested_height = height
+        self.requested_fps = fps
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.pool_size = pool_size
+        self.pool_name = pool_name
+
+        self.capture: Optional[cv2.VideoCapture] = None
+        self.pool: Optional[FramePool] = None
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+
+        self._cond = threading.Condition()
+        self._latest: Optional[PooledFrame] = None
+        self._running = False
+        self._failed = False
+        self._thread: Optional[threading.Thread] = None
+        self._driver_clock: Optional[bool] = None  # None until the first frame decides it
+
+    def open(self) -> bool:
+        """Open the device, apply the capture settings and start the grab thread"""
+        self.capture = cv2.VideoCapture(self.index, cv2.CAP_V4L2)
+        if not self.capture.isOpened():
+            return False
+
+        # Format and size must be set before the driver buffers are allocated
+        self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.requested_width > 0 and self.requested_height > 0:
+            self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.requested_width)
+            self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.requested_height)
+        self.capture.set(cv2.CAP_PROP_FPS, self.requested_fps)
+        if not self.capture.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size):
+            logger.warning("Camera backend ignored CAP_PROP_BUFFERSIZE; frames may be queued by the driver")
+
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+        self.pool = FramePool((self.height, self.width, 3), self.pool_size, name=self.pool_name)
+
+        self._running = True
+        self._failed = False
+        self._thread = threading.Thread(target=self._grab_loop, name="camera-grab", daemon=True)
+        self._thread.start()
+
+        logger.info(f"Low-latency capture: {self.width}x{self.height}@{self.fps}fps "
+                    f"{self.fourcc}, {int(self.capture.get(cv2.CAP_PROP_BUFFERSIZE))} driver buffer(s)")
+        return True
+
+    def _frame_timestamp(self, host_time: float) -> float:
+        """Driver timestamp of the last grabbed buffer on the time.monotonic() clock"""
+        if self._driver_clock is False:
+            return host_time
+
+        driver_time = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if self._driver_clock is None:
+            # V4L2 buffers are normally stamped with CLOCK_MONOTONIC; verify once
+            self._driver_clock = driver_time > 0 and abs(host_time - driver_time) < MAX_TIMESTAMP_SKEW
+            if self._driver_clock:
+                logger.info("Using V4L2 driver timestamps for frame capture time")
+            else:
+                logger.warning("Driver timestamps are not on the monotonic clock; using grab time instead")
+                return host_time
+        return driver_time
+
+    def _grab_loop(self):
+        failures = 0
+        stale = metrics.FRAMES_DROPPED.labels("stale")
+        try:
+            while self._running:
+                if not self.capture.grab():
+                    failures += 1
+                    if failures >= 10:
+                        logger.error("Camera stopped delivering frames")
+                        break
+                    time.sleep(0.01)
+                    continue
+                failures = 0
+                grab_time = time.monotonic()
+
+                ret, frame = self.pool.retrieve(self.capture)
+                if not ret:
+                    continue
+                frame.timestamp = self._frame_timestamp(grab_time)
+
+                with self._cond:
+                    if self._latest is not None:
+                        # The consumer never picked this one up; newer data wins
+                        self._latest.release()
+                        stale.inc()
+                    self._latest = frame
+                    self._cond.notify_all()
+        except Exception as e:
+            logger.error(f"Error in camera grab loop: {e}", exc_info=True)
+        finally:
+            with self._cond:
+                self._failed = self._running
+                self._cond.notify_all()
+
+    def read_pooled(self, timeout: float = 2.0) -> Tuple[bool, Optional[PooledFrame]]:
+        """
+        Take the newest frame, waiting for one if it has already been consumed.
+
+        Returns:
+            (ret, PooledFrame or None). The caller owns the returned reference.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._latest is not None or self._failed or not self._running,
+                                       timeout):
+                return False, None
+            frame, self._latest = self._latest, None
+        if frame is None:
+            return False, None
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self.capture is not None and self.capture.isOpened() and not self._failed
+
+    def get(self, prop_id: int) -> float:
+        return self.capture.get(prop_id) if self.capture is not None else 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        return self.capture.set(prop_id, value) if self.capture is not None else False
+
+    def release(self):
+        """Stop the grab thread and close the device"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+        with self._cond:
+            if self._latest is not None:
+                self._latest.release()
+                self._latest = None
+        if self.capture is not None:
+            self.capture.release()
@@ -0,0 +1,262 @@
+"""
+Control Module for S-Pavilion Detection Service
+
+Local HTTP control API for a running service, so runtime parameters, the
+model and the stream can be changed without a restart (which costs the camera
+and model initialization). Requests are validated on the server thread and
+queued; the frame loop applies them between frames, so a change never lands
+halfway through a frame and the loop needs no extra locking.
+
+Endpoints (JSON in, JSON out), bound to 127.0.0.1 by default:
+- GET  /status            current settings and counters
+- POST /config            {"post_interval": 10}
+- POST /model             {"weights": "yolov8s.pt", "compile": "fuse"}; loads in
+                          the background and swaps in once warmed up
+- POST /stream/reconnect  close and reopen the stream writer(s)
+- POST /shutdown          stop the loop and drain queues, same as SIGTERM
+
+Command line:
+    python control.py status
+    python control.py config post_interval=10
+    python control.py model yolov8s.pt
+    python control.py reconnect | shutdown
+"""
+
+import json
+import logging
+import os
+import queue
+import signal
+import sys
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+# Runtime-settable parameters and their minimum values
+CONFIG_FIELDS = {"post_interval": 1}
+
+# How long a request waits for the frame loop to apply it before answering 202
+APPLY_TIMEOUT = 5.0
+
+
+class Command:
+    """A queued control request; the loop answers it through `result`"""
+
+    def __init__(self, name: str, args: Optional[dict] = None):
+        self.name = name
+        self.args = args or {}
+        self.result: Future = Future()
+
+    def __repr__(self):
+        return f"Command({self.name}, {self.args})"
+
+
+class ControlServer:
+    """Queue of control commands fed by a localhost HTTP API and SIGTERM"""
+
+    def __init__(self, port: int, addr: str = "127.0.0.1", status: Optional[Callable[[], dict]] = None):
+        """
+        Initialize the server.
+
+        Args:
+            port: TCP port (0 or negative disables the HTTP API; SIGTERM handling still works)
+            addr: Bind address
+            status: Callable returning the /status document
+        """
+        self.port = port
+        self.addr = addr
+        self.status = status or (lambda: {})
+        self.shutdown_requested = threading.Event()
+        # Set once the frame loop runs; before that SIGTERM exits immediately
+        self.draining = False
+
+        self._commands: "queue.Queue[Command]" = queue.Queue()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def start(self) -> bool:
+        """Serve the HTTP API on a background daemon thread"""
+        if self.port <= 0:
+            return False
+
+        handler = type("ControlHandler", (_ControlHandler,), {"control": self})
+        try:
+            self._server = metrics.ReusePortHTTPServer((self.addr, self.port), handler)
+        except OSError as e:
+            logger.error(f"Failed to start control API on {self.addr}:{self.port}: {e}")
+            return False
+
+        self._server.daemon_threads = True
+        thread = threading.Thread(target=self._server.serve_forever, name="control-http", daemon=True)
+        thread.start()
+        logger.info(f"Control API listening on http://{self.addr}:{self.port}")
+        return True
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        # Nobody will apply what is still queued
+        for command in self.pending():
+            command.result.set_exception(RuntimeError("service is shutting down"))
+
+    def install_signal_handler(self):
+        """
+        Turn SIGTERM into a graceful shutdown once the frame loop runs (see
+        start_draining); before that, and on a second SIGTERM, exit immediately
+        so a missing camera or a slow model load cannot hold up `docker stop`.
+        """
+        def _handler(signum, _frame):
+            if not self.draining or self.shutdown_requested.is_set():
+                raise SystemExit(128 + signum)
+            logger.info("SIGTERM received, draining and shutting down...")
+            self.request_shutdown()
+
+        signal.signal(signal.SIGTERM, _handler)
+
+    def start_draining(self):
+        """Called when the frame loop starts: from now on SIGTERM stops it at a frame boundary"""
+        self.draining = True
+
+    def request_shutdown(self):
+        self.shutdown_requested.set()
+
+    def submit(self, name: str, args: Optional[dict] = None) -> Future:
+        """Queue a command for the frame loop; used by the HTTP API and background loaders"""
+        command = Command(name, args)
+        self._commands.put(command)
+        return command.result
+
+    def pending(self) -> List[Command]:
+        """Take every queued command (called by the loop at a frame boundary)"""
+        commands = []
+        while True:
+            try:
+                commands.append(self._commands.get_nowait())
+            except queue.Empty:
+                return commands
+
+
+def apply(command: Command, handler: Callable[[Command], dict]):
+    """Run handler(command) and answer the request with its result or error"""
+    try:
+        command.result.set_result(handler(command))
+    except Exception as e:
+        logger.error(f"Control command {command.name} failed: {e}")
+        command.result.set_exception(e)
+
+
+class _ControlHandler(BaseHTTPRequestHandler):
+    control: ControlServer
+
+    def _reply(self, code: int, document: dict):
+        body = json.dumps(document).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        document = json.loads(self.rfile.read(length))
+        if not isinstance(document, dict):
+            raise ValueError("request body must be a JSON object")
+        return document
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/status":
+            self.send_error(404)
+            return
+        self._reply(200, self.control.status())
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        try:
+            body = self._read_json()
+            if path == "/config":
+                name, args = "config", _validate_config(body)
+            elif path == "/model":
+                if not isinstance(body.get("weights"), str) or not body["weights"]:
+                    raise ValueError("'weights' is required")
+                name, args = "model", {"weights": body["weights"], "compile": body.get("compile")}
+            elif path == "/stream/reconnect":
+                name, args = "reconnect_stream", {}
+            elif path == "/shutdown":
+                self.control.request_shutdown()
+                self._reply(202, {"status": "shutting down"})
+                return
+            else:
+                self.send_error(404)
+                return
+        except ValueError as e:
+            self._reply(400, {"error": str(e)})
+            return
+
+        result = self.control.submit(name, args)
+        try:
+            self._reply(200, result.result(timeout=APPLY_TIMEOUT))
+        except FutureTimeout:
+            self._reply(202, {"status": "queued"})
+        except Exception as e:
+            self._reply(409, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        logger.info(f"Control request from {self.client_address[0]}: {format % args}")
+
+
+def _validate_config(body: dict) -> dict:
+    unknown = set(body) - set(CONFIG_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown setting(s): {', '.join(sorted(unknown))}")
+    if not body:
+        raise ValueError(f"expected at least one of: {', '.join(CONFIG_FIELDS)}")
+    for key, minimum in CONFIG_FIELDS.items():
+        if key in body and (isinstance(body[key], bool) or not isinstance(body[key], int) or body[key] < minimum):
+            raise ValueError(f"'{key}' must be an integer >= {minimum}")
+    return body
+
+
+if __name__ == "__main__":
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    usage = ("Usage: python control.py status | config key=value ... | model <weights> [compile] "
+             "| reconnect | shutdown")
+    if len(sys.argv) < 2:
+        print(usage)
+        sys.exit(1)
+
+    base = f"http://127.0.0.1:{os.getenv('CONTROL_PORT', '9109')}"
+    action, params = sys.argv[1], sys.argv[2:]
+    if action == "status":
+        request = Request(f"{base}/status")
+    elif action == "config" and params:
+        settings = dict(param.split("=", 1) for param in params)
+        request = Request(f"{base}/config", json.dumps({k: int(v) for k, v in settings.items()}).encode())
+    elif action == "model" and params:
+        document = {"weights": params[0], "compile": params[1] if len(params) > 1 else None}
+        request = Request(f"{base}/model", json.dumps(document).encode())
+    elif action == "reconnect":
+        request = Request(f"{base}/stream/reconnect", b"{}")
+    elif action == "shutdown":
+        request = Request(f"{base}/shutdown", b"{}")
+    else:
+        print(usage)
+        sys.exit(1)
+
+    request.add_header("Content-Type", "application/json")
+    try:
+        with urlopen(request, timeout=APPLY_TIMEOUT + 5) as response:
+            print(response.read().decode())
+    except HTTPError as e:
+        print(f"{e.code}: {e.read().decode()}")
+        sys.exit(1)
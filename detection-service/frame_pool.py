@@ -0,0 +1,151 @@
+"""
+Frame Buffer Pool Module for S-Pavilion Detection Service
+
+Preallocated, reference-counted frame buffers for the capture path.
+camera.read(image=buf) decodes straight into a pooled array, so a 1080p
+stream at 30 fps no longer allocates (and frees) a 6 MB array per frame.
+Stages that keep a frame beyond the current loop iteration (queues, pre-roll
+buffers) call retain() and release() it when done; the buffer goes back to the
+pool when its reference count drops to zero.
+"""
+
+import logging
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class PooledFrame:
+    """A frame array borrowed from a FramePool"""
+
+    __slots__ = ("array", "timestamp", "_pool", "_refs", "_lock")
+
+    def __init__(self, array: np.ndarray, pool: Optional["FramePool"]):
+        self.array = array
+        self.timestamp = 0.0  # capture time on the time.monotonic() clock
+        self._pool = pool
+        self._refs = 0
+        self._lock = threading.Lock()
+
+    def retain(self) -> "PooledFrame":
+        """Take an extra reference for another pipeline stage"""
+        with self._lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        """Drop a reference; the last release returns the buffer to its pool"""
+        with self._lock:
+            self._refs -= 1
+            refs = self._refs
+        if refs == 0 and self._pool is not None:
+            self._pool._return(self)
+        elif refs < 0:
+            logger.error("PooledFrame released more times than retained")
+
+    @property
+    def refs(self) -> int:
+        return self._refs
+
+
+class FramePool:
+    """Fixed set of preallocated frame arrays of one shape"""
+
+    def __init__(self, shape: Tuple[int, ...], size: int = 4, dtype=np.uint8, name: str = "frame_pool"):
+        """
+        Initialize the pool.
+
+        Args:
+            shape: Frame shape, e.g. (height, width, 3)
+            size: Number of buffers to preallocate
+            dtype: Frame element type
+            name: Metrics name (exported as queue="<name>_free")
+        """
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.size = size
+        self._lock = threading.Lock()
+        self._free: List[PooledFrame] = [PooledFrame(np.empty(self.shape, dtype), self) for _ in range(size)]
+        self._allocated = size
+
+        metrics.QUEUE_DEPTH.labels(f"{name}_free").set_function(lambda: len(self._free))
+        logger.info(f"Frame pool: {size} x {self.shape} ({size * np.prod(self.shape) / 2**20:.1f} MiB)")
+
+    def acquire(self) -> PooledFrame:
+        """Borrow a buffer (reference count 1). Grows the pool if all buffers are in use."""
+        with self._lock:
+            frame = self._free.pop() if self._free else None
+            if frame is None:
+                self._allocated += 1
+                allocated = self._allocated
+        if frame is None:
+            # Every buffer is held by some stage; allocate rather than block the capture loop
+            metrics.FRAME_POOL_ALLOCATIONS.inc()
+            if allocated > self.size * 4:
+                logger.warning(f"Frame pool grew to {allocated} buffers; a stage may be leaking references")
+            frame = PooledFrame(np.empty(self.shape, self.dtype), self)
+        frame._refs = 1
+        return frame
+
+    def _return(self, frame: PooledFrame):
+        if frame.array.shape != self.shape:
+            # Stale buffer from before a resize; let it be garbage collected
+            return
+        with self._lock:
+            self._free.append(frame)
+
+    def reserve(self, count: int):
+        """Preallocate extra buffers for a stage that holds frames long-term (e.g. a pre-roll ring)"""
+        if count <= 0:
+            return
+        with self._lock:
+            self.size += count
+            self._allocated += count
+            self._free.extend(PooledFrame(np.empty(self.shape, self.dtype), self) for _ in range(count))
+
+    def resize(self, shape: Tuple[int, ...]):
+        """Reallocate for a new frame shape (e.g. after a camera reconnect)"""
+        shape = tuple(shape)
+        if shape == self.shape:
+            return
+        with self._lock:
+            self.shape = shape
+            self._free = [PooledFrame(np.empty(shape, self.dtype), self) for _ in range(self.size)]
+            self._allocated = self.size
+        logger.info(f"Frame pool resized to {shape}")
+
+    def read(self, capture) -> Tuple[bool, Optional[PooledFrame]]:
+        """
+        Read the next frame from a cv2.VideoCapture-like source into a pooled buffer.
+
+        Returns:
+            (ret, PooledFrame or None). The caller owns one reference.
+        """
+        return self._decode_into(capture.read)
+
+    def retrieve(self, capture) -> Tuple[bool, Optional[PooledFrame]]:
+        """Like read(), but decodes the frame from the last capture.grab()"""
+        return self._decode_into(capture.retrieve)
+
+    def _decode_into(self, decode) -> Tuple[bool, Optional[PooledFrame]]:
+        frame = self.acquire()
+        ret, image = decode(image=frame.array)
+        if not ret or image is None:
+            frame.release()
+            return False, None
+
+        if image is not frame.array:
+            # The source produced a different shape; adopt it and resize the pool
+            frame.release()
+            self.resize(image.shape)
+            frame = PooledFrame(image, None)
+            frame._refs = 1
+        frame.timestamp = time.monotonic()
+        return True, frame
@@ -1,66 +1,242 @@
 #!/usr/bin/env python3
 """
 Hot reload script for detection service
-Monitors main.py for changes and restarts the service
+Monitors the service modules for changes and restarts main.py
+
+Restarts use a warm standby: the new process starts next to the old one, and
+the old one is only stopped (SIGTERM, graceful drain) once the new one reports
+ready through READY_FILE (first frame streamed), so saving a file does not
+leave a gap in the stream. Sources only one process can open (a V4L2 camera)
+cannot be handed over, so for them the old process is stopped first
+(HOT_RELOAD_HANDOVER=auto; true/false forces either). Bursts of file events
+are debounced into one restart, and changes made during a restart trigger
+exactly one more.
 """
 
+import hashlib
+import json
 import os
 import sys
+import tempfile
+import threading
 import time
 import subprocess
 import signal
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+# Scripts in the service directory that main.py does not import
+IGNORED_FILES = {'hot_reload.py', 'benchmark.py', 'test_gpu.py'}
+DEBOUNCE_SECONDS = float(os.getenv('HOT_RELOAD_DEBOUNCE', '0.5'))
+# Stop the old process anyway if the new one is not ready by then (e.g. a
+# V4L2 camera that only one process can open)
+READY_TIMEOUT = float(os.getenv('HOT_RELOAD_READY_TIMEOUT', '60'))
+STOP_TIMEOUT = 15
+HANDOVER = os.getenv('HOT_RELOAD_HANDOVER', 'auto')  # auto, true or false
+
+
+def uses_exclusive_camera():
+    """Whether main.py, with the current environment, opens a camera device"""
+    if os.getenv('REPLAY_FILE'):
+        return False
+    sources = os.getenv('SOURCES', '')
+    if sources:
+        try:
+            if os.path.isfile(sources):
+                with open(sources) as f:
+                    entries = json.load(f)
+            else:
+                entries = json.loads(sources)
+            return any(isinstance(entry, dict) and 'camera' in entry for entry in entries)
+        except (OSError, ValueError, TypeError):
+            # main.py will report the bad setting; assume the safe restart order
+            return True
+    return os.getenv('MOCK_MODE', 'true') != 'true'
+
+
 class PythonFileHandler(FileSystemEventHandler):
     def __init__(self, script_path):
         self.script_path = script_path
         self.process = None
+        self._ready_dir = tempfile.mkdtemp(prefix="hot-reload-")
+        self._generation = 0
+        self._hashes = {}
+
+        self._lock = threading.Lock()
+        self._timer = None
+        self._restarting = False
+        self._pending = False
+        self._stopping = False
+        # Process started by a restart that is not self.process yet
+        self._starting = None
+
+        self._changed_modules()
         self.start_process()
-    
+
+    def _is_watched(self, path):
+        name = os.path.basename(path)
+        return name.endswith('.py') and name not in IGNORED_FILES and '__pycache__' not in path
+
+    def _changed_modules(self):
+        """Modules whose content differs from the last check (touch/save-without-edit is ignored)"""
+        changed = []
+        for name in sorted(os.listdir('.')):
+            if not self._is_watched(name):
+                continue
+            try:
+                with open(name, 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+            except OSError:
+                continue
+            if self._hashes.get(name) != digest:
+                self._hashes[name] = digest
+                changed.append(name)
+        return changed
+
+    def _spawn(self):
+        self._generation += 1
+        ready_file = os.path.join(self._ready_dir, f"ready-{self._generation}")
+        env = dict(os.environ, READY_FILE=ready_file)
+        return subprocess.Popen([sys.executable, self.script_path], env=env), ready_file
+
     def start_process(self):
         """Start the main.py process"""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
-        
-        print(f"Starting {self.script_path}...")
-        self.process = subprocess.Popen([sys.executable, self.script_path])
-    
-    def on_modified(self, event):
-        """Handle file modification events"""
-        if event.is_directory:
+        with self._lock:
+            if self._stopping:
+                return
+            print(f"Starting {self.script_path}...")
+            self.process, _ = self._spawn()
+
+    def restart_process(self):
+        """Start a new main.py, wait until it streams, then stop the old one"""
+        old = self.process
+        if old is None or old.poll() is not None:
+            # Nothing running to hand over from
+            self.start_process()
             return
-        
-        # Only restart if main.py is modified
-        if event.src_path.endswith('main.py'):
-            print(f"File {event.src_path} modified. Restarting...")
+
+        handover = HANDOVER == 'true' or (HANDOVER == 'auto' and not uses_exclusive_camera())
+        if not handover:
+            # The new process could not open the camera while the old one holds it
+            print(f"Stopping process {old.pid} before restarting (exclusive camera)...")
+            self._stop_process(old)
             self.start_process()
-    
+            return
+
+        with self._lock:
+            if self._stopping:
+                return
+            print(f"Starting new {self.script_path} next to process {old.pid}...")
+            new, ready_file = self._spawn()
+            self._starting = new
+        deadline = time.monotonic() + READY_TIMEOUT
+        while (not os.path.exists(ready_file) and new.poll() is None and time.monotonic() < deadline
+               and not self._stopping):
+            time.sleep(0.1)
+
+        try:
+            with self._lock:
+                self._starting = None
+                if self._stopping:
+                    # stop() has already stopped the old process; do not leave the new one behind
+                    stop_new = True
+                elif os.path.exists(ready_file):
+                    print(f"Process {new.pid} is streaming. Stopping old process {old.pid}...")
+                    stop_new = False
+                elif new.poll() is not None:
+                    print(f"Error: new process exited with code {new.returncode} before it was ready. "
+                          f"Keeping process {old.pid}")
+                    return
+                else:
+                    print(f"Process {new.pid} not ready after {READY_TIMEOUT:.0f}s. "
+                          f"Stopping old process {old.pid} anyway...")
+                    stop_new = False
+                if not stop_new:
+                    self.process = new
+            self._stop_process(new if stop_new else old)
+        finally:
+            try:
+                os.remove(ready_file)
+            except OSError:
+                pass
+
+    def _stop_process(self, process):
+        """SIGTERM (main.py drains and exits at a frame boundary), then kill"""
+        if process.poll() is not None:
+            return
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            print(f"Process {process.pid} did not stop within {STOP_TIMEOUT}s, killing...")
+            process.kill()
+            process.wait()
+
+    def on_any_event(self, event):
+        """Debounce modifications of service modules into one restart"""
+        if event.is_directory or event.event_type not in ('modified', 'created', 'moved'):
+            return
+        # Editors often save by writing a temp file and renaming it over the module
+        path = getattr(event, 'dest_path', '') or event.src_path
+        if not self._is_watched(path):
+            return
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(DEBOUNCE_SECONDS, self._reload)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _reload(self):
+        changed = self._changed_modules()
+        if not changed:
+            return
+
+        with self._lock:
+            if self._restarting:
+                self._pending = True
+                return
+            self._restarting = True
+
+        while True:
+            print(f"Modified: {', '.join(changed)}. Restarting...")
+            self.restart_process()
+            with self._lock:
+                if not self._pending:
+                    self._restarting = False
+                    return
+                self._pending = False
+            changed = self._changed_modules() or changed
+
     def stop(self):
-        """Stop the process"""
-        if self.process:
-            self.process.terminate()
-            self.process.wait()
+        """Stop the process, and any process a restart in progress has started"""
+        with self._lock:
+            self._stopping = True
+            if self._timer is not None:
+                self._timer.cancel()
+            processes = [p for p in (self._starting, self.process) if p is not None]
+        for process in processes:
+            self._stop_process(process)
 
 def main():
     script_path = "main.py"
-    
+
     if not os.path.exists(script_path):
         print(f"Error: {script_path} not found!")
         sys.exit(1)
-    
+
     print("Starting hot reload for detection service...")
     print("Press Ctrl+C to stop")
-    
+
     # Create event handler
     event_handler = PythonFileHandler(script_path)
-    
+
     # Create observer
     observer = Observer()
     observer.schedule(event_handler, path='.', recursive=False)
     observer.start()
-    
+
     try:
         while True:
             time.sleep(1)
@@ -68,7 +244,7 @@ def main():
         print("\nStopping hot reload...")
         observer.stop()
         event_handler.stop()
-    
+
     observer.join()
     print("Hot reload stopped.")
 
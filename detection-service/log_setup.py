@@ -0,0 +1,162 @@
+"""
+Logging Setup Module for S-Pavilion Detection Service
+
+Configures stdlib logging for the frame loop:
+- Records are handed to a QueueHandler; formatting and stdout I/O happen on a
+  QueueListener thread, so a slow or blocked stdout never costs frames.
+- A rate-limit filter deduplicates repeated messages: each distinct message
+  may be logged `burst` times per `interval` seconds, further repeats are
+  counted and summarized on the next one that gets through.
+- LOG_FORMAT=json emits one JSON object per line for log shippers; the default
+  text format is the existing "LEVEL:logger:message" style prefixed with a
+  timestamp.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+import metrics
+
+
+# Attributes every LogRecord has; anything else was passed via extra= and is emitted in JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, thread, msg, extra fields, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Let each distinct message through at most `burst` times per `interval`.
+
+    Messages are keyed by logger, level and message template (record.msg), so
+    lazily formatted calls like logger.error("Upload failed: %s", e) with
+    changing arguments still count as repeats.
+    """
+
+    def __init__(self, interval: float = 10.0, burst: int = 5):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self._lock = threading.Lock()
+        # key -> [window start, records in window, suppressed]
+        self._windows: Dict[Tuple[str, int, str], list] = {}
+        self._suppressed = metrics.LOG_RECORDS_DROPPED.labels("rate_limited")
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0:
+            return True
+
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000:
+                    # Bound memory when messages are not templated
+                    self._windows = {k: w for k, w in self._windows.items() if now - w[0] < self.interval}
+            elif window[1] < self.burst:
+                window[1] += 1
+                suppressed = 0
+            else:
+                window[2] += 1
+                self._suppressed.inc()
+                return False
+
+        if suppressed:
+            record.suppressed = suppressed
+            record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+        return True
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._dropped = metrics.LOG_RECORDS_DROPPED.labels("queue_full")
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._dropped.inc()
+
+
+def setup_logging(level: str = "INFO", fmt: str = "text", rate_limit_interval: float = 10.0,
+                  rate_limit_burst: int = 5, queue_size: int = 10000) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a queue to a stdout writer thread.
+
+    Args:
+        level: Root log level name
+        fmt: 'text' or 'json'
+        rate_limit_interval: Dedup window in seconds (0 disables rate limiting)
+        rate_limit_burst: Identical messages allowed per window
+        queue_size: Records buffered for the writer thread before dropping
+
+    Returns:
+        The running QueueListener (stopped automatically at exit)
+    """
+    global _listener
+
+    if fmt == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s %(levelname)s:%(name)s:%(message)s")
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(rate_limit_interval, rate_limit_burst))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper(), logging.INFO))
+
+    if _listener is not None:
+        _listener.stop()
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,39 +1,103 @@
+import time
+PROCESS_START = time.perf_counter()  # reference point for time-to-first-frame
+
+import logging
 import shutil
 import sys
+import threading
 import traceback
 import cv2
-import numpy as np
-import time
 import os
-import requests
 import subprocess
 from datetime import datetime
-# Conditional imports for detection
-if os.getenv('USE_DETECTION', 'false').lower() == 'true':
-    from ultralytics import YOLO
-    import torch
-
-# GStreamer imports (PyGObject)
-try:
-    import gi
-    gi.require_version('Gst', '1.0')
-    from gi.repository import Gst, GLib
-    Gst.init(None)
-    GST_AVAILABLE = True
-except (ImportError, ValueError) as e:
-    print(f"Warning: PyGObject/GStreamer not available: {e}")
-    GST_AVAILABLE = False
+
+import bbox_codec
+import control
+import metrics
+import model_cache
+import multi_source
+from capture import LowLatencyCapture
+from mock_source import CachedVideoSource
+from recording import Recorder, ReplaySource, parse_speed
+from snapshots import SnapshotService
+from frame_pool import FramePool
+import profiler
+import log_setup
+
+logger = logging.getLogger(__name__)
+
+# Heavy imports are deferred until they are needed:
+# - ultralytics/torch in check_gpu_availability() and load_yolo_model()
+# - requests in send_bbox_to_api()
+# - PyGObject/GStreamer in load_gstreamer(); Gst.init() scans the plugin
+#   registry, which takes seconds on a cold container
+gi = None
+Gst = None
+GLib = None
+GST_AVAILABLE = None  # unknown until load_gstreamer() has run
+_gst_lock = threading.Lock()
 
 # Extract variables for backward compatibility
 MOCK_MODE = os.getenv('MOCK_MODE', 'true')
 MOCK_VIDEO_FILE = os.getenv('MOCK_VIDEO_FILE', 'test-video.mp4')
+MOCK_FRAME_CACHE = os.getenv('MOCK_FRAME_CACHE', 'off')  # off, ram or mmap (pre-decoded replay)
+MOCK_FRAME_CACHE_DIR = os.getenv('MOCK_FRAME_CACHE_DIR', '.frame_cache')
+MOCK_FRAME_CACHE_MAX_MB = int(os.getenv('MOCK_FRAME_CACHE_MAX_MB', '2048'))  # larger clips use mmap
+RECORD_PATH = os.getenv('RECORD_PATH', '')  # record frames, timestamps and detections to this file
+RECORD_CODEC = os.getenv('RECORD_CODEC', 'jpeg')  # jpeg or raw
+RECORD_JPEG_QUALITY = int(os.getenv('RECORD_JPEG_QUALITY', '90'))
+REPLAY_FILE = os.getenv('REPLAY_FILE', '')  # replay a recording instead of the camera/mock video
+REPLAY_SPEED = os.getenv('REPLAY_SPEED', '1')  # 1, N (times faster) or max
+REPLAY_LOOP = os.getenv('REPLAY_LOOP', 'false')
+SNAPSHOTS = os.getenv('SNAPSHOTS', 'false')  # save snapshots/clips when detections trigger
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+SNAPSHOT_TRIGGER = os.getenv('SNAPSHOT_TRIGGER', 'both')  # count, increase or both
+SNAPSHOT_MIN_PERSONS = int(os.getenv('SNAPSHOT_MIN_PERSONS', '3'))
+SNAPSHOT_COOLDOWN = float(os.getenv('SNAPSHOT_COOLDOWN', '10'))  # seconds between events
+SNAPSHOT_PRE_ROLL = float(os.getenv('SNAPSHOT_PRE_ROLL', '2'))  # seconds; 0 disables clips
+SNAPSHOT_POST_ROLL = float(os.getenv('SNAPSHOT_POST_ROLL', '3'))
+SNAPSHOT_QUOTA_MB = int(os.getenv('SNAPSHOT_QUOTA_MB', '1024'))
 API_URL = os.getenv('API_URL', 'http://localhost:3000')
 RTSP_URL = os.getenv('RTSP_URL', 'rtsp://localhost:8554/camera')
+STREAM_SINK = os.getenv('STREAM_SINK', 'rtsp')  # rtsp, file or null (benchmarks)
+STREAM_SINK_FILE = os.getenv('STREAM_SINK_FILE', 'stream.ts')
 CAMERA_INDEX = int(os.getenv('CAMERA_INDEX', '0'))
+CAPTURE_MODE = os.getenv('CAPTURE_MODE', 'low_latency')  # low_latency or default (plain camera.read)
+CAMERA_WIDTH = int(os.getenv('CAMERA_WIDTH', '0'))  # 0 keeps the driver default
+CAMERA_HEIGHT = int(os.getenv('CAMERA_HEIGHT', '0'))
+CAMERA_FPS = int(os.getenv('CAMERA_FPS', '15'))
+CAMERA_FOURCC = os.getenv('CAMERA_FOURCC', 'YUYV')
+CAMERA_BUFFER_SIZE = int(os.getenv('CAMERA_BUFFER_SIZE', '1'))  # V4L2 driver buffers
+SOURCES = os.getenv('SOURCES', '')  # JSON list (or file) of sources; enables multi-source mode
+DETECTION_BATCH_SIZE = int(os.getenv('DETECTION_BATCH_SIZE', '4'))  # max frames per inference call
+DETECTION_BATCH_WAIT_MS = float(os.getenv('DETECTION_BATCH_WAIT_MS', '5'))
 CELL_SIZE = int(os.getenv('CELL_SIZE', '32'))
 POST_INTERVAL = int(os.getenv('POST_INTERVAL', '30'))
+BBOX_WIRE_FORMAT = os.getenv('BBOX_WIRE_FORMAT', 'json')  # json or binary (see bbox_codec.py)
+BBOX_WIRE_COMPRESSION = os.getenv('BBOX_WIRE_COMPRESSION', 'gzip')  # gzip, zstd or none (binary format only)
 USE_GSTREAMER = os.getenv('USE_GSTREAMER', 'false')
 USE_DETECTION = os.getenv('USE_DETECTION', 'false')
+FAST_START = os.getenv('FAST_START', 'false')  # stream first, attach detection when the model is ready
+MODEL_WEIGHTS = os.getenv('MODEL_WEIGHTS', 'yolov8n.pt')
+MODEL_COMPILE = os.getenv('MODEL_COMPILE', 'fuse')  # none, fuse or torchscript
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', '.model_cache')
+MODEL_IMGSZ = int(os.getenv('MODEL_IMGSZ', '640'))
+MODEL_WARMUP_ITERS = int(os.getenv('MODEL_WARMUP_ITERS', '2'))
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+CONTROL_PORT = int(os.getenv('CONTROL_PORT', '9109'))  # local control API; 0 disables
+CONTROL_ADDR = os.getenv('CONTROL_ADDR', '127.0.0.1')
+READY_FILE = os.getenv('READY_FILE', '')  # written once the first frame is streamed (hot_reload.py)
+PROFILE_STAGES = os.getenv('PROFILE_STAGES', 'false')
+PROFILE_RING_SIZE = int(os.getenv('PROFILE_RING_SIZE', '4096'))
+PROFILE_DUMP_DIR = os.getenv('PROFILE_DUMP_DIR', '.')
+FRAME_POOL_SIZE = int(os.getenv('FRAME_POOL_SIZE', '4'))  # preallocated capture buffers
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')  # text or json
+LOG_RATE_LIMIT_INTERVAL = float(os.getenv('LOG_RATE_LIMIT_INTERVAL', '10'))  # 0 disables deduplication
+LOG_RATE_LIMIT_BURST = int(os.getenv('LOG_RATE_LIMIT_BURST', '5'))
+
+# Frame sources that deliver PooledFrames themselves through read_pooled()
+POOLED_SOURCES = (LowLatencyCapture, CachedVideoSource, ReplaySource)
 
 # Global variables
 model = None
@@ -42,16 +106,39 @@ frame_count = 0
 camera_width = 640
 camera_height = 480
 video_fps = 29.97  # Default FPS for mock video
+model_ready = threading.Event()  # set once the model can serve perform_detection()
+_model_swap_lock = threading.Lock()  # one background model load (initial or swap) at a time
+
+
+def load_gstreamer():
+    """Import and initialize PyGObject/GStreamer on first use. Returns availability."""
+    global gi, Gst, GLib, GST_AVAILABLE
+
+    with _gst_lock:
+        if GST_AVAILABLE is None:
+            try:
+                import gi as _gi
+                _gi.require_version('Gst', '1.0')
+                from gi.repository import Gst as _Gst, GLib as _GLib
+                _Gst.init(None)
+                gi, Gst, GLib = _gi, _Gst, _GLib
+                GST_AVAILABLE = True
+            except (ImportError, ValueError) as e:
+                logger.warning(f"PyGObject/GStreamer not available: {e}")
+                GST_AVAILABLE = False
+    return GST_AVAILABLE
 
 
 class GStreamerWriter:
     """GStreamer-based RTSP writer using PyGObject"""
 
-    def __init__(self, rtsp_url, width, height, fps):
-        if not GST_AVAILABLE:
+    def __init__(self, rtsp_url, width, height, fps, sink='rtsp', sink_file=None):
+        if not load_gstreamer():
             raise RuntimeError("PyGObject/GStreamer is not available")
 
         self.rtsp_url = rtsp_url
+        self.sink = sink
+        self.sink_file = sink_file or STREAM_SINK_FILE
         self.width = width
         self.height = height
         self.fps = fps
@@ -64,6 +151,13 @@ class GStreamerWriter:
         try:
             # Create pipeline string
             # appsrc -> videoconvert -> x264enc -> rtph264pay -> rtspclientsink
+            if self.sink == 'null':
+                sink_str = "fakesink sync=false"
+            elif self.sink == 'file':
+                sink_str = f"mpegtsmux ! filesink location={self.sink_file}"
+            else:
+                sink_str = f"rtph264pay config-interval=1 pt=96 ! rtspclientsink location={self.rtsp_url} protocols=tcp"
+
             pipeline_str = (
                 f"appsrc name=source is-live=true format=time "
                 f"caps=video/x-raw,format=BGR,width={self.width},height={self.height},framerate={int(self.fps)}/1 ! "
@@ -71,11 +165,10 @@ class GStreamerWriter:
                 f"video/x-raw,format=I420 ! "
                 f"x264enc tune=zerolatency bitrate=2000 speed-preset=superfast key-int-max=60 ! "
                 f"video/x-h264,profile=baseline ! "
-                f"rtph264pay config-interval=1 pt=96 ! "
-                f"rtspclientsink location={self.rtsp_url} protocols=tcp"
+                f"{sink_str}"
             )
 
-            print(f"Creating GStreamer pipeline: {pipeline_str}")
+            logger.info(f"Creating GStreamer pipeline: {pipeline_str}")
 
             # Parse and create pipeline
             self.pipeline = Gst.parse_launch(pipeline_str)
@@ -102,29 +195,29 @@ class GStreamerWriter:
                 raise RuntimeError("Failed to set pipeline to PLAYING state")
 
             self.is_playing = True
-            print("GStreamer pipeline started successfully")
+            logger.info("GStreamer pipeline started successfully")
             return True
 
         except Exception as e:
-            print(f"Error starting GStreamer pipeline: {e}")
+            logger.error(f"Error starting GStreamer pipeline: {e}")
             self.cleanup()
             return False
 
     def _on_error(self, bus, message):
         """Handle error messages from GStreamer"""
         err, debug = message.parse_error()
-        print(f"GStreamer Error: {err}")
-        print(f"Debug info: {debug}")
+        logger.error(f"GStreamer Error: {err}")
+        logger.info(f"Debug info: {debug}")
         self.is_playing = False
 
     def _on_warning(self, bus, message):
         """Handle warning messages from GStreamer"""
         warn, debug = message.parse_warning()
-        print(f"GStreamer Warning: {warn}")
+        logger.warning(f"GStreamer Warning: {warn}")
 
     def _on_eos(self, bus, message):
         """Handle end-of-stream"""
-        print("GStreamer: End of stream")
+        logger.info("GStreamer: End of stream")
         self.is_playing = False
 
     def write_frame(self, frame):
@@ -141,13 +234,13 @@ class GStreamerWriter:
             ret = self.appsrc.emit("push-buffer", buf)
 
             if ret != Gst.FlowReturn.OK:
-                print(f"Error pushing buffer: {ret}")
+                logger.error("Error pushing buffer: %s", ret)
                 return False
 
             return True
 
         except Exception as e:
-            print(f"Error writing frame: {e}")
+            logger.error("Error writing frame: %s", e)
             return False
 
     def cleanup(self):
@@ -162,90 +255,115 @@ class GStreamerWriter:
             self.pipeline = None
             self.appsrc = None
             self.is_playing = False
-            print("GStreamer pipeline cleaned up")
+            logger.info("GStreamer pipeline cleaned up")
 
 
-def check_gpu_availability():
+def check_gpu_availability(emit=None):
     """Check GPU and CUDA availability when detection is enabled"""
+    emit = emit or logger.info
     if USE_DETECTION == 'true':
-        print("\n" + "=" * 60)
-        print("GPU AND CUDA AVAILABILITY CHECK")
-        print("=" * 60)
+        emit("\n" + "=" * 60)
+        emit("GPU AND CUDA AVAILABILITY CHECK")
+        emit("=" * 60)
         
         try:
+            import torch
+
             # Check if PyTorch is available
-            print(f"PyTorch version: {torch.__version__}")
+            emit(f"PyTorch version: {torch.__version__}")
             
             # Check CUDA availability
             cuda_available = torch.cuda.is_available()
-            print(f"CUDA available: {cuda_available}")
+            emit(f"CUDA available: {cuda_available}")
             
             if cuda_available:
-                print(f"CUDA version: {torch.version.cuda}")
-                print(f"Number of GPUs: {torch.cuda.device_count()}")
+                emit(f"CUDA version: {torch.version.cuda}")
+                emit(f"Number of GPUs: {torch.cuda.device_count()}")
                 
                 for i in range(torch.cuda.device_count()):
                     gpu_name = torch.cuda.get_device_name(i)
                     gpu_memory = torch.cuda.get_device_properties(i).total_memory / (1024**3)  # GB
-                    print(f"  GPU {i}: {gpu_name} ({gpu_memory:.1f} GB)")
+                    emit(f"  GPU {i}: {gpu_name} ({gpu_memory:.1f} GB)")
                 
                 # Set device
                 device = torch.device('cuda' if cuda_available else 'cpu')
-                print(f"Using device: {device}")
+                emit(f"Using device: {device}")
             else:
-                print("CUDA not available - will use CPU for inference")
-                print("Make sure NVIDIA drivers and CUDA toolkit are installed")
+                emit("CUDA not available - will use CPU for inference")
+                emit("Make sure NVIDIA drivers and CUDA toolkit are installed")
                 
         except Exception as e:
-            print(f"Error checking GPU availability: {e}")
-            print("PyTorch or CUDA may not be properly installed")
+            emit(f"Error checking GPU availability: {e}")
+            emit("PyTorch or CUDA may not be properly installed")
         
-        print("=" * 60)
+        emit("=" * 60)
     else:
-        print("\nGPU detection skipped (USE_DETECTION=false)")
+        emit("\nGPU detection skipped (USE_DETECTION=false)")
 
 
 def print_environment_variables():
-    """Print all environment variables at startup"""
-    print("=" * 60)
-    print("ENVIRONMENT VARIABLES")
-    print("=" * 60)
-
-    print(f"MOCK_MODE: {MOCK_MODE}")
-    print(f"MOCK_VIDEO_FILE: {MOCK_VIDEO_FILE}")
-    print(f"API_URL: {API_URL}")
-    print(f"RTSP_URL: {RTSP_URL}")
-    print(f"CAMERA_INDEX: {CAMERA_INDEX}")
-    print(f"CELL_SIZE: {CELL_SIZE}")
-    print(f"POST_INTERVAL: {POST_INTERVAL}")
-    print(f"USE_GSTREAMER: {USE_GSTREAMER}")
-    print(f"USE_DETECTION: {USE_DETECTION}")
-    print("=" * 60)
-
-
-def check_dependencies():
-    """Check if GStreamer and FFmpeg are installed and print version info"""
-    print("\n" + "=" * 60)
-    print("DEPENDENCY CHECK")
-    print("=" * 60)
+    """Log all environment variables at startup"""
+    logger.info("=" * 60)
+    logger.info("ENVIRONMENT VARIABLES")
+    logger.info("=" * 60)
+
+    logger.info(f"MOCK_MODE: {MOCK_MODE}")
+    logger.info(f"MOCK_VIDEO_FILE: {MOCK_VIDEO_FILE}")
+    logger.info(f"MOCK_FRAME_CACHE: {MOCK_FRAME_CACHE}")
+    if REPLAY_FILE:
+        logger.info(f"REPLAY_FILE: {REPLAY_FILE} (speed={REPLAY_SPEED}, loop={REPLAY_LOOP})")
+    if RECORD_PATH:
+        logger.info(f"RECORD_PATH: {RECORD_PATH} ({RECORD_CODEC})")
+    logger.info(f"SNAPSHOTS: {SNAPSHOTS}" + (f" ({SNAPSHOT_TRIGGER}, min {SNAPSHOT_MIN_PERSONS} persons, "
+                                       f"quota {SNAPSHOT_QUOTA_MB}MB -> {SNAPSHOT_DIR})" if SNAPSHOTS == 'true' else ""))
+    logger.info(f"API_URL: {API_URL}")
+    logger.info(f"RTSP_URL: {RTSP_URL}")
+    logger.info(f"STREAM_SINK: {STREAM_SINK}")
+    logger.info(f"CAMERA_INDEX: {CAMERA_INDEX}")
+    logger.info(f"SOURCES: {SOURCES or '(single camera)'}")
+    if SOURCES:
+        logger.info(f"DETECTION_BATCH_SIZE: {DETECTION_BATCH_SIZE} (wait {DETECTION_BATCH_WAIT_MS}ms)")
+    logger.info(f"CAPTURE_MODE: {CAPTURE_MODE} ({CAMERA_FOURCC} {CAMERA_WIDTH}x{CAMERA_HEIGHT}@{CAMERA_FPS}, "
+          f"buffers={CAMERA_BUFFER_SIZE})")
+    logger.info(f"CELL_SIZE: {CELL_SIZE}")
+    logger.info(f"POST_INTERVAL: {POST_INTERVAL}")
+    logger.info(f"BBOX_WIRE_FORMAT: {BBOX_WIRE_FORMAT}"
+                + (f" ({BBOX_WIRE_COMPRESSION})" if BBOX_WIRE_FORMAT == 'binary' else ""))
+    logger.info(f"USE_GSTREAMER: {USE_GSTREAMER}")
+    logger.info(f"USE_DETECTION: {USE_DETECTION}")
+    logger.info(f"FAST_START: {FAST_START}")
+    logger.info(f"MODEL_WEIGHTS: {MODEL_WEIGHTS} (compile={MODEL_COMPILE}, warmup={MODEL_WARMUP_ITERS})")
+    logger.info(f"METRICS_PORT: {METRICS_PORT}")
+    logger.info(f"CONTROL_PORT: {CONTROL_PORT} ({CONTROL_ADDR})")
+    logger.info(f"PROFILE_STAGES: {PROFILE_STAGES}")
+    logger.info(f"LOG_LEVEL: {LOG_LEVEL} ({LOG_FORMAT}, rate limit {LOG_RATE_LIMIT_BURST}/{LOG_RATE_LIMIT_INTERVAL}s)")
+    logger.info("=" * 60)
+
+
+def check_dependencies(emit=None):
+    """Check if GStreamer and FFmpeg are installed and log version info"""
+    emit = emit or logger.info
+    emit("\n" + "=" * 60)
+    emit("DEPENDENCY CHECK")
+    emit("=" * 60)
 
     # Check PyGObject/GStreamer
-    if GST_AVAILABLE:
-        print("PyGObject (GStreamer Python bindings): Installed")
+    if load_gstreamer():
+        emit("PyGObject (GStreamer Python bindings): Installed")
         try:
-            print(f"  GStreamer version: {Gst.version_string()}")
-            print(f"  PyGObject version: {gi.__version__}")
+            emit(f"  GStreamer version: {Gst.version_string()}")
+            emit(f"  PyGObject version: {gi.__version__}")
         except Exception as e:
-            print(f"  Version info error: {e}")
+            emit(f"  Version info error: {e}")
     else:
-        print("PyGObject (GStreamer Python bindings): NOT INSTALLED")
-        print("  Warning: GStreamer via PyGObject will not be available")
+        emit("PyGObject (GStreamer Python bindings): NOT INSTALLED")
+        emit("  Warning: GStreamer via PyGObject will not be available")
 
     # Check GStreamer CLI (for reference)
     gst_path = shutil.which('gst-launch-1.0')
     if gst_path:
-        print("GStreamer (gst-launch-1.0): \u2713 Installed")
-        print(f"  Path: {gst_path}")
+        emit("GStreamer (gst-launch-1.0): \u2713 Installed")
+        emit(f"  Path: {gst_path}")
         try:
             result = subprocess.run(
                 ['gst-launch-1.0', '--version'],
@@ -256,18 +374,18 @@ def check_dependencies():
             if result.returncode == 0:
                 # Extract version from output (first line usually contains version)
                 version_line = result.stdout.split('\n')[0]
-                print(f"  {version_line}")
+                emit(f"  {version_line}")
         except Exception as e:
-            print(f"  Version check failed: {e}")
+            emit(f"  Version check failed: {e}")
     else:
-        print("GStreamer (gst-launch-1.0): \u2717 NOT INSTALLED")
-        print("  Warning: RTSP streaming via GStreamer will not be available")
+        emit("GStreamer (gst-launch-1.0): \u2717 NOT INSTALLED")
+        emit("  Warning: RTSP streaming via GStreamer will not be available")
 
     # Check FFmpeg
     ffmpeg_path = shutil.which('ffmpeg')
     if ffmpeg_path:
-        print("\nFFmpeg: \u2713 Installed")
-        print(f"  Path: {ffmpeg_path}")
+        emit("\nFFmpeg: \u2713 Installed")
+        emit(f"  Path: {ffmpeg_path}")
         try:
             result = subprocess.run(
                 ['ffmpeg', '-version'],
@@ -278,70 +396,141 @@ def check_dependencies():
             if result.returncode == 0:
                 # Extract version from output (first line usually contains version)
                 version_line = result.stdout.split('\n')[0]
-                print(f"  {version_line}")
+                emit(f"  {version_line}")
         except Exception as e:
-            print(f"  Version check failed: {e}")
+            emit(f"  Version check failed: {e}")
     else:
-        print("\nFFmpeg: \u2717 NOT INSTALLED")
-        print("  Warning: RTSP streaming via FFmpeg will not be available")
+        emit("\nFFmpeg: \u2717 NOT INSTALLED")
+        emit("  Warning: RTSP streaming via FFmpeg will not be available")
 
-    print("=" * 60)
+    emit("=" * 60)
 
     # Determine streaming availability
     if USE_GSTREAMER == 'true':
         if GST_AVAILABLE:
-            print("\nStreaming will use: GStreamer (PyGObject)")
+            emit("\nStreaming will use: GStreamer (PyGObject)")
         else:
-            print("\nWARNING: USE_GSTREAMER is set to 'true' but PyGObject is not available!")
-            print("Please install PyGObject/GStreamer or set USE_GSTREAMER to 'false' to use FFmpeg.")
+            emit("\nWARNING: USE_GSTREAMER is set to 'true' but PyGObject is not available!")
+            emit("Please install PyGObject/GStreamer or set USE_GSTREAMER to 'false' to use FFmpeg.")
     else:
         if ffmpeg_path:
-            print("\nStreaming will use: FFmpeg")
+            emit("\nStreaming will use: FFmpeg")
         else:
-            print("\nWARNING: USE_GSTREAMER is set to 'false' but FFmpeg is not installed!")
-            print("Please install FFmpeg or set USE_GSTREAMER to 'true' to use GStreamer.")
+            emit("\nWARNING: USE_GSTREAMER is set to 'false' but FFmpeg is not installed!")
+            emit("Please install FFmpeg or set USE_GSTREAMER to 'true' to use GStreamer.")
 
-    print()
+    emit("")
 
 
 def load_yolo_model():
     """Load YOLOv8n model for person detection"""
     if USE_DETECTION == 'true':
         global model
-        print("Loading YOLOv8n model...")
+        logger.info("Loading YOLOv8n model...")
         try:
-            # Load model
-            model = YOLO('yolov8n.pt')
-            
+            import torch
+
             # Check if CUDA is available and set device
-            if torch.cuda.is_available():
-                device = 'cuda'
-                print(f"YOLOv8n model loaded successfully on GPU")
-            else:
-                device = 'cpu'
-                print(f"YOLOv8n model loaded successfully on CPU")
-            
-            # Move model to device
-            model.to(device)
-            print(f"Model device: {device}")
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
+            # Load model (fused/compiled artifacts are reused from MODEL_CACHE_DIR)
+            model = model_cache.load_model(MODEL_WEIGHTS, device, MODEL_COMPILE, MODEL_CACHE_DIR, MODEL_IMGSZ)
+            logger.info(f"YOLOv8n model loaded successfully on {'GPU' if device == 'cuda' else 'CPU'}")
+            logger.info(f"Model device: {device}")
+
+            # Pay lazy initialization costs on dummy frames of the real camera shape
+            model_cache.warm_up(model, camera_width, camera_height, MODEL_WARMUP_ITERS)
             
             return True
         except Exception as e:
-            print(f"Error loading YOLOv8n model: {e}")
+            logger.error(f"Error loading YOLOv8n model: {e}")
             return False
     else:
-        print("YOLOv8n model not used (USE_DETECTION=false)")
+        logger.info("YOLOv8n model not used (USE_DETECTION=false)")
         return True
 
 
-def init_camera():
-    """Initialize camera with retry logic"""
+def run_startup_probes(wait=True):
+    """
+    Run the GPU and dependency checks concurrently. Each probe buffers its report
+    and logs it as one record, so the output does not interleave.
+    """
+    def _probe(check):
+        lines = []
+        check(emit=lines.append)
+        logger.info("\n".join(lines))
+
+    threads = [
+        threading.Thread(target=_probe, args=(check,), name=f"probe-{check.__name__}", daemon=True)
+        for check in (check_gpu_availability, check_dependencies)
+    ]
+    for t in threads:
+        t.start()
+    if wait:
+        for t in threads:
+            t.join()
+    return threads
+
+
+def start_model_loader():
+    """Load the YOLO model on a background thread and set model_ready when done"""
+    # Held until the first load is done, so a /model swap cannot finish first and be overwritten
+    _model_swap_lock.acquire()
+
+    def _load():
+        try:
+            if load_yolo_model():
+                model_ready.set()
+                metrics.STARTUP_SECONDS.labels("model_ready").set(time.perf_counter() - PROCESS_START)
+                logger.info(f"Detection attached {time.perf_counter() - PROCESS_START:.2f}s after start")
+            else:
+                logger.error("Failed to load YOLO model. Continuing without detection...")
+        finally:
+            _model_swap_lock.release()
+
+    thread = threading.Thread(target=_load, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def init_camera(stop=None):
+    """
+    Initialize camera with retry logic.
+
+    Retries until the camera opens; returns False instead if `stop` (a
+    threading.Event, e.g. the control server's shutdown_requested) is set.
+    """
     global camera, camera_width, camera_height, video_fps
 
     while True:
         try:
-            if MOCK_MODE == 'true':
-                print(f"Attempting to open mock video file: {MOCK_VIDEO_FILE}")
+            if REPLAY_FILE:
+                logger.info(f"Opening recording for replay: {REPLAY_FILE}")
+                camera = ReplaySource(REPLAY_FILE, parse_speed(REPLAY_SPEED), REPLAY_LOOP == 'true',
+                                      FRAME_POOL_SIZE)
+                if not camera.open():
+                    raise Exception("Failed to open recording")
+
+                camera_width = camera.width
+                camera_height = camera.height
+                video_fps = camera.fps
+                logger.info(f"Recording: {camera_width}x{camera_height}, {int(camera.get(cv2.CAP_PROP_FRAME_COUNT))} frames")
+                return True
+            elif MOCK_MODE == 'true' and MOCK_FRAME_CACHE in ('ram', 'mmap'):
+                logger.info(f"Loading mock video file into the {MOCK_FRAME_CACHE} frame cache: {MOCK_VIDEO_FILE}")
+                camera = CachedVideoSource(MOCK_VIDEO_FILE, MOCK_FRAME_CACHE, MOCK_FRAME_CACHE_DIR,
+                                           MOCK_FRAME_CACHE_MAX_MB, FRAME_POOL_SIZE)
+                if not camera.open():
+                    raise Exception("Failed to decode mock video file")
+
+                camera_width = camera.width
+                camera_height = camera.height
+                video_fps = camera.fps
+                logger.info(f"Video dimensions: {camera_width}x{camera_height}")
+                logger.info(f"Video FPS: {video_fps} ({camera.frame_count} cached frames)")
+                return True
+            elif MOCK_MODE == 'true':
+                logger.info(f"Attempting to open mock video file: {MOCK_VIDEO_FILE}")
                 video_file = MOCK_VIDEO_FILE
                 camera = cv2.VideoCapture(video_file, )
                 camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
@@ -351,23 +540,37 @@ def init_camera():
                 camera_height = int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
                 video_fps = camera.get(cv2.CAP_PROP_FPS)
                     
-                print(f"Video dimensions: {camera_width}x{camera_height}")
-                print(f"Video FPS: {video_fps}")
+                logger.info(f"Video dimensions: {camera_width}x{camera_height}")
+                logger.info(f"Video FPS: {video_fps}")
 
                 
                 
+                return True
+            elif CAPTURE_MODE == 'low_latency':
+                logger.info(f"Attempting to open camera at index {CAMERA_INDEX} (low-latency capture)...")
+                camera = LowLatencyCapture(CAMERA_INDEX, CAMERA_WIDTH, CAMERA_HEIGHT, CAMERA_FPS,
+                                           CAMERA_FOURCC, CAMERA_BUFFER_SIZE, FRAME_POOL_SIZE)
+                if not camera.open():
+                    raise Exception("Failed to open camera")
+
+                # No settle sleep: the grab thread delivers frames as soon as the driver has them
+                camera_width = camera.width
+                camera_height = camera.height
+                video_fps = camera.fps
+                logger.info(f"Camera opened successfully: {camera_width}x{camera_height}@{video_fps}fps")
                 return True
             else:
-                print(f"Attempting to open camera at index {CAMERA_INDEX}...")
+                logger.info(f"Attempting to open camera at index {CAMERA_INDEX}...")
                 camera = cv2.VideoCapture(CAMERA_INDEX, cv2.CAP_V4L2)
 
                 if not camera.isOpened():
                     raise Exception("Failed to open camera")
 
 
-                camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'YUYV'))
-                camera.set(cv2.CAP_PROP_FPS, 15)
-                time.sleep(2.0)
+                camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*CAMERA_FOURCC))
+                camera.set(cv2.CAP_PROP_FPS, CAMERA_FPS)
+                if FAST_START != 'true':
+                    time.sleep(2.0)
 
                 # Get actual camera dimensions and FPS (don't force specific resolution)
                 camera_width = int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -375,57 +578,73 @@ def init_camera():
                 video_fps = camera.get(cv2.CAP_PROP_FPS)
                 
                     
-                print(f"Camera opened successfully: {camera_width}x{camera_height}@{video_fps}fps")
+                logger.info(f"Camera opened successfully: {camera_width}x{camera_height}@{video_fps}fps")
                 
                 
                 
-                print(f"Camera capabilities:")
-                print(f"  - Max width: {int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))}")
-                print(f"  - Max height: {int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))}")
-                print(f"  - Current FPS: {camera.get(cv2.CAP_PROP_FPS)}")
+                logger.info("Camera capabilities:")
+                logger.info(f"  - Max width: {int(camera.get(cv2.CAP_PROP_FRAME_WIDTH))}")
+                logger.info(f"  - Max height: {int(camera.get(cv2.CAP_PROP_FRAME_HEIGHT))}")
+                logger.info(f"  - Current FPS: {camera.get(cv2.CAP_PROP_FPS)}")
                 
                 return True
 
         except Exception as e:
-            print(f"Error opening camera: {e}")
-            print("Retrying in 1 second...")
+            logger.error(f"Error opening camera: {e}")
+            logger.info("Retrying in 1 second...")
             if camera is not None:
                 camera.release()
                 camera = None
-            time.sleep(1)
+            if stop is None:
+                time.sleep(1)
+            elif stop.wait(1):
+                return False
+
 
+def read_frame(frame_pool):
+    """Read the next frame into a pooled buffer; returns (ret, PooledFrame or None)"""
+    if isinstance(camera, POOLED_SOURCES):
+        return camera.read_pooled()
+    return frame_pool.read(camera)
 
-def init_gstreamer_writer():
-    """Initialize GStreamer pipeline for RTSP streaming via PyGObject"""
-    global camera_width, camera_height, video_fps
 
-    if not GST_AVAILABLE:
-        print("PyGObject/GStreamer is not available. Cannot create GStreamer writer.")
+def init_gstreamer_writer(rtsp_url=None, width=None, height=None, fps=None, sink_file=None):
+    """Initialize GStreamer pipeline for RTSP streaming via PyGObject (defaults to the main camera)"""
+    rtsp_url = rtsp_url or RTSP_URL
+    width = width or camera_width
+    height = height or camera_height
+    fps = fps or video_fps
+
+    if not load_gstreamer():
+        logger.warning("PyGObject/GStreamer is not available. Cannot create GStreamer writer.")
         return None
 
     try:
-        writer = GStreamerWriter(RTSP_URL, camera_width, camera_height, video_fps)
+        writer = GStreamerWriter(rtsp_url, width, height, fps, STREAM_SINK, sink_file)
         if writer.start():
-            print(f"GStreamer (PyGObject) RTSP pipeline initialized: {RTSP_URL}")
-            print(f"  Resolution: {camera_width}x{camera_height}@{video_fps:.2f}fps")
+            logger.info(f"GStreamer (PyGObject) RTSP pipeline initialized: {rtsp_url}")
+            logger.info(f"  Resolution: {width}x{height}@{fps:.2f}fps")
             return writer
         else:
-            print("Failed to start GStreamer pipeline")
+            logger.error("Failed to start GStreamer pipeline")
             return None
 
     except Exception as e:
-        print(f"Error initializing GStreamer pipeline: {e}")
-        print("Tip: Ensure GStreamer and gst-plugins-good/bad/ugly are installed")
+        logger.error(f"Error initializing GStreamer pipeline: {e}")
+        logger.info("Tip: Ensure GStreamer and gst-plugins-good/bad/ugly are installed")
         return None
 
 
-def init_ffmpeg_writer():
-    """Initialize FFmpeg process for RTSP streaming"""
-    global camera_width, camera_height, video_fps
+def init_ffmpeg_writer(rtsp_url=None, width=None, height=None, fps=None, sink_file=None):
+    """Initialize FFmpeg process for RTSP streaming (defaults to the main camera)"""
+    rtsp_url = rtsp_url or RTSP_URL
+    width = width or camera_width
+    height = height or camera_height
+    fps = fps or video_fps
 
     # check if ffmpeg is installed
     if not shutil.which('ffmpeg'):
-        print("FFmpeg is not installed. Please install FFmpeg and try again.")
+        logger.info("FFmpeg is not installed. Please install FFmpeg and try again.")
         return None
 
     ffmpeg_cmd = [
@@ -435,8 +654,8 @@ def init_ffmpeg_writer():
         '-f', 'rawvideo',
         '-vcodec', 'rawvideo',
         '-pix_fmt', 'bgr24',
-        '-s', f'{camera_width}x{camera_height}',
-        '-r', f'{video_fps:.2f}',  # Use actual video FPS
+        '-s', f'{width}x{height}',
+        '-r', f'{fps:.2f}',  # Use actual video FPS
         '-fflags', '+genpts',  # Generate presentation timestamps
         '-i', '-',  # read from stdin
         # Video encoding settings
@@ -451,13 +670,22 @@ def init_ffmpeg_writer():
         '-pix_fmt', 'yuv420p',
         # Disable audio
         '-an',
-        # RTSP output settings
-        '-f', 'rtsp',
-        '-rtsp_transport', 'tcp',  # Use TCP for more reliable connection
-        '-timeout', '5000000',  # 5 second timeout in microseconds
-        RTSP_URL
     ]
 
+    if STREAM_SINK == 'null':
+        # Encode but discard the output (benchmarks)
+        ffmpeg_cmd += ['-f', 'null', '-']
+    elif STREAM_SINK == 'file':
+        ffmpeg_cmd += ['-f', 'mpegts', sink_file or STREAM_SINK_FILE]
+    else:
+        ffmpeg_cmd += [
+            # RTSP output settings
+            '-f', 'rtsp',
+            '-rtsp_transport', 'tcp',  # Use TCP for more reliable connection
+            '-timeout', '5000000',  # 5 second timeout in microseconds
+            rtsp_url
+        ]
+
     try:
         ffmpeg_process = subprocess.Popen(
             ffmpeg_cmd,
@@ -465,84 +693,309 @@ def init_ffmpeg_writer():
             stdout=subprocess.DEVNULL,
             stderr=subprocess.PIPE  # Capture stderr separately
         )
-        print(f"FFmpeg RTSP pipeline initialized: {RTSP_URL}")
-        print(f"  Resolution: {camera_width}x{camera_height}@{video_fps:.2f}fps")
-        print(f"  Transport: TCP")
-        print(f"  Command: {' '.join(ffmpeg_cmd)}")
+        logger.info(f"FFmpeg RTSP pipeline initialized: {rtsp_url}")
+        logger.info(f"  Resolution: {width}x{height}@{fps:.2f}fps")
+        logger.info("  Transport: TCP")
+        logger.info(f"  Command: {' '.join(ffmpeg_cmd)}")
         
-        # Give FFmpeg a moment to start and check if it's still running
-        time.sleep(1.0)  # Increased wait time for better stability
+        # Give FFmpeg a moment to start and check if it's still running.
+        # In fast-start mode the main loop's periodic poll() catches early exits instead.
+        if FAST_START != 'true':
+            time.sleep(1.0)  # Increased wait time for better stability
         if ffmpeg_process.poll() is not None:
             _, stderr = ffmpeg_process.communicate()
-            print(f"FFmpeg process failed to start. Exit code: {ffmpeg_process.returncode}")
+            logger.error(f"FFmpeg process failed to start. Exit code: {ffmpeg_process.returncode}")
             if stderr:
-                print(f"FFmpeg error output:")
-                print(stderr.decode())
+                logger.error("FFmpeg error output:\n%s", stderr.decode(errors="replace"))
             return None
             
         return ffmpeg_process
     except Exception as e:
-        print(f"Error initializing FFmpeg pipeline: {e}")
+        logger.error(f"Error initializing FFmpeg pipeline: {e}")
         return None
 
 
-def send_bbox_to_api(bboxes: list[dict]):
-    """Send bounding box data to NestJS backend API"""
+def open_source_writer(rtsp_url, width, height, fps, source_id):
+    """Open the stream writer of one source in multi-source mode"""
+    stem, ext = os.path.splitext(STREAM_SINK_FILE)
+    sink_file = f"{stem}_{source_id}{ext}"
+    if USE_GSTREAMER == 'true':
+        return init_gstreamer_writer(rtsp_url, width, height, fps, sink_file)
+    return init_ffmpeg_writer(rtsp_url, width, height, fps, sink_file)
+
+
+def open_stream_writer():
+    """Open the single-camera stream writer selected by USE_GSTREAMER"""
+    if USE_GSTREAMER == 'true':
+        return init_gstreamer_writer()
+    return init_ffmpeg_writer()
+
+
+def close_stream_writer(writer):
+    """Flush and close a stream writer (GStreamerWriter or FFmpeg process)"""
     try:
-        payload = {
-            'bboxes': bboxes,
-            'frame_count': int(frame_count),
-            'camera_id': f'camera_{CAMERA_INDEX}'
-        }
-
-        response = requests.post(
-            f"{API_URL}/api/bbox_history",
-            json=payload,
-            timeout=2
-        )
+        if USE_GSTREAMER == 'true':
+            # PyGObject GStreamer cleanup
+            writer.cleanup()
+        else:
+            # FFmpeg subprocess cleanup
+            writer.stdin.close()
+            writer.wait(timeout=5)  # Wait for graceful shutdown
+    except subprocess.TimeoutExpired:
+        logger.warning("Writer process did not terminate gracefully, forcing...")
+        writer.terminate()
+        writer.wait(timeout=2)
+    except Exception as e:
+        logger.error(f"Error during writer cleanup: {e}")
+
+
+def mark_ready():
+    """Signal readiness (first frame streamed) by writing READY_FILE, if set"""
+    if not READY_FILE:
+        return
+    try:
+        with open(READY_FILE, 'w') as f:
+            f.write(str(os.getpid()))
+    except OSError as e:
+        logger.error(f"Could not write READY_FILE {READY_FILE}: {e}")
+
+
+def control_status(**extra):
+    """Settings and counters reported by the control API's /status"""
+    status = {
+        'frame_count': frame_count,
+        'post_interval': POST_INTERVAL,
+        'detection': USE_DETECTION == 'true',
+        'model_ready': model_ready.is_set(),
+        'model_weights': MODEL_WEIGHTS,
+        'model_compile': MODEL_COMPILE,
+    }
+    status.update(extra)
+    return status
+
+
+def start_model_swap(weights, compile_mode, control_server):
+    """Load and warm up another model in the background; the loop swaps it in when ready"""
+    if USE_DETECTION != 'true':
+        raise ValueError("detection is disabled (USE_DETECTION=false)")
+    if not _model_swap_lock.acquire(blocking=False):
+        raise ValueError("a model load is already in progress")
+
+    def _load():
+        try:
+            import torch
+
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            new_model = model_cache.load_model(weights, device, compile_mode, MODEL_CACHE_DIR, MODEL_IMGSZ)
+            model_cache.warm_up(new_model, camera_width, camera_height, MODEL_WARMUP_ITERS)
+            control_server.submit("swap_model", {'model': new_model, 'weights': weights, 'compile': compile_mode})
+        except Exception as e:
+            logger.error(f"Failed to load model {weights}: {e}")
+        finally:
+            _model_swap_lock.release()
+
+    threading.Thread(target=_load, name="model-swap", daemon=True).start()
+
+
+def handle_control_command(command, control_server, workers=(), reconnect_writer=None):
+    """
+    Apply a control command between frames; returns the response document.
+
+    Multi-source mode passes its workers; single-source mode passes
+    reconnect_writer, which reopens the loop's stream writer.
+    """
+    global POST_INTERVAL, MODEL_WEIGHTS, MODEL_COMPILE, model
+
+    args = command.args
+    if command.name == "config":
+        POST_INTERVAL = args.get('post_interval', POST_INTERVAL)
+        for worker in workers:
+            worker.post_interval = POST_INTERVAL
+        logger.info(f"Config updated: POST_INTERVAL={POST_INTERVAL}")
+        return {'post_interval': POST_INTERVAL}
+
+    if command.name == "model":
+        compile_mode = args.get('compile') or MODEL_COMPILE
+        start_model_swap(args['weights'], compile_mode, control_server)
+        logger.info(f"Loading model {args['weights']} (compile={compile_mode}) in the background...")
+        return {'status': 'loading', 'weights': args['weights'], 'compile': compile_mode}
+
+    if command.name == "swap_model":
+        # The old model is dropped here; in-flight inference keeps its own reference
+        model = args['model']
+        MODEL_WEIGHTS, MODEL_COMPILE = args['weights'], args['compile']
+        model_ready.set()
+        logger.info(f"Model swapped to {MODEL_WEIGHTS} (compile={MODEL_COMPILE})")
+        return {'weights': MODEL_WEIGHTS, 'compile': MODEL_COMPILE}
+
+    if command.name == "reconnect_stream":
+        if reconnect_writer is not None:
+            return reconnect_writer()
+        for worker in workers:
+            worker.request_reconnect()
+        return {'status': 'reconnecting', 'sources': len(workers)}
+
+    raise ValueError(f"Unknown control command '{command.name}'")
+
+
+def run_multi_source(control_server):
+    """Run every configured source with one shared, batching inference engine"""
+    global camera_width, camera_height
+
+    try:
+        sources = multi_source.parse_sources(SOURCES, RTSP_URL)
+    except (ValueError, OSError) as e:
+        logger.error(f"Invalid SOURCES configuration: {e}")
+        return
+
+    engine = multi_source.InferenceEngine(perform_batch_detection, DETECTION_BATCH_SIZE,
+                                          DETECTION_BATCH_WAIT_MS / 1000.0, model_ready)
+    workers = [
+        multi_source.SourceWorker(config, engine, open_source_writer, draw_bboxes, send_bbox_to_api,
+                                  POST_INTERVAL, FRAME_POOL_SIZE, CAMERA_BUFFER_SIZE,
+                                  MOCK_FRAME_CACHE, MOCK_FRAME_CACHE_DIR)
+        for config in sources
+    ]
+    for worker in workers:
+        logger.info(f"Starting source {worker.config}")
+        worker.start()
+
+    try:
+        # Warm the model up on the first source's frame shape
+        workers[0].opened.wait(timeout=10)
+        if workers[0].width:
+            camera_width, camera_height = workers[0].width, workers[0].height
+
+        engine.start()
+        if USE_DETECTION == 'true':
+            if FAST_START == 'true':
+                start_model_loader()
+            elif load_yolo_model():
+                model_ready.set()
+            else:
+                logger.error("Failed to load YOLO model. Continuing without detection...")
+
+        control_server.status = lambda: control_status(
+            sources={w.config.id: {'frame_count': w.frame_count, 'streaming': w.writer is not None}
+                     for w in workers})
+
+        logger.info(f"Running {len(workers)} sources. Press Ctrl+C to stop")
+        logger.info("-" * 50)
+        control_server.start_draining()
+        last_report = time.monotonic()
+        ready = False
+        while any(worker.is_alive() for worker in workers):
+            if control_server.shutdown_requested.wait(0.2):
+                break
+            for command in control_server.pending():
+                control.apply(command, lambda c: handle_control_command(c, control_server, workers))
+            if not ready and all(w.frame_count for w in workers):
+                ready = True
+                mark_ready()
+            if time.monotonic() - last_report >= 10:
+                last_report = time.monotonic()
+                logger.info("Frames: " + ", ".join(f"{w.config.id}={w.frame_count}" for w in workers))
+
+    except KeyboardInterrupt:
+        logger.info("Stopping detection service...")
+    finally:
+        control_server.stop()
+        for worker in workers:
+            worker.stop()
+        engine.stop()
+        logger.info("Detection service stopped")
+
+
+def send_bbox_to_api(bboxes: list[dict], camera_id=None, frame_number=None):
+    """Send bounding box data to NestJS backend API (defaults to the main camera)"""
+    import requests
+
+    if frame_number is None:
+        frame_number = frame_count
+
+    camera_id = camera_id or f'camera_{CAMERA_INDEX}'
+    start = time.perf_counter()
+    try:
+        if BBOX_WIRE_FORMAT == 'binary':
+            # Compact columnar encoding, decoded by nest/src/bbox-history/bbox-codec.ts
+            body, headers = bbox_codec.encode_request(
+                camera_id, [(int(frame_number), time.time(), bboxes)], BBOX_WIRE_COMPRESSION)
+            response = requests.post(
+                f"{API_URL}/api/bbox_history/binary",
+                data=body,
+                headers=headers,
+                timeout=2
+            )
+        else:
+            payload = {
+                'bboxes': bboxes,
+                'frame_count': int(frame_number),
+                'camera_id': camera_id
+            }
+
+            response = requests.post(
+                f"{API_URL}/api/bbox_history",
+                json=payload,
+                timeout=2
+            )
+        metrics.API_UPLOAD_SECONDS.observe(time.perf_counter() - start)
 
         if response.status_code == 201:
-            print(f"Bbox data sent successfully (frame {frame_count})")
+            logger.debug("Bbox data sent successfully (%s frame %s)", camera_id, frame_number)
         else:
-            print(f"API response error: {response.status_code}")
+            metrics.API_UPLOAD_FAILURES.labels(f"http_{response.status_code}").inc()
+            logger.error("API response error: %s", response.status_code)
 
     except requests.exceptions.RequestException as e:
-        print(f"Error sending bbox data to API: {e}")
+        metrics.API_UPLOAD_SECONDS.observe(time.perf_counter() - start)
+        metrics.API_UPLOAD_FAILURES.labels("request_error").inc()
+        logger.error("Error sending bbox data to API: %s", e)
     except Exception as e:
-        print(f"Unexpected error in send_bbox_to_api: {e}")
+        metrics.API_UPLOAD_FAILURES.labels("unexpected").inc()
+        logger.error("Unexpected error in send_bbox_to_api: %s", e)
 
 
-def perform_detection(frame):
-    """Perform YOLOv8 person detection on frame"""
+def parse_detections(result):
+    """Extract person detections from one YOLO result"""
+    detections = []
+
+    boxes = result.boxes
+    for box in boxes:
+        # Filter for person class (class 0 in COCO dataset)
+        if int(box.cls[0]) == 0:
+            # Get box coordinates
+            x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
+            confidence = float(box.conf[0])
+
+            # Convert to [x, y, w, h] format
+            x = int(x1)
+            y = int(y1)
+            w = int(x2 - x1)
+            h = int(y2 - y1)
+
+            detections.append({
+                'bbox': [x, y, w, h],
+                'confidence': confidence
+            })
+
+    return detections
+
+
+def perform_batch_detection(frames):
+    """Perform YOLOv8 person detection on several frames in one inference call"""
     try:
-        results = model(frame, verbose=False)
-        detections = []
-
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Filter for person class (class 0 in COCO dataset)
-                if int(box.cls[0]) == 0:
-                    # Get box coordinates
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    confidence = float(box.conf[0])
-
-                    # Convert to [x, y, w, h] format
-                    x = int(x1)
-                    y = int(y1)
-                    w = int(x2 - x1)
-                    h = int(y2 - y1)
-
-                    detections.append({
-                        'bbox': [x, y, w, h],
-                        'confidence': confidence
-                    })
-
-        return detections
+        with metrics.INFERENCE_SECONDS.time():
+            results = model(frames, verbose=False)
+        return [parse_detections(result) for result in results]
 
     except Exception as e:
-        print(f"Error during detection: {e}")
-        return []
+        logger.error("Error during detection: %s", e)
+        return [[] for _ in frames]
+
+
+def perform_detection(frame):
+    """Perform YOLOv8 person detection on frame"""
+    return perform_batch_detection([frame])[0]
 
 
 def draw_bboxes(frame, detections):
@@ -565,111 +1018,222 @@ def draw_bboxes(frame, detections):
 
 def main():
     """Main detection loop"""
-    global frame_count, camera
+    global frame_count, camera, BBOX_WIRE_COMPRESSION
 
-    print("Starting S-Pavilion Detection Service")
+    log_setup.setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_RATE_LIMIT_INTERVAL, LOG_RATE_LIMIT_BURST)
+
+    logger.info("Starting S-Pavilion Detection Service")
     print_environment_variables()
 
-    # Check GPU availability (if detection is enabled)
-    check_gpu_availability()
+    if BBOX_WIRE_FORMAT not in ('json', 'binary'):
+        logger.error(f"Invalid BBOX_WIRE_FORMAT '{BBOX_WIRE_FORMAT}' (expected json or binary)")
+        return
+    try:
+        BBOX_WIRE_COMPRESSION = bbox_codec.resolve_encoding(BBOX_WIRE_COMPRESSION)
+    except ValueError as e:
+        logger.error(str(e))
+        return
+
+    # Expose metrics before the slow startup steps so they can be observed too
+    metrics.start_metrics_server(METRICS_PORT)
+    capture_rate = metrics.RateMeter(metrics.CAPTURE_FPS)
 
-    # Check dependencies (GStreamer, FFmpeg)
-    check_dependencies()
+    # Per-stage timing of the loop (no-op unless PROFILE_STAGES=true)
+    stage_profiler = profiler.create_profiler(PROFILE_STAGES == 'true', PROFILE_RING_SIZE, PROFILE_DUMP_DIR)
+    stage_profiler.install_signal_handler()
 
-    # Load YOLO model
-    if not load_yolo_model():
-        print("Failed to load YOLO model. Exiting...")
+    # SIGTERM and POST /shutdown end the loop at a frame boundary and drain the queues
+    # (SIGTERM before the loop starts exits immediately)
+    control_server = control.ControlServer(CONTROL_PORT, CONTROL_ADDR, status=control_status)
+    control_server.install_signal_handler()
+    control_server.start()
+
+    # Probes only report; in fast-start mode they run in the background
+    run_startup_probes(wait=FAST_START != 'true')
+
+    if SOURCES:
+        run_multi_source(control_server)
         return
 
-    # Initialize camera
-    if not init_camera():
-        print("Failed to initialize camera. Exiting...")
+    # Initialize camera (first, so the model is warmed up on the real frame shape)
+    if not init_camera(control_server.shutdown_requested):
+        logger.error("Failed to initialize camera. Exiting...")
+        control_server.stop()
         return
 
-    # Initialize streaming writer based on USE_GSTREAMER setting
-    if USE_GSTREAMER == 'true':
-        writer = init_gstreamer_writer()
-        writer_type = "GStreamer"
+    if FAST_START == 'true':
+        # Open the stream first; detection is attached once model_ready is set
+        if USE_DETECTION == 'true':
+            start_model_loader()
     else:
-        writer = init_ffmpeg_writer()
-        writer_type = "FFmpeg"
+        # Load YOLO model
+        if not load_yolo_model():
+            logger.error("Failed to load YOLO model. Exiting...")
+            control_server.stop()
+            return
+        model_ready.set()
+
+    # The frame cache and replay pace themselves and loop without seeking
+    self_paced = isinstance(camera, (CachedVideoSource, ReplaySource))
+
+    # Capture buffers are reused via camera.read(image=...) instead of a new array per frame
+    # (POOLED_SOURCES bring their own pool)
+    frame_pool = None
+    if not isinstance(camera, POOLED_SOURCES):
+        frame_pool = FramePool((camera_height, camera_width, 3), FRAME_POOL_SIZE)
+    pooled = None
+
+    recorder = None
+    if RECORD_PATH:
+        recorder = Recorder(RECORD_PATH, camera_width, camera_height, video_fps, RECORD_CODEC,
+                            RECORD_JPEG_QUALITY)
+        recorder.start()
+
+    # Snapshots are encoded on worker threads; the pre-roll ring holds pooled frames
+    snapshot_service = SnapshotService(SNAPSHOT_DIR, SNAPSHOTS == 'true', SNAPSHOT_TRIGGER, SNAPSHOT_MIN_PERSONS,
+                                       SNAPSHOT_COOLDOWN, SNAPSHOT_PRE_ROLL, SNAPSHOT_POST_ROLL, video_fps,
+                                       SNAPSHOT_QUOTA_MB)
+    (frame_pool or camera.pool).reserve(snapshot_service.held_frames)
+
+    # Initialize streaming writer based on USE_GSTREAMER setting
+    writer = open_stream_writer()
+    writer_type = "GStreamer" if USE_GSTREAMER == 'true' else "FFmpeg"
 
     if writer is None:
-        print(f"Warning: {writer_type} pipeline not available. Continuing without RTSP streaming...")
+        logger.warning(f"{writer_type} pipeline not available. Continuing without RTSP streaming...")
+    writer_label = writer_type.lower()
+
+    logger.info("Starting detection loop...")
+    logger.info("Press Ctrl+C to stop")
+    logger.info("-" * 50)
 
-    print("\nStarting detection loop...")
-    print("Press Ctrl+C to stop")
-    print("-" * 50)
+    control_server.status = lambda: control_status(stream=writer_type if writer is not None else None)
 
+    def reconnect_writer():
+        nonlocal writer
+        logger.info("Reconnecting stream writer (control request)...")
+        if writer is not None:
+            close_stream_writer(writer)
+        writer = open_stream_writer()
+        metrics.WRITER_RECONNECTS.labels(writer_label).inc()
+        return {'status': 'reconnected' if writer is not None else 'failed', 'stream': writer_type}
+
+    time_to_first_frame = None
+
+    # Until here SIGTERM exits at once; from now on it drains at a frame boundary
+    control_server.start_draining()
     try:
         first_frame = True
         while True:
-            # Read frame from camera
-            ret, frame = camera.read()
-
-            if first_frame:
-                cv2.imwrite(f"first_frame_{frame_count}.jpg", frame)
+            stage_profiler.begin_frame()
+
+            # Control commands and shutdown requests apply between frames
+            if control_server.shutdown_requested.is_set():
+                logger.info("Stopping detection service...")
+                break
+            for command in control_server.pending():
+                control.apply(command, lambda c: handle_control_command(c, control_server,
+                                                                        reconnect_writer=reconnect_writer))
+
+            # Hand the previous buffer back before reading into the next one
+            if pooled is not None:
+                pooled.release()
+                pooled = None
+
+            # Read frame from camera into a pooled buffer
+            ret, pooled = read_frame(frame_pool)
+            frame = pooled.array if ret else None
+            stage_profiler.mark("read")
+            if ret:
+                metrics.FRAME_AGE_SECONDS.observe(time.monotonic() - pooled.timestamp)
+
+            if first_frame and ret:
+                snapshot_service.save(pooled, f"first_frame_{frame_count}.jpg")
                 first_frame = False
                 continue
 
             if not ret:
+                if isinstance(camera, ReplaySource):
+                    logger.info("Replay finished")
+                    break
+                metrics.FRAMES_DROPPED.labels("read_failed").inc()
                 if MOCK_MODE == 'true':
                     # In mock mode, restart the video from the beginning
-                    print("Video ended. Restarting from the beginning...")
+                    logger.info("Video ended. Restarting from the beginning...")
                     
                     # Reset video to beginning (keep writer alive)
                     camera.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                    ret, frame = camera.read()
+                    ret, pooled = read_frame(frame_pool)
+                    frame = pooled.array if ret else None
                     
                     if not ret:
-                        print("Failed to restart video. Attempting to reconnect...")
+                        logger.error("Failed to restart video. Attempting to reconnect...")
                         camera.release()
                         time.sleep(1)
-                        init_camera()
+                        init_camera(control_server.shutdown_requested)
                         continue
                     else:
-                        print("Video restarted successfully")
+                        logger.info("Video restarted successfully")
                 else:
                     # In real camera mode, attempt to reconnect
-                    print("Failed to read frame from camera. Attempting to reconnect...")
+                    logger.error("Failed to read frame from camera. Attempting to reconnect...")
                     camera.release()
                     time.sleep(1)
-                    init_camera()
+                    init_camera(control_server.shutdown_requested)
                     continue
 
             frame_count += 1
+            metrics.FRAMES_CAPTURED.inc()
+            capture_rate.tick()
 
-            # Perform person detection (if enabled)
-            if USE_DETECTION == 'true':
+            # Perform person detection (if enabled and the model is loaded)
+            detections = None
+            if USE_DETECTION == 'true' and model_ready.is_set():
                 detections = perform_detection(frame)
+                stage_profiler.mark("detect")
+                metrics.GLASS_TO_DETECTION_SECONDS.observe(time.monotonic() - pooled.timestamp)
 
+            # Record the frame as captured (before bboxes are drawn) with its detections
+            if recorder is not None:
+                recorder.record(frame, pooled.timestamp, detections)
+
+            if detections is not None:
                 # Draw bounding boxes on frame
                 if detections:
                     frame = draw_bboxes(frame, detections)
+                stage_profiler.mark("draw")
 
                 # Send bbox data to API every POST_INTERVAL frames
                 if frame_count % POST_INTERVAL == 0 and detections:
                     bbox_list = [det['bbox'] for det in detections]
                     send_bbox_to_api(bbox_list)
+                stage_profiler.mark("post")
+
+            # Snapshot triggers see the annotated frame; encoding happens off-thread
+            snapshot_service.observe(pooled, detections)
 
             # Write frame to RTSP stream
             if writer is not None:
                 try:
                     # Check frame properties for debugging
                     if frame_count % 300 == 0:  # Every 10 seconds
-                        print(f"Frame info: shape={frame.shape}, dtype={frame.dtype}, size={frame.nbytes} bytes")
+                        logger.info(f"Frame info: shape={frame.shape}, dtype={frame.dtype}, size={frame.nbytes} bytes")
 
                     # Write frame based on writer type
+                    push_start = time.perf_counter()
                     if USE_GSTREAMER == 'true':
                         # PyGObject GStreamer writer
                         if not writer.write_frame(frame):
                             raise Exception("Failed to write frame to GStreamer pipeline")
                     else:
                         # FFmpeg subprocess writer
-                        writer.stdin.write(frame.tobytes())
+                        # Write the buffer directly; tobytes() would copy the whole frame
+                        writer.stdin.write(frame.data)
+                    metrics.STREAM_PUSH_SECONDS.labels(writer_label).observe(time.perf_counter() - push_start)
 
                 except BrokenPipeError:
-                    print(f"Error: RTSP stream pipe broken. Writer process may have terminated.")
+                    metrics.FRAMES_DROPPED.labels("write_error").inc()
+                    logger.error("RTSP stream pipe broken. Writer process may have terminated.")
                     # Clean up the broken writer and get error output
                     try:
                         if USE_GSTREAMER == 'true':
@@ -683,18 +1247,16 @@ def main():
                             try:
                                 _, stderr = writer.communicate(timeout=2)
                                 if stderr:
-                                    print(f"FFmpeg error output:")
-                                    print(stderr.decode())
+                                    logger.error("FFmpeg error output:\n%s", stderr.decode(errors="replace"))
                             except subprocess.TimeoutExpired:
                                 writer.kill()
                                 _, stderr = writer.communicate()
                                 if stderr:
-                                    print(f"FFmpeg error output (killed):")
-                                    print(stderr.decode())
+                                    logger.error("FFmpeg error output (killed):\n%s", stderr.decode(errors="replace"))
                     except Exception as e:
-                        print(f"Error during writer cleanup: {e}")
+                        logger.error(f"Error during writer cleanup: {e}")
                     writer = None
-                    print("Attempting to reconnect writer...")
+                    logger.info("Attempting to reconnect writer...")
 
                     # Wait before attempting to reconnect
                     time.sleep(2.0)  # Wait 2 seconds before reconnecting
@@ -706,98 +1268,108 @@ def main():
                     else:
                         writer = init_ffmpeg_writer()
                         writer_type = "FFmpeg"
+                    metrics.WRITER_RECONNECTS.labels(writer_label).inc()
 
                     if writer is not None:
-                        print(f"Writer reconnected successfully using {writer_type}")
+                        logger.info(f"Writer reconnected successfully using {writer_type}")
                     else:
-                        print(f"Failed to reconnect writer. Continuing without RTSP streaming...")
+                        logger.error("Failed to reconnect writer. Continuing without RTSP streaming...")
 
                 except Exception as e:
-                    print(f"Error writing to RTSP stream: {e}")
+                    metrics.FRAMES_DROPPED.labels("write_error").inc()
+                    logger.error("Error writing to RTSP stream: %s", e)
                     # Don't recreate writer, just log the error and continue
+            else:
+                metrics.FRAMES_DROPPED.labels("no_writer").inc()
+            stage_profiler.mark("write")
+
+            if time_to_first_frame is None:
+                time_to_first_frame = time.perf_counter() - PROCESS_START
+                metrics.STARTUP_SECONDS.labels("first_frame").set(time_to_first_frame)
+                mark_ready()
+                logger.info(f"Time to first frame: {time_to_first_frame:.3f}s "
+                      f"({writer_type if writer else 'no stream'})")
 
             # Check writer process status periodically
             if writer is not None and frame_count % 30 == 0:  # Check every second
                 # For GStreamer (PyGObject), check is_playing status
                 if USE_GSTREAMER == 'true':
                     if not writer.is_playing:
-                        print(f"GStreamer pipeline stopped unexpectedly")
+                        logger.warning("GStreamer pipeline stopped unexpectedly")
                         writer.cleanup()
                         writer = None
-                        print("Attempting to reconnect writer...")
+                        logger.info("Attempting to reconnect writer...")
 
                         writer = init_gstreamer_writer()
+                        metrics.WRITER_RECONNECTS.labels(writer_label).inc()
                         if writer is not None:
-                            print(f"Writer reconnected successfully using GStreamer (PyGObject)")
+                            logger.info("Writer reconnected successfully using GStreamer (PyGObject)")
                         else:
-                            print(f"Failed to reconnect writer. Continuing without RTSP streaming...")
+                            logger.error("Failed to reconnect writer. Continuing without RTSP streaming...")
                 else:
                     # For FFmpeg subprocess, check poll status
                     if writer.poll() is not None:  # Process has terminated
-                        print(f"Writer process terminated unexpectedly. Exit code: {writer.returncode}")
+                        logger.warning(f"Writer process terminated unexpectedly. Exit code: {writer.returncode}")
                         # Try to get any remaining error output
                         try:
                             _, stderr = writer.communicate(timeout=0.1)
                             if stderr:
-                                print(f"FFmpeg error output:")
-                                print(stderr.decode())
+                                logger.error("FFmpeg error output:\n%s", stderr.decode(errors="replace"))
                         except:
                             pass
                         writer = None
-                        print("Attempting to reconnect writer...")
+                        logger.info("Attempting to reconnect writer...")
 
                         writer = init_ffmpeg_writer()
+                        metrics.WRITER_RECONNECTS.labels(writer_label).inc()
                         if writer is not None:
-                            print(f"Writer reconnected successfully using FFmpeg")
+                            logger.info("Writer reconnected successfully using FFmpeg")
                         else:
-                            print(f"Failed to reconnect writer. Continuing without RTSP streaming...")
+                            logger.error("Failed to reconnect writer. Continuing without RTSP streaming...")
 
             # Display frame info
             if frame_count % (15*10) == 0:  # Print every second (assuming 30fps)
-                print(f"Frame {frame_count}: Streaming to {writer_type if writer else 'No stream'}")
+                logger.info(f"Frame {frame_count}: Streaming to {writer_type if writer else 'No stream'}")
                 
             # Check if we're near the end of video (for debugging)
-            if MOCK_MODE == 'true' and frame_count % (15*10) == 0:
+            if MOCK_MODE == 'true' and not self_paced and frame_count % (15*10) == 0:
                 total_frames = int(camera.get(cv2.CAP_PROP_FRAME_COUNT))
                 current_frame = int(camera.get(cv2.CAP_PROP_POS_FRAMES))
                 if total_frames > 0:
                     progress = (current_frame / total_frames) * 100
                     if progress > 90:  # Near end of video
-                        print(f"Video progress: {progress:.1f}% ({current_frame}/{total_frames} frames)")
+                        logger.info(f"Video progress: {progress:.1f}% ({current_frame}/{total_frames} frames)")
+
+            stage_profiler.mark("other")
 
             # Frame timing control
-            if MOCK_MODE == 'true':
+            if MOCK_MODE == 'true' and not self_paced:
                 # In mock mode, maintain video FPS timing
                 frame_delay = 1.0 / video_fps
                 time.sleep(frame_delay)
-            else:
-                # In real camera mode, small delay to prevent CPU overload
-                time.sleep(0.001)
+            # In real camera mode read() blocks until the driver has a new frame,
+            # so no extra delay is needed (it would only add latency)
+            stage_profiler.mark("sleep")
 
     except KeyboardInterrupt:
-        print("\n\nStopping detection service...")
+        logger.info("Stopping detection service...")
     except Exception as e:
-        print(f"\nUnexpected error in main loop: {e}")
+        logger.exception(f"Unexpected error in main loop: {e}")
     finally:
         # Cleanup
+        if stage_profiler.enabled:
+            stage_profiler.write_dump()
+        if pooled is not None:
+            pooled.release()
+        if recorder is not None:
+            recorder.close()
+        snapshot_service.close()
+        control_server.stop()
         if camera is not None:
             camera.release()
         if writer is not None:
-            try:
-                if USE_GSTREAMER == 'true':
-                    # PyGObject GStreamer cleanup
-                    writer.cleanup()
-                else:
-                    # FFmpeg subprocess cleanup
-                    writer.stdin.close()
-                    writer.wait(timeout=5)  # Wait for graceful shutdown
-            except subprocess.TimeoutExpired:
-                print("Warning: Writer process did not terminate gracefully, forcing...")
-                writer.terminate()
-                writer.wait(timeout=2)
-            except Exception as e:
-                print(f"Error during writer cleanup: {e}")
-        print("Detection service stopped")
+            close_stream_writer(writer)
+        logger.info("Detection service stopped")
 
 
 if __name__ == "__main__":
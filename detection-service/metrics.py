@@ -0,0 +1,388 @@
+"""
+Metrics Module for S-Pavilion Detection Service
+
+Lightweight Prometheus-compatible counters, gauges and histograms.
+Metrics are updated in-process with a single lock acquisition per update and
+exposed in the Prometheus text format by a small HTTP server running on a
+background daemon thread, so scraping never blocks the frame loop.
+"""
+
+import bisect
+import logging
+import os
+import resource
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, tuned for per-frame work at 15-60 fps
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.033, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    """Render a Prometheus label set, e.g. {queue="frames",le="0.1"}"""
+    pairs = [f'{k}="{v}"' for k, v in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for a metric family with optional labels"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        if registry is None:
+            registry = REGISTRY
+        registry.register(self)
+
+    def labels(self, *labelvalues) -> "_Metric":
+        """Return (and cache) the child metric for the given label values"""
+        key = tuple(str(v) for v in labelvalues)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._new_child()
+                    self._children[key] = child
+        return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self):
+        """Yield (suffix, labels, value) tuples for exposition"""
+        raise NotImplementedError
+
+    def collect(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        if self.labelnames:
+            for labelvalues, child in list(self._children.items()):
+                for suffix, extra, value in child._samples():
+                    labels = _format_labels(self.labelnames, labelvalues, extra)
+                    lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        else:
+            for suffix, extra, value in self._samples():
+                labels = _format_labels((), (), extra)
+                lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self._value = 0.0
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation, registry=_NULL_REGISTRY)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self):
+        yield "_total" if not self.name.endswith("_total") else "", "", self._value
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time"""
+
+    metric_type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional["Registry"] = None):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation, registry=_NULL_REGISTRY)
+
+    def set(self, value: float):
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the gauge value lazily on every scrape (e.g. queue.qsize)"""
+        self._function = function
+
+    @property
+    def value(self) -> float:
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception:
+                return float("nan")
+        return self._value
+
+    def _samples(self):
+        yield "", "", self.value
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed buckets"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Optional["Registry"] = None):
+        self._upper_bounds = tuple(sorted(float(b) for b in buckets))
+        self._counts = [0] * (len(self._upper_bounds) + 1)
+        self._sum = 0.0
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self._upper_bounds,
+                         registry=_NULL_REGISTRY)
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._upper_bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> "_HistogramTimer":
+        """Context manager observing the elapsed wall time of its block"""
+        return _HistogramTimer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    def _samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = 0
+        for bound, count in zip(self._upper_bounds, counts):
+            cumulative += count
+            yield "_bucket", f'le="{_format_value(bound)}"', cumulative
+        cumulative += counts[-1]
+        yield "_bucket", 'le="+Inf"', cumulative
+        yield "_sum", "", total
+        yield "_count", "", cumulative
+
+
+class _HistogramTimer:
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class RateMeter:
+    """
+    Frames-per-second style rate, recomputed once per window from tick() calls.
+    Writes its result into a Gauge so the hot path only increments an integer.
+    """
+
+    def __init__(self, gauge: Gauge, window: float = 1.0):
+        self.gauge = gauge
+        self.window = window
+        self._count = 0
+        self._window_start = time.perf_counter()
+
+    def tick(self, n: int = 1):
+        self._count += n
+        now = time.perf_counter()
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            self.gauge.set(self._count / elapsed)
+            self._count = 0
+            self._window_start = now
+
+
+class Registry:
+    """Collection of metric families rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        return "\n".join(m.collect() for m in metrics) + "\n"
+
+
+class _NullRegistry(Registry):
+    """Registry used for labelled children, which are rendered by their parent"""
+
+    def register(self, metric: _Metric):
+        pass
+
+
+REGISTRY = Registry()
+_NULL_REGISTRY = _NullRegistry()
+
+
+def get_process_rss_bytes() -> float:
+    """Current resident set size, falling back to peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            resident_pages = int(f.read().split()[1])
+        return float(resident_pages * os.sysconf("SC_PAGE_SIZE"))
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is KiB on Linux
+        return float(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)
+
+
+# =========================
+# Detection service metrics
+# =========================
+FRAMES_CAPTURED = Counter(
+    "detection_frames_captured_total", "Frames successfully read from the video source")
+CAPTURE_FPS = Gauge(
+    "detection_capture_fps", "Frames captured per second over the last window")
+FRAMES_DROPPED = Counter(
+    "detection_frames_dropped_total", "Frames that were not delivered to the stream", ["reason"])
+FRAME_AGE_SECONDS = Histogram(
+    "detection_frame_age_seconds", "Time from frame capture (driver timestamp) to the loop picking it up")
+GLASS_TO_DETECTION_SECONDS = Histogram(
+    "detection_glass_to_detection_seconds", "Time from frame capture (driver timestamp) to detection results")
+INFERENCE_SECONDS = Histogram(
+    "detection_inference_seconds", "YOLO inference latency per call (one frame, or one batch in multi-source mode)")
+INFERENCE_BATCH_SIZE = Histogram(
+    "detection_inference_batch_size", "Frames per batched inference call in multi-source mode",
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+SOURCE_FRAMES = Counter(
+    "detection_source_frames_total", "Frames read per source in multi-source mode", ["source"])
+STREAM_PUSH_SECONDS = Histogram(
+    "detection_stream_push_seconds", "Latency of handing a frame to the encoder/stream", ["writer"])
+QUEUE_DEPTH = Gauge(
+    "detection_queue_depth", "Current number of items waiting in internal queues", ["queue"])
+API_UPLOAD_SECONDS = Histogram(
+    "detection_api_upload_seconds", "Latency of bbox uploads to the backend API",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0))
+API_UPLOAD_FAILURES = Counter(
+    "detection_api_upload_failures_total", "Failed bbox uploads to the backend API", ["reason"])
+WRITER_RECONNECTS = Counter(
+    "detection_writer_reconnects_total", "Stream writer reconnect attempts", ["writer"])
+FRAME_POOL_ALLOCATIONS = Counter(
+    "detection_frame_pool_allocations_total", "Frame buffers allocated because the pool was exhausted")
+SNAPSHOT_EVENTS = Counter(
+    "detection_snapshot_events_total", "Detection events that triggered a snapshot")
+SNAPSHOTS_WRITTEN = Counter(
+    "detection_snapshots_written_total", "Snapshot files written", ["kind"])
+SNAPSHOTS_ROTATED = Counter(
+    "detection_snapshots_rotated_total", "Snapshot files deleted to stay under the disk quota")
+SNAPSHOT_ENCODE_SECONDS = Histogram(
+    "detection_snapshot_encode_seconds", "Snapshot JPEG / clip encoding time on the worker threads", ["kind"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+RECORDED_FRAMES = Counter(
+    "detection_recorded_frames_total", "Frames handled by the recorder", ["result"])
+LOG_RECORDS_DROPPED = Counter(
+    "detection_log_records_dropped_total", "Log records not written (rate_limited or queue_full)", ["reason"])
+STARTUP_SECONDS = Gauge(
+    "detection_startup_seconds", "Seconds from process start to a startup milestone", ["phase"])
+PROCESS_RSS = Gauge(
+    "process_resident_memory_bytes", "Resident memory size in bytes")
+PROCESS_RSS.set_function(get_process_rss_bytes)
+
+
+class ReusePortHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP server bound with SO_REUSEPORT when running under hot_reload.py
+    (READY_FILE set), so the warm-standby process can listen on the same port
+    while the old process still runs. Otherwise a second instance fails with
+    EADDRINUSE instead of silently sharing the port.
+    """
+    allow_reuse_port = hasattr(socket, "SO_REUSEPORT") and bool(os.getenv("READY_FILE"))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent; keep them out of the service log
+        pass
+
+
+def start_metrics_server(port: int, addr: str = "0.0.0.0",
+                         registry: Registry = REGISTRY) -> Optional[ThreadingHTTPServer]:
+    """
+    Serve /metrics on a background daemon thread.
+
+    Args:
+        port: TCP port to listen on (0 or negative disables the endpoint)
+        addr: Bind address
+        registry: Registry to expose
+
+    Returns:
+        The running HTTP server, or None if disabled or the port is unavailable
+    """
+    if port <= 0:
+        return None
+
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    try:
+        server = ReusePortHTTPServer((addr, port), handler)
+    except OSError as e:
+        logger.error(f"Failed to start metrics endpoint on {addr}:{port}: {e}")
+        return None
+
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint listening on http://{addr}:{port}/metrics")
+    return server
@@ -0,0 +1,249 @@
+"""
+Mock Video Source Module for S-Pavilion Detection Service
+
+Pre-decodes the mock video clip once and replays it from memory at exactly
+the clip frame rate. Frames come from a RAM array or from a memory-mapped raw
+frame cache file (.npy) that is reused across runs, so looping costs no decode
+CPU, needs no seek or reopen at end of file, and every run sees the same frames
+at the same times.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+from frame_pool import FramePool, PooledFrame
+
+
+logger = logging.getLogger(__name__)
+
+CACHE_MODES = ("off", "ram", "mmap")
+
+
+class CachedVideoSource:
+    """
+    Replays a decoded clip in a loop, paced by absolute per-frame deadlines.
+
+    Implements the subset of the cv2.VideoCapture interface the detection loop
+    uses (get/set/isOpened/release) plus read_pooled().
+    """
+
+    def __init__(self, path: str, mode: str = "ram", cache_dir: str = ".frame_cache",
+                 max_ram_mb: int = 2048, pool_size: int = 4, pool_name: str = "frame_pool"):
+        """
+        Initialize the source.
+
+        Args:
+            path: Video file to replay
+            mode: 'ram' (decode into memory) or 'mmap' (memory-mapped cache file)
+            cache_dir: Directory for mmap cache files
+            max_ram_mb: Clips larger than this use the mmap cache even in 'ram' mode
+            pool_size: Number of preallocated frame buffers
+            pool_name: Metrics name of the frame pool
+        """
+        self.path = path
+        self.mode = mode
+        self.cache_dir = cache_dir
+        self.max_ram_mb = max_ram_mb
+        self.pool_size = pool_size
+        self.pool_name = pool_name
+
+        self.frames: Optional[np.ndarray] = None
+        self.pool: Optional[FramePool] = None
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+
+        self._index = 0
+        self._start = 0.0
+        self._emitted = 0
+        self._lock = threading.Lock()
+
+    @property
+    def frame_count(self) -> int:
+        return 0 if self.frames is None else len(self.frames)
+
+    def _cache_path(self, width: int, height: int) -> str:
+        """Cache file keyed by clip identity (size and mtime) and frame shape"""
+        st = os.stat(self.path)
+        stem = os.path.splitext(os.path.basename(self.path))[0]
+        return os.path.join(self.cache_dir, f"{stem}-{st.st_size}-{int(st.st_mtime)}-{width}x{height}.npy")
+
+    def open(self) -> bool:
+        """Decode the clip (or map an existing cache file) and start the replay clock"""
+        capture = cv2.VideoCapture(self.path)
+        if not capture.isOpened():
+            return False
+
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        # Header frame count can be off for some containers; decode to learn the real one
+        estimated = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        mode = self.mode
+        estimated_mb = estimated * width * height * 3 / 2**20
+        if mode == "ram" and estimated_mb > self.max_ram_mb:
+            logger.warning(f"Clip needs ~{estimated_mb:.0f} MiB, above the {self.max_ram_mb} MiB RAM limit; "
+                           "using the mmap frame cache instead")
+            mode = "mmap"
+
+        start = time.perf_counter()
+        if mode == "mmap":
+            path = self._cache_path(width, height)
+            if os.path.exists(path):
+                self.frames = np.load(path, mmap_mode="r")
+                logger.info(f"Mapped frame cache {path} ({len(self.frames)} frames)")
+            else:
+                self.frames = self._decode_to_file(capture, path, estimated, width, height)
+        else:
+            self.frames = self._decode(capture, estimated, width, height)
+        capture.release()
+
+        if self.frames is None or len(self.frames) == 0:
+            logger.error(f"No frames decoded from {self.path}")
+            return False
+
+        self.height, self.width = self.frames.shape[1:3]
+        self.pool = FramePool((self.height, self.width, 3), self.pool_size, name=self.pool_name)
+        logger.info(f"Mock source ready: {len(self.frames)} frames {self.width}x{self.height}@{self.fps:.2f}fps "
+                    f"({mode}, {self.frames.nbytes / 2**20:.0f} MiB, {time.perf_counter() - start:.2f}s)")
+
+        self._index = 0
+        self._emitted = 0
+        self._start = time.monotonic()
+        return True
+
+    @staticmethod
+    def _decode(capture, estimated: int, width: int, height: int) -> np.ndarray:
+        frames = np.empty((max(estimated, 1), height, width, 3), dtype=np.uint8)
+        count = 0
+        while count < len(frames):
+            ret, _ = capture.read(image=frames[count])
+            if not ret:
+                break
+            count += 1
+
+        if count < len(frames):
+            # Copy so the unused tail of the header-sized array is freed
+            return frames[:count].copy()
+
+        # The header undercounted; append whatever is left
+        extra = []
+        while True:
+            ret, image = capture.read()
+            if not ret:
+                break
+            extra.append(image)
+        if extra:
+            frames = np.concatenate([frames, np.stack(extra)])
+        return frames
+
+    def _decode_to_file(self, capture, path: str, estimated: int, width: int, height: int) -> np.ndarray:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Unique temp names: several sources may decode the same clip at once
+        tmp_path = self._temp_path(path)
+        trim_path = None
+        try:
+            frames = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.uint8,
+                                               shape=(max(estimated, 1), height, width, 3))
+            # The file is sized from the header frame count; any frames beyond it are not cached
+            count = 0
+            while count < len(frames):
+                ret, _ = capture.read(image=frames[count])
+                if not ret:
+                    break
+                count += 1
+
+            if count < len(frames):
+                # Shorter than the header claimed; rewrite with the real frame count
+                trim_path = self._temp_path(path)
+                trimmed = np.lib.format.open_memmap(trim_path, mode="w+", dtype=np.uint8,
+                                                    shape=(count, height, width, 3))
+                trimmed[:] = frames[:count]
+                trimmed.flush()
+                del frames, trimmed
+                os.replace(trim_path, tmp_path)
+                trim_path = None
+            else:
+                frames.flush()
+                del frames
+
+            if os.path.exists(path):
+                # Another source finished the same cache first; use its file
+                logger.info(f"Frame cache {path} was written concurrently; mapping it")
+            else:
+                os.replace(tmp_path, path)
+                logger.info(f"Wrote frame cache {path} ({count} frames)")
+        finally:
+            for leftover in (tmp_path, trim_path):
+                if leftover is not None and os.path.exists(leftover):
+                    os.remove(leftover)
+        return np.load(path, mmap_mode="r")
+
+    def _temp_path(self, path: str) -> str:
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=os.path.basename(path) + ".", suffix=".tmp.npy")
+        os.close(fd)
+        return tmp_path
+
+    def read_pooled(self) -> Tuple[bool, Optional[PooledFrame]]:
+        """
+        Wait for the next frame deadline and return a copy of that frame.
+
+        Deadlines are start + n / fps, so loop overhead never accumulates as
+        drift. If the consumer falls more than a frame behind, the clock is
+        re-anchored instead of bursting frames to catch up.
+        """
+        if self.frames is None:
+            return False, None
+
+        with self._lock:
+            deadline = self._start + self._emitted / self.fps
+            now = time.monotonic()
+            if deadline > now:
+                time.sleep(deadline - now)
+            elif now - deadline > 1.0 / self.fps:
+                self._start = now - self._emitted / self.fps
+                deadline = now
+
+            frame = self.pool.acquire()
+            # Copy so drawing on the frame never touches the cache
+            np.copyto(frame.array, self.frames[self._index])
+            frame.timestamp = deadline
+
+            self._index = (self._index + 1) % len(self.frames)
+            self._emitted += 1
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self.frames is not None
+
+    def get(self, prop_id: int) -> float:
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._index)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        if prop_id == cv2.CAP_PROP_POS_FRAMES and self.frame_count:
+            with self._lock:
+                self._index = int(value) % self.frame_count
+            return True
+        return False
+
+    def release(self):
+        # Dropping the reference unmaps the cache file
+        self.frames = None
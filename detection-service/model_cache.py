@@ -0,0 +1,168 @@
+"""
+Model Cache Module for S-Pavilion Detection Service
+
+Loads the YOLO model through a local cache of prepared artifacts and warms it
+up before the first real frame.
+
+Compile modes:
+- none:        load the original weights as-is
+- fuse:        fuse Conv+BatchNorm layers once and persist the fused checkpoint
+- torchscript: export a TorchScript module for the configured input size
+
+Cache entries are keyed by the weights (resolved path and content hash),
+mode, input size, device and library versions, so retrained weights under the
+same name, upgrading torch/ultralytics or changing the device rebuilds them.
+"""
+
+import copy
+import hashlib
+import logging
+import os
+import time
+from typing import List
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+COMPILE_MODES = ("none", "fuse", "torchscript")
+
+
+def weights_fingerprint(weights: str) -> str:
+    """
+    Short hash of the weights' resolved path and contents.
+
+    Names that are not local files (e.g. "yolov8n.pt", downloaded by
+    ultralytics on first use) are hashed by name.
+    """
+    digest = hashlib.sha256()
+    if os.path.isfile(weights):
+        digest.update(os.path.realpath(weights).encode("utf-8"))
+        with open(weights, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    else:
+        digest.update(weights.encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def cache_path(cache_dir: str, weights: str, mode: str, imgsz: int, device: str) -> str:
+    """Path of the cached artifact for this model configuration"""
+    import torch
+    import ultralytics
+
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    ext = "torchscript" if mode == "torchscript" else "pt"
+    name = (f"{stem}-{weights_fingerprint(weights)}-{mode}-{imgsz}-{device}"
+            f"-u{ultralytics.__version__}-t{torch.__version__.split('+')[0]}.{ext}")
+    return os.path.join(cache_dir, name)
+
+
+def load_model(weights: str = "yolov8n.pt", device: str = "cpu", mode: str = "fuse",
+               cache_dir: str = ".model_cache", imgsz: int = 640):
+    """
+    Load a YOLO model, reusing a cached fused/compiled artifact when available.
+
+    Args:
+        weights: Original model weights (e.g. yolov8n.pt)
+        device: 'cuda' or 'cpu'
+        mode: One of COMPILE_MODES
+        cache_dir: Directory holding prepared artifacts
+        imgsz: Inference input size (TorchScript exports are fixed to it)
+
+    Returns:
+        ultralytics.YOLO instance ready for inference
+    """
+    from ultralytics import YOLO
+
+    if mode not in COMPILE_MODES:
+        logger.warning(f"Unknown MODEL_COMPILE mode '{mode}', falling back to 'none'")
+        mode = "none"
+
+    if mode == "none":
+        model = YOLO(weights)
+        model.to(device)
+        return model
+
+    path = cache_path(cache_dir, weights, mode, imgsz, device)
+    if os.path.exists(path):
+        try:
+            start = time.perf_counter()
+            model = YOLO(path, task="detect")
+            if mode == "fuse":
+                model.to(device)
+            logger.info(f"Loaded cached {mode} model {path} in {time.perf_counter() - start:.2f}s")
+            return model
+        except Exception as e:
+            logger.warning(f"Cached model {path} is unusable ({e}); rebuilding")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    start = time.perf_counter()
+    model = YOLO(weights)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if mode == "fuse":
+            model = _build_fused(model, path)
+            model.to(device)
+        else:
+            model = _build_torchscript(model, path, imgsz, device)
+        logger.info(f"Built and cached {mode} model {path} in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        # A cache failure must never stop detection; use the plain weights instead
+        logger.warning(f"Could not prepare {mode} model ({e}); using {weights} as-is")
+        model = YOLO(weights)
+        model.to(device)
+    return model
+
+
+def _build_fused(model, path: str):
+    """Fuse Conv+BN and persist the result as an ultralytics checkpoint"""
+    import torch
+    from ultralytics import YOLO
+
+    model.fuse()
+    net = copy.deepcopy(model.model).cpu()
+    train_args = getattr(net, "args", {})
+    ckpt = {"model": net, "train_args": dict(train_args) if isinstance(train_args, dict) else {}}
+
+    tmp_path = f"{path}.tmp"
+    torch.save(ckpt, tmp_path)
+    os.replace(tmp_path, path)
+    return YOLO(path, task="detect")
+
+
+def _build_torchscript(model, path: str, imgsz: int, device: str):
+    """Export a TorchScript module and move it into the cache"""
+    from ultralytics import YOLO
+
+    exported = model.export(format="torchscript", imgsz=imgsz,
+                            device=0 if device == "cuda" else "cpu", verbose=False)
+    os.replace(str(exported), path)
+    return YOLO(path, task="detect")
+
+
+def warm_up(model, width: int, height: int, iterations: int = 2) -> List[float]:
+    """
+    Run inference on dummy frames of the real camera shape so predictor setup,
+    memory allocation and layer fusion happen before the first real frame.
+
+    Returns:
+        Duration of each warm-up iteration in seconds
+    """
+    if iterations <= 0:
+        return []
+
+    dummy = np.zeros((height, width, 3), dtype=np.uint8)
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        model(dummy, verbose=False)
+        durations.append(time.perf_counter() - start)
+
+    logger.info("Model warm-up on %dx%d: %s", width, height,
+                ", ".join(f"{d * 1000:.0f}ms" for d in durations))
+    return durations
@@ -0,0 +1,433 @@
+"""
+Multi-Source Module for S-Pavilion Detection Service
+
+Runs several cameras / video files in one process. Each source has its own
+capture thread and output stream path, while a single InferenceEngine owns the
+model and batches the newest frame of every waiting source into one inference
+call, so adding a camera costs a capture thread and an encoder instead of a
+whole process with its own model copy.
+
+Sources are configured with SOURCES, either inline JSON or a path to a JSON
+file:
+
+    [
+      {"id": "entrance", "camera": 0},
+      {"id": "hall", "camera": 2, "width": 1280, "height": 720},
+      {"id": "demo", "video": "test-video.mp4"}
+    ]
+
+Each source streams to rtsp_url if given, otherwise to RTSP_URL with the last
+path segment replaced by the source id (rtsp://mediamtx:8554/entrance).
+"""
+
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import cv2
+
+import metrics
+from capture import LowLatencyCapture
+from frame_pool import FramePool
+from mock_source import CachedVideoSource
+
+
+logger = logging.getLogger(__name__)
+
+
+class SourceConfig:
+    """Configuration of one capture source"""
+
+    def __init__(self, source_id: str, camera: Optional[int] = None, video: Optional[str] = None,
+                 rtsp_url: Optional[str] = None, width: int = 0, height: int = 0, fps: float = 15,
+                 fourcc: str = "YUYV"):
+        self.id = source_id
+        self.camera = camera
+        self.video = video
+        self.rtsp_url = rtsp_url
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.fourcc = fourcc
+
+    def __repr__(self):
+        target = f"camera={self.camera}" if self.camera is not None else f"video={self.video}"
+        return f"SourceConfig(id={self.id}, {target}, rtsp_url={self.rtsp_url})"
+
+
+def _source_rtsp_url(base_url: str, source_id: str) -> str:
+    """rtsp://host:8554/camera -> rtsp://host:8554/<source_id>"""
+    parts = urlsplit(base_url)
+    path = parts.path.rsplit("/", 1)[0] + "/" + source_id
+    return urlunsplit((parts.scheme, parts.netloc, path, parts.query, parts.fragment))
+
+
+def parse_sources(value: str, base_rtsp_url: str) -> List[SourceConfig]:
+    """
+    Parse the SOURCES setting.
+
+    Args:
+        value: JSON list, or the path of a file containing one
+        base_rtsp_url: RTSP URL used to derive per-source stream paths
+
+    Returns:
+        List of SourceConfig
+    """
+    if os.path.isfile(value):
+        with open(value, "r") as f:
+            entries = json.load(f)
+    else:
+        entries = json.loads(value)
+
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("SOURCES must be a non-empty JSON list")
+
+    sources = []
+    seen = set()
+    for i, entry in enumerate(entries):
+        if ("camera" in entry) == ("video" in entry):
+            raise ValueError(f"Source #{i} must have exactly one of 'camera' or 'video'")
+        source_id = str(entry.get("id") or f"camera_{entry.get('camera', i)}")
+        if source_id in seen:
+            raise ValueError(f"Duplicate source id '{source_id}'")
+        seen.add(source_id)
+
+        sources.append(SourceConfig(
+            source_id,
+            camera=int(entry["camera"]) if "camera" in entry else None,
+            video=entry.get("video"),
+            rtsp_url=entry.get("rtsp_url") or _source_rtsp_url(base_rtsp_url, source_id),
+            width=int(entry.get("width", 0)),
+            height=int(entry.get("height", 0)),
+            fps=float(entry.get("fps", 15)),
+            fourcc=entry.get("fourcc", "YUYV"),
+        ))
+    return sources
+
+
+class _DetectionRequest:
+    def __init__(self, source_id: str, frame):
+        self.source_id = source_id
+        self.frame = frame
+        self.detections: list = []
+        self.done = threading.Event()
+
+
+class InferenceEngine:
+    """
+    Shared model runner that batches frames across sources.
+
+    detect() blocks the calling source thread until its frame has been processed.
+    The engine thread waits for the first pending request, gives other sources
+    up to max_wait seconds to join, then runs one batched inference call.
+    """
+
+    def __init__(self, detect_batch: Callable[[list], List[list]], batch_size: int = 4,
+                 max_wait: float = 0.005, ready: Optional[threading.Event] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            detect_batch: Function mapping a list of frames to a list of detection lists
+            batch_size: Maximum frames per inference call
+            max_wait: Seconds to wait for a batch to fill after the first request
+            ready: Event that is set once the model can serve detect_batch
+        """
+        self.detect_batch = detect_batch
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.ready = ready if ready is not None else threading.Event()
+
+        self._cond = threading.Condition()
+        self._pending: List[_DetectionRequest] = []
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+
+        metrics.QUEUE_DEPTH.labels("inference_requests").set_function(lambda: len(self._pending))
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="inference-engine", daemon=True)
+        self._thread.start()
+        logger.info(f"Inference engine started (batch size {self.batch_size}, "
+                    f"max wait {self.max_wait * 1000:.0f}ms)")
+
+    def detect(self, source_id: str, frame, timeout: float = 5.0) -> list:
+        """Queue a frame and wait for its detections ([] if the model is not ready)"""
+        if not self.ready.is_set() or not self._running:
+            return []
+        request = _DetectionRequest(source_id, frame)
+        with self._cond:
+            self._pending.append(request)
+            self._cond.notify_all()
+        if not request.done.wait(timeout):
+            logger.warning(f"Detection for {source_id} timed out")
+            return []
+        return request.detections
+
+    def _take_batch(self) -> List[_DetectionRequest]:
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or not self._running)
+            if not self._running:
+                return []
+            # Let the other sources catch up so their frames share this call
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    break
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+        return batch
+
+    def _run(self):
+        batch_sizes = metrics.INFERENCE_BATCH_SIZE
+        while self._running:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                results = self.detect_batch([request.frame for request in batch])
+            except Exception as e:
+                logger.error(f"Batched detection failed: {e}", exc_info=True)
+                results = [[] for _ in batch]
+            batch_sizes.observe(len(batch))
+            for request, detections in zip(batch, results):
+                request.detections = detections
+                request.done.set()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            pending, self._pending = self._pending, []
+            self._cond.notify_all()
+        for request in pending:
+            request.done.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+
+class SourceWorker:
+    """Capture, detect, draw, report and stream loop for one source"""
+
+    def __init__(self, config: SourceConfig, engine: InferenceEngine,
+                 open_writer: Callable, draw: Callable, send_bboxes: Callable,
+                 post_interval: int = 30, pool_size: int = 4, buffer_size: int = 1,
+                 frame_cache: str = "off", frame_cache_dir: str = ".frame_cache"):
+        """
+        Initialize the worker.
+
+        Args:
+            config: Source configuration
+            engine: Shared inference engine
+            open_writer: open_writer(rtsp_url, width, height, fps, source_id) -> writer or None
+            draw: draw(frame, detections) -> frame
+            send_bboxes: send_bboxes(bboxes, camera_id, frame_number)
+            post_interval: Send bbox data every N frames
+            pool_size: Preallocated frame buffers for this source
+            buffer_size: V4L2 driver buffers for camera sources
+            frame_cache: 'ram' or 'mmap' replays video sources from a pre-decoded cache
+            frame_cache_dir: Directory for mmap frame cache files
+        """
+        self.config = config
+        self.engine = engine
+        self.open_writer = open_writer
+        self.draw = draw
+        self.send_bboxes = send_bboxes
+        self.post_interval = post_interval
+        self.pool_size = pool_size
+        self.buffer_size = buffer_size
+        self.frame_cache = frame_cache
+        self.frame_cache_dir = frame_cache_dir
+
+        self.capture = None
+        self.pool: Optional[FramePool] = None
+        self.writer = None
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.frame_count = 0
+
+        self.opened = threading.Event()
+        self._stop = threading.Event()
+        self._reconnect = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._frames = metrics.SOURCE_FRAMES.labels(config.id)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"source-{self.config.id}", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
+
+    def request_reconnect(self):
+        """Reopen the stream writer before the next frame"""
+        self._reconnect.set()
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _open_capture(self) -> bool:
+        # Any failure here (a busy device, a broken cache file) is retried by the caller
+        try:
+            return self._open_source()
+        except Exception as e:
+            logger.error(f"[{self.config.id}] Error opening source: {e}")
+            return False
+
+    def _open_source(self) -> bool:
+        config = self.config
+        if config.camera is not None:
+            capture = LowLatencyCapture(config.camera, config.width, config.height, config.fps,
+                                        config.fourcc, self.buffer_size, self.pool_size,
+                                        pool_name=f"frame_pool_{config.id}")
+            if not capture.open():
+                return False
+            self.capture = capture
+            self.width, self.height, self.fps = capture.width, capture.height, capture.fps
+        elif self.frame_cache in ("ram", "mmap"):
+            capture = CachedVideoSource(config.video, self.frame_cache, self.frame_cache_dir,
+                                        pool_size=self.pool_size, pool_name=f"frame_pool_{config.id}")
+            if not capture.open():
+                return False
+            self.capture = capture
+            self.width, self.height, self.fps = capture.width, capture.height, capture.fps
+        else:
+            capture = cv2.VideoCapture(config.video)
+            if not capture.isOpened():
+                return False
+            self.capture = capture
+            self.width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            self.fps = capture.get(cv2.CAP_PROP_FPS) or config.fps
+            self.pool = FramePool((self.height, self.width, 3), self.pool_size, name=f"frame_pool_{config.id}")
+        logger.info(f"[{config.id}] Opened {self.width}x{self.height}@{self.fps:.2f}fps")
+        return True
+
+    def _read(self):
+        if isinstance(self.capture, (LowLatencyCapture, CachedVideoSource)):
+            return self.capture.read_pooled()
+        ret, pooled = self.pool.read(self.capture)
+        if not ret and self.config.video is not None:
+            # Loop video files
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, pooled = self.pool.read(self.capture)
+        return ret, pooled
+
+    def _write(self, frame) -> bool:
+        """Hand a frame to the writer; returns False if the writer must be reopened"""
+        try:
+            if hasattr(self.writer, "write_frame"):
+                return self.writer.write_frame(frame)
+            self.writer.stdin.write(frame.data)
+            return True
+        except (BrokenPipeError, OSError) as e:
+            logger.error(f"[{self.config.id}] Stream writer failed: {e}")
+            return False
+
+    def _close_writer(self):
+        writer, self.writer = self.writer, None
+        if writer is None:
+            return
+        try:
+            if hasattr(writer, "cleanup"):
+                writer.cleanup()
+            else:
+                writer.stdin.close()
+                writer.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            writer.kill()
+        except Exception as e:
+            logger.error(f"[{self.config.id}] Error during writer cleanup: {e}")
+
+    def _run(self):
+        config = self.config
+        label = f"source_{config.id}"
+        while not self._stop.is_set() and not self._open_capture():
+            logger.error(f"[{config.id}] Failed to open source; retrying in 1 second")
+            self._stop.wait(1.0)
+        self.opened.set()
+
+        self.writer = self.open_writer(config.rtsp_url, self.width, self.height, self.fps, config.id)
+        # Plain video files are paced here; cameras and the frame cache pace themselves
+        frame_interval = 0.0
+        if config.video is not None and self.pool is not None and self.fps > 0:
+            frame_interval = 1.0 / self.fps
+        next_deadline = time.monotonic()
+        pooled = None
+
+        try:
+            while not self._stop.is_set():
+                if pooled is not None:
+                    pooled.release()
+                    pooled = None
+
+                ret, pooled = self._read()
+                if not ret:
+                    metrics.FRAMES_DROPPED.labels("read_failed").inc()
+                    logger.warning(f"[{config.id}] Failed to read frame; reopening source")
+                    self.capture.release()
+                    self._stop.wait(1.0)
+                    while not self._stop.is_set() and not self._open_capture():
+                        self._stop.wait(1.0)
+                    continue
+
+                self.frame_count += 1
+                self._frames.inc()
+                metrics.FRAMES_CAPTURED.inc()
+                frame = pooled.array
+
+                detections = self.engine.detect(config.id, frame)
+                if self.engine.ready.is_set():
+                    metrics.GLASS_TO_DETECTION_SECONDS.observe(time.monotonic() - pooled.timestamp)
+                if detections:
+                    frame = self.draw(frame, detections)
+                    if self.frame_count % self.post_interval == 0:
+                        self.send_bboxes([det['bbox'] for det in detections], config.id, self.frame_count)
+
+                if self._reconnect.is_set():
+                    self._reconnect.clear()
+                    logger.info(f"[{config.id}] Reconnecting stream writer")
+                    self._close_writer()
+                    metrics.WRITER_RECONNECTS.labels(label).inc()
+                    self.writer = self.open_writer(config.rtsp_url, self.width, self.height, self.fps, config.id)
+
+                if self.writer is not None:
+                    push_start = time.perf_counter()
+                    if self._write(frame):
+                        metrics.STREAM_PUSH_SECONDS.labels(label).observe(time.perf_counter() - push_start)
+                    else:
+                        metrics.FRAMES_DROPPED.labels("write_error").inc()
+                        self._close_writer()
+                        self._stop.wait(2.0)
+                        metrics.WRITER_RECONNECTS.labels(label).inc()
+                        self.writer = self.open_writer(config.rtsp_url, self.width, self.height,
+                                                       self.fps, config.id)
+                else:
+                    metrics.FRAMES_DROPPED.labels("no_writer").inc()
+
+                if frame_interval:
+                    next_deadline += frame_interval
+                    delay = next_deadline - time.monotonic()
+                    if delay > 0:
+                        self._stop.wait(delay)
+                    else:
+                        next_deadline = time.monotonic()
+
+        except Exception as e:
+            logger.error(f"[{config.id}] Unexpected error in source loop: {e}", exc_info=True)
+        finally:
+            if pooled is not None:
+                pooled.release()
+            if self.capture is not None:
+                self.capture.release()
+            self._close_writer()
+            logger.info(f"[{config.id}] Source stopped after {self.frame_count} frames")
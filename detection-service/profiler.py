@@ -0,0 +1,222 @@
+"""
+Stage Profiler Module for S-Pavilion Detection Service
+
+Optional per-stage timing of the detection loop (read, detect, draw, post,
+write, sleep). Each frame's stage durations are recorded with
+time.perf_counter_ns() into a fixed-size ring buffer, so memory use is bounded
+and recording costs a couple of array stores per stage.
+
+On SIGUSR1 (or on exit) the ring buffer is dumped as:
+- <prefix>.json:        per-stage percentiles in milliseconds
+- <prefix>.folded:      collapsed stacks for flamegraph.pl / speedscope
+- <prefix>.trace.json:  Chrome trace events (chrome://tracing, Perfetto)
+
+Usage:
+    python profiler.py <pid>    # ask a running detection service to dump
+"""
+
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+# Stages of the main() loop, in execution order
+STAGES = ("read", "detect", "draw", "post", "write", "other", "sleep")
+
+PERCENTILES = (50, 90, 99)
+
+
+class NullProfiler:
+    """Profiler stand-in used when profiling is disabled; every hook is a no-op"""
+
+    enabled = False
+
+    def begin_frame(self):
+        pass
+
+    def mark(self, stage: str):
+        pass
+
+    def install_signal_handler(self):
+        pass
+
+    def write_dump(self, directory: Optional[str] = None) -> List[str]:
+        return []
+
+
+class StageProfiler:
+    """
+    Records how long each stage of a frame took.
+
+    Call begin_frame() at the top of the loop and mark(stage) after each stage;
+    the time since the previous mark is attributed to that stage.
+    """
+
+    enabled = True
+
+    def __init__(self, stages: Sequence[str] = STAGES, ring_size: int = 4096,
+                 dump_dir: str = "."):
+        """
+        Initialize the profiler.
+
+        Args:
+            stages: Stage names in loop order
+            ring_size: Number of most recent frames kept
+            dump_dir: Directory where dumps are written
+        """
+        self.stages = tuple(stages)
+        self.ring_size = ring_size
+        self.dump_dir = dump_dir
+
+        self._stage_index = {name: i for i, name in enumerate(self.stages)}
+        self._starts = np.zeros(ring_size, dtype=np.int64)
+        self._durations = np.zeros((ring_size, len(self.stages)), dtype=np.int64)
+        self._frames = 0
+        self._row = -1
+        self._last = 0
+
+    def begin_frame(self):
+        """Start timing a new frame, overwriting the oldest ring slot"""
+        now = time.perf_counter_ns()
+        row = self._frames % self.ring_size
+        self._durations[row] = 0
+        self._starts[row] = now
+        self._row = row
+        self._frames += 1
+        self._last = now
+
+    def mark(self, stage: str):
+        """Attribute the time since the previous mark to `stage`"""
+        now = time.perf_counter_ns()
+        if self._row >= 0:
+            self._durations[self._row, self._stage_index[stage]] += now - self._last
+        self._last = now
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Copy the completed frames out of the ring buffer, oldest first.
+
+        Returns:
+            (start timestamps in ns, durations in ns with one column per stage)
+        """
+        # The current frame is still being recorded; leave it out
+        completed = max(self._frames - 1, 0)
+        count = min(completed, self.ring_size - 1)
+        if count == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, len(self.stages)), dtype=np.int64)
+
+        end = (self._frames - 1) % self.ring_size
+        order = (np.arange(end - count, end) % self.ring_size)
+        return self._starts[order].copy(), self._durations[order].copy()
+
+    def summary(self, durations: Optional[np.ndarray] = None) -> Dict:
+        """Per-stage percentiles in milliseconds"""
+        if durations is None:
+            _, durations = self.snapshot()
+
+        result = {"frames": int(durations.shape[0]), "stages": {}}
+        if durations.shape[0] == 0:
+            return result
+
+        columns = list(self.stages) + ["total"]
+        data = np.column_stack([durations, durations.sum(axis=1)]) / 1e6
+        for i, name in enumerate(columns):
+            values = data[:, i]
+            stats = {f"p{p}": round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+            stats["mean"] = round(float(values.mean()), 3)
+            stats["max"] = round(float(values.max()), 3)
+            result["stages"][name] = stats
+        return result
+
+    def write_dump(self, directory: Optional[str] = None,
+                   snapshot: Optional[Tuple[np.ndarray, np.ndarray]] = None) -> List[str]:
+        """
+        Write percentiles, collapsed stacks and a Chrome trace for the buffered frames.
+
+        Returns:
+            List of written file paths
+        """
+        directory = directory or self.dump_dir
+        starts, durations = snapshot if snapshot is not None else self.snapshot()
+        prefix = os.path.join(directory, f"profile_{os.getpid()}_{time.strftime('%Y%m%d_%H%M%S')}")
+
+        try:
+            os.makedirs(directory, exist_ok=True)
+
+            summary_path = f"{prefix}.json"
+            with open(summary_path, "w") as f:
+                json.dump(self.summary(durations), f, indent=2)
+
+            # Collapsed stack format: "frame;<stage> <microseconds>"
+            folded_path = f"{prefix}.folded"
+            totals_us = durations.sum(axis=0) // 1000 if durations.shape[0] else []
+            with open(folded_path, "w") as f:
+                for name, total in zip(self.stages, totals_us):
+                    if total > 0:
+                        f.write(f"frame;{name} {int(total)}\n")
+
+            trace_path = f"{prefix}.trace.json"
+            with open(trace_path, "w") as f:
+                json.dump({"traceEvents": self._trace_events(starts, durations),
+                           "displayTimeUnit": "ms"}, f)
+        except OSError as e:
+            logger.error(f"Failed to write profile dump: {e}")
+            return []
+
+        logger.info(f"Profile dump written: {summary_path} ({durations.shape[0]} frames)")
+        return [summary_path, folded_path, trace_path]
+
+    def _trace_events(self, starts: np.ndarray, durations: np.ndarray) -> List[Dict]:
+        """Chrome trace 'complete' events, one per frame and one per stage"""
+        events = []
+        pid = os.getpid()
+        for start, row in zip(starts.tolist(), durations.tolist()):
+            ts = start / 1000.0
+            events.append({"name": "frame", "ph": "X", "pid": pid, "tid": 0,
+                           "ts": ts, "dur": sum(row) / 1000.0})
+            for name, duration in zip(self.stages, row):
+                if duration > 0:
+                    events.append({"name": name, "ph": "X", "pid": pid, "tid": 0,
+                                   "ts": ts, "dur": duration / 1000.0})
+                    ts += duration / 1000.0
+        return events
+
+    def install_signal_handler(self, signum: Optional[int] = None):
+        """Dump on SIGUSR1; the snapshot is taken in the handler, files are written off-thread"""
+        signum = signum if signum is not None else getattr(signal, "SIGUSR1", None)
+        if signum is None:
+            logger.warning("SIGUSR1 is not available on this platform; profile dumps only on exit")
+            return
+
+        def _handler(_signum, _frame):
+            snapshot = self.snapshot()
+            threading.Thread(target=self.write_dump, kwargs={"snapshot": snapshot},
+                             name="profile-dump", daemon=True).start()
+
+        signal.signal(signum, _handler)
+        logger.info(f"Stage profiler enabled (ring={self.ring_size} frames); "
+                    f"send SIGUSR1 to pid {os.getpid()} to dump")
+
+
+def create_profiler(enabled: bool, ring_size: int = 4096, dump_dir: str = "."):
+    """Return a StageProfiler when enabled, otherwise a no-op NullProfiler"""
+    if not enabled:
+        return NullProfiler()
+    return StageProfiler(STAGES, ring_size=ring_size, dump_dir=dump_dir)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or not sys.argv[1].isdigit():
+        print("Usage: python profiler.py <pid>")
+        sys.exit(1)
+    os.kill(int(sys.argv[1]), signal.SIGUSR1)
+    print(f"Requested profile dump from pid {sys.argv[1]}")
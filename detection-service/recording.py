@@ -0,0 +1,413 @@
+"""
+Recording Module for S-Pavilion Detection Service
+
+Records frames, their capture timestamps and detections into a seekable,
+memory-mappable file, and replays such files back through the pipeline at
+1x, Nx or maximum speed for regression benchmarks of inference and upload
+throughput.
+
+File layout (little endian):
+
+    header   64 bytes   magic "SPREC001", codec, width, height, fps
+    records  ...        per frame: "SPFR", index u64, timestamp f64,
+                        payload length u32, detections length u32,
+                        payload (raw BGR or JPEG), detections (JSON)
+    index    24 B/frame record offset u64, timestamp f64, payload length u32,
+                        detections length u32
+    trailer  24 bytes   index offset u64, frame count u64, magic "SPRIDX01"
+
+Records are flushed in chunks of CHUNK_FRAMES. A file whose recorder died
+before writing the index is still readable: the reader rebuilds the index by
+scanning the record headers.
+"""
+
+import json
+import logging
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+import metrics
+from frame_pool import FramePool, PooledFrame
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SPREC001"
+INDEX_MAGIC = b"SPRIDX01"
+RECORD_MAGIC = b"SPFR"
+
+HEADER = struct.Struct("<8sBxxxIId36x")      # magic, codec, width, height, fps
+RECORD = struct.Struct("<4sQdII")            # magic, index, timestamp, payload len, detections len
+INDEX_ENTRY = struct.Struct("<QdII")         # offset, timestamp, payload len, detections len
+TRAILER = struct.Struct("<QQ8s")             # index offset, frame count, magic
+
+CODECS = {"raw": 0, "jpeg": 1}
+CODEC_NAMES = {v: k for k, v in CODECS.items()}
+
+CHUNK_FRAMES = 64
+
+
+class Recorder:
+    """
+    Appends frames to a recording on a background thread.
+
+    record() copies the frame into a recorder-owned buffer (before bboxes are
+    drawn on it) and returns immediately; encoding and file I/O happen on the
+    writer thread. If the writer falls behind, frames are dropped rather than
+    stalling the detection loop; if it fails (e.g. disk full), every further
+    frame is dropped.
+    """
+
+    def __init__(self, path: str, width: int, height: int, fps: float, codec: str = "jpeg",
+                 jpeg_quality: int = 90, queue_size: int = 32):
+        """
+        Initialize the recorder.
+
+        Args:
+            path: Output file
+            width: Frame width
+            height: Frame height
+            fps: Nominal frame rate (informational; replay uses the timestamps)
+            codec: 'raw' or 'jpeg'
+            jpeg_quality: JPEG quality for the jpeg codec
+            queue_size: Frames buffered between the loop and the writer thread
+        """
+        if codec not in CODECS:
+            raise ValueError(f"Unknown recording codec '{codec}' (expected one of {', '.join(CODECS)})")
+
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.codec = codec
+        self.jpeg_quality = jpeg_quality
+
+        self._pool = FramePool((height, width, 3), queue_size + 2, name="recorder")
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=queue_size)
+        self._index: List[Tuple[int, float, int, int]] = []
+        self._first_timestamp: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._file = None
+        # Set by the writer thread when it stops on an error
+        self._error: Optional[Exception] = None
+
+        self._written = metrics.RECORDED_FRAMES.labels("written")
+        self._dropped = metrics.RECORDED_FRAMES.labels("dropped")
+        metrics.QUEUE_DEPTH.labels("recorder").set_function(self._queue.qsize)
+
+    def start(self):
+        self._file = open(self.path, "wb")
+        self._file.write(HEADER.pack(MAGIC, CODECS[self.codec], self.width, self.height, float(self.fps)))
+        self._thread = threading.Thread(target=self._run, name="recorder", daemon=True)
+        self._thread.start()
+        logger.info(f"Recording {self.width}x{self.height} ({self.codec}) to {self.path}")
+
+    def record(self, frame: np.ndarray, timestamp: float, detections: Optional[list] = None) -> bool:
+        """
+        Queue a frame with its capture timestamp and detections (None if detection
+        did not run on it). Returns False if the frame was dropped.
+        """
+        if self._error is not None or frame.shape[:2] != (self.height, self.width):
+            self._dropped.inc()
+            return False
+
+        copy = self._pool.acquire()
+        np.copyto(copy.array, frame)
+        if self._first_timestamp is None:
+            self._first_timestamp = timestamp
+        try:
+            self._queue.put_nowait((copy, timestamp - self._first_timestamp, detections))
+            return True
+        except queue.Full:
+            copy.release()
+            self._dropped.inc()
+            return False
+
+    def _encode(self, frame: np.ndarray) -> bytes:
+        if self.codec == "jpeg":
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if not ok:
+                raise RuntimeError("JPEG encoding failed")
+            return encoded.tobytes()
+        return frame.reshape(-1).data
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                frame, timestamp, detections = item
+                try:
+                    payload = self._encode(frame.array)
+                    det_bytes = json.dumps(detections, separators=(",", ":")).encode("utf-8")
+
+                    offset = self._file.tell()
+                    self._file.write(RECORD.pack(RECORD_MAGIC, len(self._index), timestamp,
+                                                 len(payload), len(det_bytes)))
+                    self._file.write(payload)
+                    self._file.write(det_bytes)
+                    self._index.append((offset, timestamp, len(payload), len(det_bytes)))
+                    self._written.inc()
+
+                    if len(self._index) % CHUNK_FRAMES == 0:
+                        self._file.flush()
+                finally:
+                    frame.release()
+        except Exception as e:
+            self._error = e
+            logger.error(f"Recorder stopped: {e}", exc_info=True)
+
+    def close(self):
+        """Drain queued frames, write the index and close the file"""
+        if self._thread is None:
+            return
+        # A writer that died stops taking items, so never block on a full queue
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=0.5)
+                break
+            except queue.Full:
+                pass
+        self._thread.join()
+        self._thread = None
+
+        # Frames the writer never got to go back to the pool
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                item[0].release()
+                self._dropped.inc()
+
+        try:
+            index_offset = self._file.tell()
+            for entry in self._index:
+                self._file.write(INDEX_ENTRY.pack(*entry))
+            self._file.write(TRAILER.pack(index_offset, len(self._index), INDEX_MAGIC))
+            self._file.close()
+        except OSError as e:
+            # The reader rebuilds the index from the record headers
+            logger.error(f"Failed to write the recording index of {self.path}: {e}")
+            try:
+                self._file.close()
+            except OSError:
+                pass
+        logger.info(f"Recording closed: {len(self._index)} frames in {self.path}")
+
+
+class Recording:
+    """Read-only, memory-mapped view of a recording file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, codec, self.width, self.height, self.fps = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a recording file")
+        self.codec = CODEC_NAMES.get(codec, "unknown")
+
+        self.index = self._read_index()
+
+    def _read_index(self) -> List[Tuple[int, float, int, int]]:
+        size = len(self._mmap)
+        if size >= HEADER.size + TRAILER.size:
+            index_offset, count, magic = TRAILER.unpack_from(self._mmap, size - TRAILER.size)
+            if magic == INDEX_MAGIC:
+                return [INDEX_ENTRY.unpack_from(self._mmap, index_offset + i * INDEX_ENTRY.size)
+                        for i in range(count)]
+
+        # No index (recorder was killed); rebuild it from the record headers
+        logger.warning(f"{self.path} has no index; scanning records")
+        index = []
+        offset = HEADER.size
+        while offset + RECORD.size <= size:
+            magic, _, timestamp, payload_len, det_len = RECORD.unpack_from(self._mmap, offset)
+            end = offset + RECORD.size + payload_len + det_len
+            if magic != RECORD_MAGIC or end > size:
+                break
+            index.append((offset, timestamp, payload_len, det_len))
+            offset = end
+        return index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @property
+    def duration(self) -> float:
+        return self.index[-1][1] if self.index else 0.0
+
+    def timestamp(self, i: int) -> float:
+        return self.index[i][1]
+
+    def frame(self, i: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Frame i as a BGR array (decoded into `out` when given)"""
+        offset, _, payload_len, _ = self.index[i]
+        start = offset + RECORD.size
+        if self.codec == "raw":
+            view = np.frombuffer(self._mmap, dtype=np.uint8, count=payload_len, offset=start)
+            view = view.reshape(self.height, self.width, 3)
+            if out is None:
+                return view
+            np.copyto(out, view)
+            return out
+        encoded = np.frombuffer(self._mmap, dtype=np.uint8, count=payload_len, offset=start)
+        decoded = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+        if out is None:
+            return decoded
+        np.copyto(out, decoded)
+        return out
+
+    def detections(self, i: int) -> Optional[list]:
+        offset, _, payload_len, det_len = self.index[i]
+        start = offset + RECORD.size + payload_len
+        return json.loads(bytes(self._mmap[start:start + det_len]) or b"null")
+
+    def close(self):
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Raw frame views handed out earlier still reference the mapping
+            pass
+        self._file.close()
+
+
+class ReplaySource:
+    """
+    Feeds a recording back through the pipeline.
+
+    speed 1.0 reproduces the recorded frame timing, N plays N times faster and
+    0 (or 'max') delivers frames as fast as the loop consumes them. Implements
+    the subset of the cv2.VideoCapture interface the detection loop uses plus
+    read_pooled(), like the other frame sources.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, loop: bool = False, pool_size: int = 4):
+        self.path = path
+        self.speed = speed
+        self.loop = loop
+        self.pool_size = pool_size
+
+        self.recording: Optional[Recording] = None
+        self.pool: Optional[FramePool] = None
+        self.width = 0
+        self.height = 0
+        self.fps = 0.0
+        self.last_detections: Optional[list] = None  # as recorded for the last frame
+
+        self._position = 0
+        self._start = 0.0
+        self._base_timestamp = 0.0
+
+    def open(self) -> bool:
+        try:
+            self.recording = Recording(self.path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot open recording {self.path}: {e}")
+            return False
+        if not len(self.recording):
+            logger.error(f"Recording {self.path} contains no frames")
+            return False
+
+        self.width, self.height, self.fps = self.recording.width, self.recording.height, self.recording.fps
+        self.pool = FramePool((self.height, self.width, 3), self.pool_size)
+        self._seek(0)
+        speed = "max" if self.speed <= 0 else f"{self.speed:g}x"
+        logger.info(f"Replaying {self.path}: {len(self.recording)} frames, "
+                    f"{self.recording.duration:.1f}s ({self.recording.codec}) at {speed}")
+        return True
+
+    def _seek(self, position: int):
+        self._position = position
+        self._start = time.monotonic()
+        self._base_timestamp = self.recording.timestamp(position) if position < len(self.recording) else 0.0
+
+    def read_pooled(self) -> Tuple[bool, Optional[PooledFrame]]:
+        if self.recording is None:
+            return False, None
+        if self._position >= len(self.recording):
+            if not self.loop:
+                return False, None
+            self._seek(0)
+
+        i = self._position
+        deadline = time.monotonic()
+        if self.speed > 0:
+            # Absolute schedule from the recorded timestamps, scaled by speed
+            deadline = self._start + (self.recording.timestamp(i) - self._base_timestamp) / self.speed
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        frame = self.pool.acquire()
+        self.recording.frame(i, out=frame.array)
+        frame.timestamp = deadline
+        self.last_detections = self.recording.detections(i)
+        self._position += 1
+        return True, frame
+
+    def isOpened(self) -> bool:
+        return self.recording is not None
+
+    def get(self, prop_id: int) -> float:
+        if self.recording is None:
+            return 0.0
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.recording))
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self._position)
+        if prop_id == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop_id == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop_id == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        return 0.0
+
+    def set(self, prop_id: int, value: float) -> bool:
+        if prop_id == cv2.CAP_PROP_POS_FRAMES and self.recording is not None:
+            self._seek(max(0, min(int(value), len(self.recording) - 1)))
+            return True
+        return False
+
+    def release(self):
+        if self.recording is not None:
+            self.recording.close()
+            self.recording = None
+
+
+def parse_speed(value: str) -> float:
+    """REPLAY_SPEED: '1', '4', '0.5' or 'max' (0 means max)"""
+    if value.strip().lower() in ("max", "0", ""):
+        return 0.0
+    return float(value.rstrip("xX"))
+
+
+if __name__ == "__main__":
+    # Usage: python recording.py <file>  -> summary of a recording
+    if len(sys.argv) != 2:
+        print("Usage: python recording.py <recording file>")
+        sys.exit(1)
+
+    rec = Recording(sys.argv[1])
+    n = len(rec)
+    people = sum(len(rec.detections(i) or []) for i in range(n))
+    size = os.path.getsize(sys.argv[1])
+    print(f"{sys.argv[1]}: {n} frames {rec.width}x{rec.height} {rec.codec}, "
+          f"{rec.duration:.1f}s ({n / rec.duration if rec.duration else 0:.1f} fps recorded, "
+          f"{rec.fps:.2f} nominal)")
+    print(f"  {size / 2**20:.1f} MiB ({size / max(n, 1) / 1024:.0f} KiB/frame), {people} detections")
+    rec.close()
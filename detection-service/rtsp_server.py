@@ -26,6 +26,8 @@ except ImportError as e:
                       "Install with: apt-get install python3-gi gir1.2-gstreamer-1.0")
 
 from hw_detect import HardwareConfig
+from frame_pool import PooledFrame
+import metrics
 
 
 logger = logging.getLogger(__name__)
@@ -45,7 +47,8 @@ class RTSPStreamer:
 
         Args:
             hw_config: Hardware configuration with selected encoder
-            frame_queue: Thread-safe queue to pull frames from
+            frame_queue: Thread-safe queue to pull frames from (numpy arrays or
+                PooledFrame; pooled frames are released once pushed)
             rtsp_url: Target RTSP URL (e.g., rtsp://mediamtx:8554/camera)
             width: Frame width
             height: Frame height
@@ -62,6 +65,12 @@ class RTSPStreamer:
         self.appsrc = None
         self.is_running = False
         self.frame_count = 0
+
+        # Reused as cv2.resize(dst=...) target so off-size frames don't allocate per frame
+        self._resize_buf = np.empty((height, width, 3), dtype=np.uint8)
+
+        metrics.QUEUE_DEPTH.labels("rtsp_frames").set_function(frame_queue.qsize)
+        self._push_seconds = metrics.STREAM_PUSH_SECONDS.labels("rtsp_streamer")
         
         # Initialize GStreamer
         Gst.init(None)
@@ -206,14 +215,20 @@ class RTSPStreamer:
         
         try:
             while self.is_running:
+                pooled = None
                 try:
                     # Get frame from queue (with timeout)
                     frame = self.frame_queue.get(timeout=1.0)
+                    if isinstance(frame, PooledFrame):
+                        pooled = frame
+                        frame = pooled.array
                     
                     # Ensure frame is correct size
                     if frame.shape[0] != self.height or frame.shape[1] != self.width:
-                        frame = cv2.resize(frame, (self.width, self.height))
+                        frame = cv2.resize(frame, (self.width, self.height), dst=self._resize_buf)
                     
+                    push_start = time.perf_counter()
+
                     # Convert frame to GStreamer buffer
                     data = frame.tobytes()
                     
@@ -228,7 +243,10 @@ class RTSPStreamer:
                     # Push buffer to appsrc
                     ret = self.appsrc.emit('push-buffer', buf)
                     
+                    self._push_seconds.observe(time.perf_counter() - push_start)
+
                     if ret != Gst.FlowReturn.OK:
+                        metrics.FRAMES_DROPPED.labels("push_failed").inc()
                         logger.warning(f"Failed to push buffer: {ret}")
                     
                     self.frame_count += 1
@@ -243,6 +261,10 @@ class RTSPStreamer:
                 except Exception as e:
                     logger.error(f"Error feeding frame: {e}", exc_info=True)
                     time.sleep(0.1)
+                finally:
+                    # The frame data has been copied into the Gst.Buffer
+                    if pooled is not None:
+                        pooled.release()
 
         except Exception as e:
             logger.error(f"Fatal error in frame feeding loop: {e}", exc_info=True)
@@ -0,0 +1,255 @@
+"""
+Snapshot Module for S-Pavilion Detection Service
+
+Event-driven snapshot and clip extraction that never blocks the frame loop.
+The loop hands frames to observe(); the service keeps a short pre-roll ring of
+retained PooledFrames (no copies) and, when a trigger fires, JPEG-encodes the
+trigger frame and writes a pre-roll + post-roll MJPG clip on a thread pool.
+Files in the output directory are rotated oldest-first under a disk quota.
+
+Triggers:
+- count:    at least min_persons people in the frame
+- increase: more people than in the previous frame (a person entered)
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Deque, List, Optional, Tuple
+
+import cv2
+
+import metrics
+from frame_pool import PooledFrame
+
+
+logger = logging.getLogger(__name__)
+
+TRIGGERS = ("count", "increase", "both")
+
+
+class _Clip:
+    """A clip being collected: pre-roll frames plus frames until post-roll ends"""
+
+    def __init__(self, path: str, frames: List[PooledFrame], end_time: float):
+        self.path = path
+        self.frames = frames
+        self.end_time = end_time
+
+
+class SnapshotService:
+    """Asynchronous snapshot/clip writer with a pre-roll ring and disk quota"""
+
+    def __init__(self, output_dir: str = "snapshots", enabled: bool = False, trigger: str = "both",
+                 min_persons: int = 1, cooldown: float = 10.0, pre_roll: float = 2.0,
+                 post_roll: float = 3.0, fps: float = 15.0, quota_mb: int = 1024,
+                 jpeg_quality: int = 90, workers: int = 2):
+        """
+        Initialize the service.
+
+        Args:
+            output_dir: Directory for event snapshots and clips
+            enabled: Whether detections trigger snapshots (save() always works)
+            trigger: 'count', 'increase' or 'both'
+            min_persons: Person count that fires the 'count' trigger
+            cooldown: Minimum seconds between two events
+            pre_roll: Seconds of frames kept before an event (0 disables clips)
+            post_roll: Seconds of frames recorded after an event
+            fps: Frame rate of the source (sizes the ring and clip timing)
+            quota_mb: Disk quota for output_dir; oldest files are deleted first
+            jpeg_quality: JPEG quality for snapshots
+            workers: Encoder threads
+        """
+        if trigger not in TRIGGERS:
+            raise ValueError(f"Unknown snapshot trigger '{trigger}' (expected one of {', '.join(TRIGGERS)})")
+
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.trigger = trigger
+        self.min_persons = min_persons
+        self.cooldown = cooldown
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps if fps and fps > 0 else 15.0
+        self.quota_bytes = quota_mb * 2**20
+        self.jpeg_quality = jpeg_quality
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot")
+        self._ring: Deque[PooledFrame] = collections.deque(
+            maxlen=int(round(self.pre_roll * self.fps)) if enabled else 0)
+        self._clips: List[_Clip] = []
+        self._last_count = 0
+        self._last_event = float("-inf")
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+        # Files under quota management, oldest first
+        self._files: Deque[Tuple[str, int]] = collections.deque()
+        self._total_bytes = 0
+        self._files_lock = threading.Lock()
+        if enabled:
+            os.makedirs(output_dir, exist_ok=True)
+            self._scan_existing()
+
+        metrics.QUEUE_DEPTH.labels("snapshot_jobs").set_function(lambda: self._pending)
+
+    @property
+    def held_frames(self) -> int:
+        """Pool buffers the ring and one running clip hold at most (callers reserve these)"""
+        if not self._ring.maxlen:
+            return 0
+        return self._ring.maxlen + int(round(self.post_roll * self.fps)) + 1
+
+    def _scan_existing(self):
+        entries = []
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if os.path.isfile(path):
+                st = os.stat(path)
+                entries.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(entries):
+            self._files.append((path, size))
+            self._total_bytes += size
+        self._enforce_quota()
+
+    def _submit(self, fn, *args):
+        with self._pending_lock:
+            self._pending += 1
+
+        def _job():
+            try:
+                fn(*args)
+            except Exception as e:
+                logger.error(f"Snapshot job failed: {e}", exc_info=True)
+            finally:
+                with self._pending_lock:
+                    self._pending -= 1
+
+        self._executor.submit(_job)
+
+    # =========================
+    # Frame loop side (cheap)
+    # =========================
+    def save(self, frame: PooledFrame, path: str):
+        """Write one frame to `path` as JPEG in the background (not quota-managed)"""
+        frame.retain()
+        self._submit(self._write_jpeg, frame, path, False)
+
+    def observe(self, frame: PooledFrame, detections: Optional[list]):
+        """
+        Feed the current (annotated) frame. Retains frames for the pre-roll ring
+        and running clips; all encoding happens on the worker threads.
+        """
+        if not self.enabled:
+            return
+
+        now = time.monotonic()
+        count = len(detections) if detections is not None else 0
+        fired = False
+        if detections is not None:
+            if self.trigger in ("count", "both") and count >= self.min_persons:
+                fired = True
+            if self.trigger in ("increase", "both") and count > self._last_count:
+                fired = True
+            self._last_count = count
+
+        # Running clips take the frame until their post-roll ends
+        for clip in list(self._clips):
+            if now <= clip.end_time:
+                clip.frames.append(frame.retain())
+            else:
+                self._clips.remove(clip)
+                self._submit(self._write_clip, clip)
+
+        if fired and now - self._last_event >= self.cooldown:
+            self._last_event = now
+            self._start_event(frame, count, now)
+
+        if self._ring.maxlen:
+            if len(self._ring) == self._ring.maxlen:
+                self._ring.popleft().release()
+            self._ring.append(frame.retain())
+
+    def _start_event(self, frame: PooledFrame, count: int, now: float):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        base = os.path.join(self.output_dir, f"event-{stamp}-{count}p")
+        logger.info(f"Snapshot event: {count} person(s) -> {base}")
+        metrics.SNAPSHOT_EVENTS.inc()
+
+        frame.retain()
+        self._submit(self._write_jpeg, frame, f"{base}.jpg", True)
+
+        if self._ring.maxlen:
+            # The ring keeps its own references; the clip takes new ones
+            pre_roll = [f.retain() for f in self._ring]
+            pre_roll.append(frame.retain())
+            self._clips.append(_Clip(f"{base}.avi", pre_roll, now + self.post_roll))
+
+    # =========================
+    # Worker side
+    # =========================
+    def _write_jpeg(self, frame: PooledFrame, path: str, managed: bool):
+        try:
+            with metrics.SNAPSHOT_ENCODE_SECONDS.labels("jpeg").time():
+                ok, encoded = cv2.imencode(".jpg", frame.array, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        finally:
+            frame.release()
+        if not ok:
+            raise RuntimeError(f"JPEG encoding failed for {path}")
+        data = encoded.tobytes()
+        with open(path, "wb") as f:
+            f.write(data)
+        metrics.SNAPSHOTS_WRITTEN.labels("jpeg").inc()
+        if managed:
+            self._add_file(path, len(data))
+
+    def _write_clip(self, clip: _Clip):
+        frames = clip.frames
+        try:
+            height, width = frames[0].array.shape[:2]
+            with metrics.SNAPSHOT_ENCODE_SECONDS.labels("clip").time():
+                writer = cv2.VideoWriter(clip.path, cv2.VideoWriter_fourcc(*"MJPG"), self.fps, (width, height))
+                if not writer.isOpened():
+                    raise RuntimeError(f"Cannot open clip writer for {clip.path}")
+                for i, frame in enumerate(frames):
+                    writer.write(frame.array)
+                    # Hand buffers back to the pool as soon as they are encoded
+                    frame.release()
+                    frames[i] = None
+                writer.release()
+        finally:
+            for frame in frames:
+                if frame is not None:
+                    frame.release()
+        metrics.SNAPSHOTS_WRITTEN.labels("clip").inc()
+        self._add_file(clip.path, os.path.getsize(clip.path))
+
+    def _add_file(self, path: str, size: int):
+        with self._files_lock:
+            self._files.append((path, size))
+            self._total_bytes += size
+            self._enforce_quota()
+
+    def _enforce_quota(self):
+        """Delete the oldest files until output_dir is under quota (caller holds the lock)"""
+        while self._total_bytes > self.quota_bytes and len(self._files) > 1:
+            path, size = self._files.popleft()
+            self._total_bytes -= size
+            try:
+                os.remove(path)
+                metrics.SNAPSHOTS_ROTATED.inc()
+            except OSError as e:
+                logger.warning(f"Could not rotate snapshot {path}: {e}")
+
+    def close(self):
+        """Flush running clips, wait for pending writes and release retained frames"""
+        for clip in self._clips:
+            self._submit(self._write_clip, clip)
+        self._clips = []
+        self._executor.shutdown(wait=True)
+        while self._ring:
+            self._ring.popleft().release()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Write audit log for the mock PLC
+
+Records every Modbus write (time, unit id, client, FC, address, values) without
+doing any I/O in the request path: setValues only appends a tuple to in-memory
+ring buffers. A background task flushes the batch to a size-rotated JSONL file
+from a worker thread, and recent writes can be queried over a small local HTTP
+interface:
+
+    GET /writes?limit=50&fc=16&address=16&unit=0&client=127.0.0.1&since=<seq>
+    GET /stats
+
+Command line (against a running server):
+    python audit.py                    # last 20 writes
+    python audit.py --fc 15 --limit 100
+    python audit.py --stats
+"""
+
+import asyncio
+import contextvars
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from pymodbus.server import ModbusTcpServer
+from pymodbus.server.requesthandler import ServerRequestHandler
+
+logger = logging.getLogger(__name__)
+
+FC_NAMES = {
+    5: "Write Single Coil",
+    6: "Write Single Register",
+    15: "Write Multiple Coils",
+    16: "Write Multiple Registers",
+}
+
+# (seq, unix time, unit id, client "host:port", fc, address, values)
+Event = Tuple[int, float, Optional[int], Optional[str], int, int, tuple]
+
+# (client, unit id) of the request being handled; set per request task
+_request_origin: contextvars.ContextVar = contextvars.ContextVar("modbus_request_origin", default=(None, None))
+
+
+def current_origin() -> Tuple[Optional[str], Optional[int]]:
+    """(client "host:port", unit id) of the Modbus request being handled, if any"""
+    return _request_origin.get()
+
+
+class AuditRequestHandler(ServerRequestHandler):
+    """Request handler that exposes the peer address and unit id to the datastore"""
+
+    async def handle_request(self):
+        if self.last_pdu and self.transport:
+            peer = self.transport.get_extra_info("peername")
+            client = f"{peer[0]}:{peer[1]}" if peer else None
+            # Each request runs in its own task, so this does not leak between requests
+            _request_origin.set((client, self.last_pdu.dev_id))
+        await super().handle_request()
+
+
+class AuditTcpServer(ModbusTcpServer):
+    """ModbusTcpServer whose connections use AuditRequestHandler"""
+
+    def callback_new_connection(self):
+        return AuditRequestHandler(self, self.trace_packet, self.trace_pdu, self.trace_connect)
+
+
+def _event_document(event: Event) -> dict:
+    seq, ts, unit, client, fc, address, values = event
+    return {
+        "seq": seq,
+        "time": ts,
+        "unit": unit,
+        "client": client,
+        "fc": fc,
+        "address": address,
+        "values": list(values),
+    }
+
+
+class WriteAudit:
+    """In-memory ring buffer of write events with batched, rotated file output"""
+
+    def __init__(self, path: Optional[str] = None, capacity: int = 10000, flush_interval: float = 0.2,
+                 max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5, echo: bool = False):
+        """
+        Initialize the audit log.
+
+        Args:
+            path: JSONL file (None keeps events in memory only)
+            capacity: Events kept for queries, and the most that may wait for a flush
+            flush_interval: Seconds between batch writes (short keeps each batch, and its GIL hold, small)
+            max_bytes: Rotate the file once it would grow past this size
+            backup_count: Rotated files to keep (path.1 ... path.N)
+            echo: Also log each write at INFO level (from the flush thread)
+        """
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.echo = echo
+
+        self._seq = itertools.count(1)
+        self._recent: Deque[Event] = deque(maxlen=capacity)
+        self._pending: Deque[Event] = deque(maxlen=capacity)
+        self._file = None
+
+        self.recorded = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.write_errors = 0
+
+    def record(self, fc: int, address: int, values):
+        """Append a write event; called on the event loop in the request path, so no I/O here"""
+        client, unit = _request_origin.get()
+        event = (next(self._seq), time.time(), unit, client, fc, address, tuple(values))
+        if len(self._pending) == self.capacity:
+            # The oldest unflushed event falls out of the ring
+            self.dropped += 1
+        self._pending.append(event)
+        self._recent.append(event)
+        self.recorded += 1
+
+    def query(self, limit: int = 20, since: int = 0, fc: Optional[int] = None, address: Optional[int] = None,
+              unit: Optional[int] = None, client: Optional[str] = None) -> List[dict]:
+        """Most recent matching events, oldest first"""
+        matches = []
+        for event in reversed(self._recent):
+            seq, _, event_unit, event_client, event_fc, event_address, values = event
+            if seq <= since or len(matches) >= limit:
+                break
+            if fc is not None and event_fc != fc:
+                continue
+            if unit is not None and event_unit != unit:
+                continue
+            if client is not None and not (event_client or "").startswith(client):
+                continue
+            if address is not None and not event_address <= address < event_address + max(len(values), 1):
+                continue
+            matches.append(event)
+        return [_event_document(event) for event in reversed(matches)]
+
+    def stats(self) -> dict:
+        return {
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "pending": len(self._pending),
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "buffered": len(self._recent),
+            "capacity": self.capacity,
+            "file": self.path,
+        }
+
+    def _take_batch(self) -> List[Event]:
+        batch = list(self._pending)
+        self._pending.clear()
+        return batch
+
+    def _write(self, batch: List[Event]):
+        """Write a batch to the file (runs in a worker thread)"""
+        if self.echo:
+            for _, ts, unit, client, fc, address, values in batch:
+                logger.info(f"[{time.strftime('%H:%M:%S', time.localtime(ts))}] WRITE - "
+                            f"{FC_NAMES.get(fc, f'Unknown FC({fc})')}: Address={address}, Values={list(values)}, "
+                            f"Unit={unit}, Client={client}")
+        if not self.path:
+            self.flushed += len(batch)
+            return
+
+        data = "".join(json.dumps(_event_document(event), separators=(",", ":")) + "\n" for event in batch)
+        data = data.encode("utf-8")
+        try:
+            if self._file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                self._file = open(self.path, "ab")
+            if self.max_bytes and self._file.tell() and self._file.tell() + len(data) > self.max_bytes:
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+            self.flushed += len(batch)
+        except OSError as e:
+            self.write_errors += 1
+            logger.error(f"Failed to write {len(batch)} audit event(s) to {self.path}: {e}")
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "ab")
+
+    async def run(self):
+        """Flush pending events every flush_interval until cancelled, then flush the rest"""
+        write = None
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                batch = self._take_batch()
+                if batch:
+                    # Shielded: cancelling run() must not abandon a batch the thread is still writing
+                    write = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+                    await asyncio.shield(write)
+        finally:
+            if write is not None and not write.done():
+                # Let the in-flight write finish before the final flush and close
+                await write
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8502) -> Optional[asyncio.AbstractServer]:
+        """Start the HTTP query interface on the running loop"""
+        try:
+            server = await asyncio.start_server(self._handle_http, host, port)
+        except OSError as e:
+            logger.error(f"Failed to start audit query interface on {host}:{port}: {e}")
+            return None
+        logger.info(f"Write audit queries on http://{host}:{port}/writes")
+        return server
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            # Skip the headers; only GET without a body is supported
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            code, document = self._route(request_line)
+        except (ValueError, UnicodeDecodeError) as e:
+            code, document = 400, {"error": str(e)}
+        except ConnectionError:
+            writer.close()
+            return
+
+        body = json.dumps(document).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed"}[code]
+        writer.write(f"HTTP/1.1 {code} {reason}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    def _route(self, request_line: List[str]) -> Tuple[int, dict]:
+        if len(request_line) < 2:
+            raise ValueError("malformed request line")
+        if request_line[0] != "GET":
+            return 405, {"error": "only GET is supported"}
+
+        url = urlsplit(request_line[1])
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path == "/stats":
+            return 200, self.stats()
+        if url.path != "/writes":
+            return 404, {"error": f"unknown path {url.path}"}
+
+        def int_param(name: str) -> Optional[int]:
+            return int(params[name]) if name in params else None
+
+        events = self.query(limit=int_param("limit") or 20, since=int_param("since") or 0, fc=int_param("fc"),
+                            address=int_param("address"), unit=int_param("unit"), client=params.get("client"))
+        return 200, {"events": events, "stats": self.stats()}
+
+
+def from_env() -> WriteAudit:
+    """WriteAudit configured from the AUDIT_* environment variables"""
+    return WriteAudit(
+        path=os.getenv("AUDIT_FILE", "logs/modbus-writes.jsonl") or None,
+        capacity=int(os.getenv("AUDIT_CAPACITY", "10000")),
+        flush_interval=float(os.getenv("AUDIT_FLUSH_INTERVAL", "0.2")),
+        max_bytes=int(os.getenv("AUDIT_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("AUDIT_BACKUP_COUNT", "5")),
+        echo=os.getenv("AUDIT_ECHO", "true").lower() == "true",
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+
+    parser = argparse.ArgumentParser(description="Query the mock PLC write audit log")
+    parser.add_argument("--port", type=int, default=int(os.getenv("AUDIT_PORT", "8502")))
+    parser.add_argument("--stats", action="store_true", help="show counters instead of events")
+    for name in ("limit", "since", "fc", "address", "unit"):
+        parser.add_argument(f"--{name}", type=int)
+    parser.add_argument("--client", help="client address prefix, e.g. 172.18.0.5")
+    args = parser.parse_args()
+
+    if args.stats:
+        url = f"http://127.0.0.1:{args.port}/stats"
+    else:
+        filters = {name: getattr(args, name) for name in ("limit", "since", "fc", "address", "unit", "client")}
+        url = f"http://127.0.0.1:{args.port}/writes?" + urlencode({k: v for k, v in filters.items() if v is not None})
+
+    with urlopen(url, timeout=5) as response:
+        document = json.load(response)
+    if args.stats:
+        print(json.dumps(document, indent=2))
+    else:
+        for event in document["events"]:
+            print(f"#{event['seq']} {time.strftime('%H:%M:%S', time.localtime(event['time']))} "
+                  f"unit={event['unit']} client={event['client']} FC{event['fc']} "
+                  f"address={event['address']} values={event['values']}")
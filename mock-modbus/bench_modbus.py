@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Modbus load generator and latency benchmark for the mock PLC
+
+Drives a Modbus TCP server (by default a MockPLCServer started for the run)
+with many concurrent async clients issuing a weighted mix of FC1/FC3/FC5/
+FC15/FC16 requests, and reports throughput, latency percentiles and error
+rates per load level as JSON.
+
+Clients either poll on a fixed interval like the Nest backend (--interval 0.1)
+or run closed-loop as fast as the server answers (--interval 0). A level is
+"sustained" when pollers hit at least 95% of their target rate with p99 latency
+below the poll interval and under 1% errors.
+
+Usage:
+    python bench_modbus.py --spawn --clients 1,10,50,100,200 --duration 10
+    python bench_modbus.py --host localhost --port 502 --mix fc3=1 --interval 0
+    python bench_modbus.py --spawn --processes 4 --clients 400 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from pymodbus.client import AsyncModbusTcpClient
+from pymodbus.exceptions import ModbusException
+
+FUNCTION_CODES = (1, 3, 5, 15, 16)
+DEFAULT_MIX = "fc1=4,fc3=4,fc5=1,fc15=1,fc16=1"
+
+# Sustained-load criteria for polling levels
+MIN_RATE_RATIO = 0.95
+MAX_ERROR_RATE = 0.01
+
+
+def parse_mix(value: str) -> List[Tuple[int, float]]:
+    """Parse 'fc1=4,fc3=4,fc16=1' into [(fc, weight), ...]"""
+    mix = []
+    for item in value.split(","):
+        name, _, weight = item.strip().partition("=")
+        fc = int(name.lower().removeprefix("fc"))
+        if fc not in FUNCTION_CODES:
+            raise argparse.ArgumentTypeError(f"Unsupported function code {fc} (use {FUNCTION_CODES})")
+        mix.append((fc, float(weight or 1)))
+    if not mix or sum(weight for _, weight in mix) <= 0:
+        raise argparse.ArgumentTypeError("Request mix needs at least one positive weight")
+    return mix
+
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+class Stats:
+    """Raw per-FC latencies and error counts of one worker (merged across processes)"""
+
+    def __init__(self):
+        self.latencies: Dict[int, List[float]] = {fc: [] for fc in FUNCTION_CODES}
+        self.errors: Dict[int, Dict[str, int]] = {fc: {} for fc in FUNCTION_CODES}
+        self.connect_failures = 0
+        self.late_polls = 0
+
+    def error(self, fc: int, kind: str):
+        self.errors[fc][kind] = self.errors[fc].get(kind, 0) + 1
+
+    def merge(self, other: "Stats"):
+        for fc in FUNCTION_CODES:
+            self.latencies[fc].extend(other.latencies[fc])
+            for kind, count in other.errors[fc].items():
+                self.errors[fc][kind] = self.errors[fc].get(kind, 0) + count
+        self.connect_failures += other.connect_failures
+        self.late_polls += other.late_polls
+
+    @staticmethod
+    def _summarize(latencies: List[float], errors: Dict[str, int], duration: float) -> dict:
+        latencies = sorted(latencies)
+        error_count = sum(errors.values())
+        total = len(latencies) + error_count
+        ms = lambda seconds: None if seconds is None else round(seconds * 1000, 3)
+        return {
+            "requests": total,
+            "ok": len(latencies),
+            "errors": error_count,
+            "error_rate": round(error_count / total, 6) if total else 0.0,
+            "error_kinds": dict(errors),
+            "throughput_rps": round(len(latencies) / duration, 1),
+            "latency_ms": {
+                "mean": ms(sum(latencies) / len(latencies)) if latencies else None,
+                "p50": ms(percentile(latencies, 50)),
+                "p90": ms(percentile(latencies, 90)),
+                "p99": ms(percentile(latencies, 99)),
+                "max": ms(latencies[-1] if latencies else None),
+            },
+        }
+
+    def summary(self, duration: float) -> dict:
+        all_errors: Dict[str, int] = {}
+        for fc in FUNCTION_CODES:
+            for kind, count in self.errors[fc].items():
+                all_errors[kind] = all_errors.get(kind, 0) + count
+        result = self._summarize([v for fc in FUNCTION_CODES for v in self.latencies[fc]], all_errors, duration)
+        result["by_fc"] = {
+            f"fc{fc}": self._summarize(self.latencies[fc], self.errors[fc], duration)
+            for fc in FUNCTION_CODES if self.latencies[fc] or self.errors[fc]
+        }
+        result["connect_failures"] = self.connect_failures
+        result["late_polls"] = self.late_polls
+        return result
+
+
+async def _request(client: AsyncModbusTcpClient, fc: int, address: int, count: int,
+                   device_id: int, rng: random.Random):
+    if fc == 1:
+        return await client.read_coils(address, count=count, device_id=device_id)
+    if fc == 3:
+        return await client.read_holding_registers(address, count=count, device_id=device_id)
+    if fc == 5:
+        return await client.write_coil(address, rng.random() < 0.5, device_id=device_id)
+    if fc == 15:
+        return await client.write_coils(address, [rng.random() < 0.5 for _ in range(count)], device_id=device_id)
+    return await client.write_registers(address, [rng.randrange(0x10000) for _ in range(count)],
+                                        device_id=device_id)
+
+
+async def _run_client(index: int, args: argparse.Namespace, stats: Stats, start: float, deadline: float):
+    rng = random.Random(args.seed * 100003 + index)
+    codes = [fc for fc, _ in args.mix]
+    weights = [weight for _, weight in args.mix]
+    device_id = args.device_ids[index % len(args.device_ids)]
+
+    client = AsyncModbusTcpClient(args.host, port=args.port, timeout=args.timeout, retries=0)
+    if not await client.connect():
+        stats.connect_failures += 1
+        return
+
+    try:
+        # Spread pollers over one interval so they do not fire in lockstep
+        next_poll = start + (rng.random() * args.interval if args.interval else 0.0)
+        while True:
+            if args.interval:
+                delay = next_poll - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if time.monotonic() >= deadline:
+                break
+
+            fc = rng.choices(codes, weights)[0]
+            t0 = time.perf_counter()
+            try:
+                response = await _request(client, fc, args.address, args.count, device_id, rng)
+                elapsed = time.perf_counter() - t0
+                if response.isError():
+                    stats.error(fc, "exception_response")
+                else:
+                    stats.latencies[fc].append(elapsed)
+            except (ModbusException, asyncio.TimeoutError, OSError) as e:
+                stats.error(fc, type(e).__name__)
+                if not client.connected:
+                    await asyncio.sleep(args.timeout)
+                    await client.connect()
+
+            if args.interval:
+                next_poll += args.interval
+                if time.monotonic() > next_poll:
+                    # Missed the next deadline; skip ahead instead of bursting
+                    stats.late_polls += 1
+                    next_poll = time.monotonic()
+    finally:
+        client.close()
+
+
+async def _run_clients(indices: List[int], args: argparse.Namespace, start: float) -> Stats:
+    stats = Stats()
+    deadline = start + args.duration
+    await asyncio.gather(*(_run_client(i, args, stats, start, deadline) for i in indices))
+    return stats
+
+
+def _run_worker(indices: List[int], args: argparse.Namespace, start_wall: float) -> Stats:
+    """Process pool entry point; start_wall aligns all processes on one start time"""
+    delay = start_wall - time.time()
+    start = time.monotonic() + max(0.0, delay)
+    return asyncio.run(_run_clients(indices, args, start))
+
+
+def run_level(clients: int, args: argparse.Namespace) -> dict:
+    """Run one load level and summarize it"""
+    processes = max(1, min(args.processes, clients))
+    # Give every process time to start before the shared start time
+    start_wall = time.time() + (0.5 if processes > 1 else 0.05)
+    shards = [list(range(p, clients, processes)) for p in range(processes)]
+
+    if processes == 1:
+        stats = _run_worker(shards[0], args, start_wall)
+    else:
+        stats = Stats()
+        with ProcessPoolExecutor(processes) as pool:
+            for part in pool.map(_run_worker, shards, [args] * processes, [start_wall] * processes):
+                stats.merge(part)
+
+    result = {"clients": clients, "duration_s": args.duration}
+    result.update(stats.summary(args.duration))
+    if args.interval:
+        target = clients / args.interval
+        p99 = result["latency_ms"]["p99"]
+        result["target_rps"] = round(target, 1)
+        result["sustained"] = (result["throughput_rps"] >= MIN_RATE_RATIO * target
+                               and p99 is not None and p99 < args.interval * 1000
+                               and result["error_rate"] < MAX_ERROR_RATE
+                               and result["connect_failures"] == 0)
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_server(port: int) -> subprocess.Popen:
+    """Start main.py (MockPLCServer) on a local port and wait until it accepts connections"""
+    # No audit file or query port: benchmark writes must not fill logs/ or clash with a running server
+    env = dict(os.environ, MODBUS_HOST="127.0.0.1", MODBUS_PORT=str(port), AUDIT_FILE="", AUDIT_PORT="0")
+    process = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")],
+                               env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Mock server exited with code {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Mock server did not start listening within 10 s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Modbus load and latency benchmark for the mock PLC")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=502)
+    parser.add_argument("--spawn", action="store_true", help="start main.py on a free local port for the run")
+    parser.add_argument("--clients", type=parse_int_list, default=[1, 10, 50, 100],
+                        help="comma-separated client counts, one load level each (default 1,10,50,100)")
+    parser.add_argument("--interval", type=float, default=0.1,
+                        help="seconds between requests per client, 0 for closed loop (default 0.1, the Nest poll)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per load level")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"weighted function codes (default {DEFAULT_MIX})")
+    parser.add_argument("--address", type=int, default=0, help="start address of every request")
+    parser.add_argument("--count", type=int, default=16, help="coils/registers per request")
+    parser.add_argument("--device-ids", type=parse_int_list, default=[0],
+                        help="unit ids, assigned to clients round-robin (default 0)")
+    parser.add_argument("--timeout", type=float, default=1.0, help="request timeout in seconds")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="client processes, so the load generator is not the bottleneck")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        args.host, args.port = "127.0.0.1", _free_port()
+        server = spawn_server(args.port)
+
+    report = {
+        "target": f"{args.host}:{args.port}",
+        "spawned_server": args.spawn,
+        "interval_s": args.interval,
+        "mix": {f"fc{fc}": weight for fc, weight in args.mix},
+        "address": args.address,
+        "count": args.count,
+        "device_ids": args.device_ids,
+        "processes": args.processes,
+        "levels": [],
+    }
+    try:
+        for clients in args.clients:
+            print(f"Running {clients} client(s) for {args.duration:.0f}s...", file=sys.stderr)
+            level = run_level(clients, args)
+            report["levels"].append(level)
+            print(f"  {level['throughput_rps']} req/s, p50 {level['latency_ms']['p50']} ms, "
+                  f"p99 {level['latency_ms']['p99']} ms, errors {level['error_rate']:.2%}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=5)
+
+    if args.interval:
+        sustained = [level["clients"] for level in report["levels"] if level.get("sustained")]
+        report["max_sustained_clients"] = max(sustained) if sustained else 0
+
+    document = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+        print(f"Report written to {args.output}", file=sys.stderr)
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+"""
+Data blocks for the mock PLC
+
+RegisterDataBlock and CoilDataBlock replace ModbusSequentialDataBlock's Python
+lists with compact storage, so full 65536-address maps for many unit ids stay
+small (128 KiB per register block, 8 KiB per coil block) and bulk updates are
+one slice assignment instead of a call per value:
+
+- registers live in an array('H'); view() exposes the block as a NumPy
+  array for vectorized simulation updates
+- coils/discrete inputs are packed 8 per byte, LSB first like on the wire
+
+Register blocks are double buffered so that related registers (the two words
+of a u32, a whole multi-register block) change together. A transaction stages
+its writes in the back buffer and publishes them by swapping the buffers:
+
+    with hr_block.transaction() as txn:
+        txn.setValues(address, [hi, lo])
+        txn.view()[addresses] = words
+
+Readers take a snapshot of the published buffer without locking and retry in
+the rare case a transaction started while they were copying, so FC3/FC4 never
+return a torn u32. Plain setValues() still writes in place (one write is
+already atomic) and is serialized against transactions.
+
+Both blocks record which address ranges were written since the last time
+they were collected (block.dirty), so the status task only has to look at
+(and print) what changed instead of re-reading every block.
+"""
+
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore.store import BaseModbusDataBlock
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Half-open [start, end) address range
+Range = Tuple[int, int]
+
+BLOCK_NAMES = {
+    "co": "Coils",
+    "di": "Discrete Inputs",
+    "hr": "Holding Registers",
+    "ir": "Input Registers",
+}
+
+# Collapse the pending list once it grows this long, so a burst of scattered
+# single writes between two reports cannot grow it without bound
+_COMPACT_AT = 4096
+
+# Past this many ranges a transaction refreshes the whole back buffer instead
+_STALE_LIMIT = 64
+
+
+def merge_ranges(ranges: List[Range]) -> List[Range]:
+    """Sort and merge overlapping or adjacent ranges"""
+    merged: List[Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def intersect_ranges(a: List[Range], b: List[Range]) -> List[Range]:
+    """Intersection of two merged (sorted, non-overlapping) range lists"""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start, end = max(a[i][0], b[j][0]), min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+class DirtyRanges:
+    """Address ranges written since the last take()"""
+
+    def __init__(self):
+        self._ranges: List[Range] = []
+
+    def add(self, start: int, end: int):
+        # Consecutive writes to the same or neighbouring addresses (the common
+        # polling/control pattern) extend the last range instead of appending
+        if self._ranges:
+            last_start, last_end = self._ranges[-1]
+            if start <= last_end and end >= last_start:
+                self._ranges[-1] = (min(start, last_start), max(end, last_end))
+                return
+        self._ranges.append((start, end))
+        if len(self._ranges) >= _COMPACT_AT:
+            self._ranges = merge_ranges(self._ranges)
+
+    def take(self) -> List[Range]:
+        """Return the merged dirty ranges and reset"""
+        ranges, self._ranges = self._ranges, []
+        return merge_ranges(ranges)
+
+    def __bool__(self):
+        return bool(self._ranges)
+
+
+def _as_registers(values):
+    """values as a buffer of unsigned 16-bit words, or None if they do not fit"""
+    try:
+        source = memoryview(values)
+        if source.format != "H":
+            raise TypeError
+        return source
+    except TypeError:
+        try:
+            return array("H", values)
+        except (OverflowError, TypeError):
+            return None
+
+
+class RegisterDataBlock(BaseModbusDataBlock):
+    """16-bit registers in a double-buffered array('H')"""
+
+    def __init__(self, address: int, count: int, values=None):
+        """
+        Initialize the block.
+
+        Args:
+            address: First block address
+            count: Number of registers
+            values: Optional initial values (shorter sequences are zero padded)
+        """
+        self.address = address
+        self.default_value = 0
+        self.values = array("H", bytes(2 * count))
+        self.dirty = DirtyRanges()
+        if values is not None:
+            self.values[:len(values)] = array("H", values)
+        self._back = array("H", self.values)
+        # Offset ranges where the back buffer may differ from the published one
+        # (None: anywhere); the next transaction refreshes only these
+        self._stale: Optional[List[Range]] = []
+        # Bumped when a transaction starts and when it publishes; readers retry if it moved
+        self._generation = 0
+        self._write_lock = threading.RLock()
+        self._transaction = None
+
+    def reset(self):
+        with self._write_lock:
+            self.values[:] = array("H", bytes(2 * len(self.values)))
+            if self._transaction is not None:
+                self._back[:] = self.values
+            else:
+                self._stale = None
+            self.dirty.add(self.address, self.address + len(self.values))
+
+    def getValues(self, address, count=1):
+        """Snapshot of count registers from the published buffer"""
+        start = address - self.address
+        if start < 0 or len(self.values) < start + count:
+            return ExcCodes.ILLEGAL_ADDRESS
+        while True:
+            generation = self._generation
+            snapshot = self.values[start:start + count]
+            if generation == self._generation:
+                return snapshot
+
+    def setValues(self, address, values):
+        """Set registers from a list, array('H') or uint16 NumPy array"""
+        if isinstance(values, int):
+            values = [values]
+        start = address - self.address
+        if start < 0 or len(self.values) < start + len(values):
+            return ExcCodes.ILLEGAL_ADDRESS
+        source = _as_registers(values)
+        if source is None:
+            return ExcCodes.ILLEGAL_VALUE
+        with self._write_lock:
+            memoryview(self.values)[start:start + len(values)] = source
+            if self._transaction is not None:
+                # Keep a transaction opened on this thread from publishing over it
+                memoryview(self._back)[start:start + len(values)] = source
+            else:
+                self._mark_stale(start, start + len(values))
+            self.dirty.add(address, address + len(values))
+        return None
+
+    def transaction(self) -> "RegisterTransaction":
+        """Context manager that stages writes and publishes them together on exit"""
+        return RegisterTransaction(self)
+
+    def view(self):
+        """
+        The published buffer as a writable uint16 NumPy array sharing its memory.
+
+        The buffer changes with every transaction, so do not keep the view
+        across one; for updates use transaction().view(), which is published
+        atomically. Writes through this view bypass setValues; call
+        mark_dirty() for the written range so the status output sees them
+        and the next transaction does not publish the old values over them.
+        """
+        if numpy is None:
+            raise RuntimeError("numpy is required for RegisterDataBlock.view()")
+        return numpy.frombuffer(self.values, dtype=numpy.uint16)
+
+    def mark_dirty(self, address: int, count: int):
+        with self._write_lock:
+            if self._transaction is None:
+                self._mark_stale(address - self.address, address - self.address + count)
+            self.dirty.add(address, address + count)
+
+    def _mark_stale(self, start: int, end: int):
+        """Record a front-buffer write the back buffer has not seen (call with the write lock held)"""
+        if self._stale is not None:
+            self._stale.append((start, end))
+            if len(self._stale) > _STALE_LIMIT:
+                self._stale = merge_ranges(self._stale)
+                if len(self._stale) > _STALE_LIMIT:
+                    self._stale = None
+
+    def _refresh_back(self):
+        """Bring the back buffer up to date with the published one"""
+        if self._stale is None:
+            self._back[:] = self.values
+        else:
+            for start, end in merge_ranges(self._stale):
+                self._back[start:end] = self.values[start:end]
+        self._stale = []
+
+
+class RegisterTransaction:
+    """Writes to a RegisterDataBlock that become visible all at once"""
+
+    def __init__(self, block: RegisterDataBlock):
+        self.block = block
+        self._ranges: List[Range] = []
+
+    def __enter__(self):
+        block = self.block
+        block._write_lock.acquire()
+        if block._transaction is not None:
+            block._write_lock.release()
+            raise RuntimeError("RegisterDataBlock transactions do not nest")
+        block._transaction = self
+        block._generation += 1
+        # The back buffer may hold an old snapshot that a slow reader is still copying;
+        # the generation bump above makes that reader retry. Only the ranges the last
+        # publish (or a plain write since) changed differ, so only those are copied.
+        block._refresh_back()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        block = self.block
+        try:
+            if exc_type is None:
+                block.values, block._back = block._back, block.values
+                for start, end in self._ranges:
+                    block.dirty.add(start, end)
+            # Published or rolled back, the buffers now differ where this transaction wrote
+            block._stale = []
+            for start, end in self._ranges:
+                block._mark_stale(start - block.address, end - block.address)
+            block._generation += 1
+        finally:
+            block._transaction = None
+            block._write_lock.release()
+        return False
+
+    def setValues(self, address, values):
+        """Stage registers; same arguments and errors as RegisterDataBlock.setValues"""
+        if isinstance(values, int):
+            values = [values]
+        start = address - self.block.address
+        if start < 0 or len(self.block._back) < start + len(values):
+            return ExcCodes.ILLEGAL_ADDRESS
+        source = _as_registers(values)
+        if source is None:
+            return ExcCodes.ILLEGAL_VALUE
+        memoryview(self.block._back)[start:start + len(values)] = source
+        self._ranges.append((address, address + len(values)))
+        return None
+
+    def view(self):
+        """
+        The staged buffer as a writable uint16 NumPy array. Call mark_dirty()
+        for everything you change: unmarked writes are published but not
+        carried into the next transaction.
+        """
+        if numpy is None:
+            raise RuntimeError("numpy is required for RegisterTransaction.view()")
+        return numpy.frombuffer(self.block._back, dtype=numpy.uint16)
+
+    def mark_dirty(self, address: int, count: int):
+        self._ranges.append((address, address + count))
+
+
+class CoilDataBlock(BaseModbusDataBlock):
+    """Bits packed 8 per byte, LSB first (the Modbus wire order)"""
+
+    # Below this many bits the per-bit loop beats the NumPy round trip
+    _VECTOR_MIN = 64
+
+    def __init__(self, address: int, count: int, values=None):
+        """
+        Initialize the block.
+
+        Args:
+            address: First block address
+            count: Number of bits
+            values: Optional initial values (shorter sequences are zero padded)
+        """
+        self.address = address
+        self.default_value = False
+        self.count = count
+        self.bits = bytearray((count + 7) // 8)
+        self.dirty = DirtyRanges()
+        if values is not None:
+            self.setValues(address, list(values))
+
+    @property
+    def values(self):
+        # BaseModbusDataBlock's __str__/__iter__ expect a sequence of values
+        return self.getValues(self.address, self.count)
+
+    def reset(self):
+        self.bits[:] = bytes(len(self.bits))
+        self.dirty.add(self.address, self.address + self.count)
+
+    def getValues(self, address, count=1):
+        start = address - self.address
+        if start < 0 or self.count < start + count:
+            return ExcCodes.ILLEGAL_ADDRESS
+        if numpy is not None and count >= self._VECTOR_MIN:
+            first, last = start >> 3, (start + count + 7) >> 3
+            unpacked = numpy.unpackbits(numpy.frombuffer(self.bits, dtype=numpy.uint8, count=last - first,
+                                                         offset=first), bitorder="little")
+            offset = start & 7
+            return unpacked[offset:offset + count].astype(bool).tolist()
+        bits = self.bits
+        return [bool(bits[i >> 3] >> (i & 7) & 1) for i in range(start, start + count)]
+
+    def setValues(self, address, values):
+        """Set bits from a list of bools/ints or a NumPy array"""
+        if isinstance(values, (bool, int)):
+            values = [values]
+        count = len(values)
+        start = address - self.address
+        if start < 0 or self.count < start + count:
+            return ExcCodes.ILLEGAL_ADDRESS
+
+        bits = self.bits
+        if numpy is not None and count >= self._VECTOR_MIN:
+            first, last = start >> 3, (start + count + 7) >> 3
+            window = numpy.frombuffer(bits, dtype=numpy.uint8, count=last - first, offset=first)
+            unpacked = numpy.unpackbits(window, bitorder="little")
+            offset = start & 7
+            unpacked[offset:offset + count] = numpy.asarray(values, dtype=bool)
+            bits[first:last] = numpy.packbits(unpacked, bitorder="little").tobytes()
+        else:
+            for i, value in enumerate(values, start):
+                if value:
+                    bits[i >> 3] |= 1 << (i & 7)
+                else:
+                    bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+        self.dirty.add(address, address + count)
+        return None
+
+
+def parse_watch_ranges(spec: str) -> Dict[str, List[Range]]:
+    """
+    Parse a watch list such as "co:0-15,hr:0-99,hr:200" into merged ranges per block.
+
+    Addresses are inclusive in the spec and half-open in the result.
+    """
+    ranges: Dict[str, List[Range]] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        block, _, addresses = item.partition(":")
+        block = block.strip().lower()
+        if block not in BLOCK_NAMES:
+            raise ValueError(f"Unknown block '{block}' in watch range '{item}' (expected one of {', '.join(BLOCK_NAMES)})")
+        first, _, last = addresses.partition("-")
+        start = int(first)
+        end = int(last or first) + 1
+        if start < 0 or end <= start:
+            raise ValueError(f"Invalid address range in watch range '{item}'")
+        ranges.setdefault(block, []).append((start, end))
+    return {block: merge_ranges(block_ranges) for block, block_ranges in ranges.items()}
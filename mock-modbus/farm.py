@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+"""
+PLC farm for the mock PLC
+
+Serves many simulated devices from one process, either as unit ids on one
+port or with one port per device, so the Nest ModbusService polling path can
+be load-tested at production-like device counts on one machine. Devices,
+their register maps and their simulation profiles come from a JSON config
+(see farm.example.json):
+
+    {
+      "host": "0.0.0.0", "port": 502, "port_per_device": false, "tick": 0.1, "seed": null,
+      "profiles": {
+        "pavilion": {
+          "block_size": 64,
+          "map": {"heat_status": "co:0", "heat_set": "co:16"},
+          "initial": {"hr:0": [1, 2, 3]},
+          "signals": [
+            {"type": "edge_toggle", "source": "heat_set", "target": "heat_status", "count": 8},
+            {"type": "auto_off", "target": "heat_status", "after": 600}
+          ]
+        }
+      },
+      "devices": [{"unit": 1, "count": 50, "profile": "pavilion"}]
+    }
+
+Addresses are "<block>:<address>" (blocks co, di, hr, ir) or names from the
+profile's map. Signal types:
+- sine         count channels between min and max, period seconds, phase_step rad apart
+- counter      adds rate per second; width 16 or 32 (32 spans two registers, word_order big|little)
+- random       count channels of random integers in [min, max]
+- edge_toggle  a rising edge written to source+i toggles target+i (Nest's 100 ms pulses)
+- auto_off     target+i switches off after seconds on
+
+sine, counter and random target hr/ir registers and run as channels of one
+SimEngine for the whole farm (every: update period, default one tick), so the
+per-tick cost is a few vectorized operations rather than a Python call per
+signal per device. edge_toggle runs on client writes and auto_off on the same
+scheduler as an engine hook.
+
+Usage:
+    python farm.py farm.json
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from pymodbus import ModbusDeviceIdentification
+from pymodbus.constants import ExcCodes
+from pymodbus.datastore import ModbusServerContext
+from pymodbus.framer import FramerType
+
+import audit
+from datastore import BLOCK_NAMES, CoilDataBlock, RegisterDataBlock
+from main import LoggingDeviceContext
+from sim_engine import SimEngine
+
+logger = logging.getLogger(__name__)
+
+# Function codes that write each block
+_WRITE_BLOCKS = {5: "co", 15: "co", 6: "hr", 16: "hr"}
+
+
+def parse_address(ref, names: Dict[str, str]) -> Tuple[str, int]:
+    """Resolve "hr:8" or a map name to (block key, protocol address)"""
+    ref = names.get(ref, ref)
+    block, _, address = str(ref).partition(":")
+    if block not in BLOCK_NAMES or not address:
+        raise ValueError(f"Invalid address '{ref}' (expected <{'|'.join(BLOCK_NAMES)}>:<address> or a map name)")
+    return block, int(address, 0)
+
+
+class Signal:
+    """A simulated behaviour of one device; attach() registers it on the farm's engine, on_write() runs on client writes"""
+
+    def __init__(self, config: dict, names: Dict[str, str]):
+        self.block, self.address = parse_address(config["target"], names)
+        self.count = int(config.get("count", 1))
+        self.every = config.get("every")
+
+    def attach(self, device: "Device", engine: SimEngine):
+        pass
+
+    def on_write(self, device: "Device", block: str, address: int, values):
+        pass
+
+
+class GeneratorSignal(Signal):
+    """Signal evaluated by the engine as register channels"""
+
+    def __init__(self, config, names):
+        super().__init__(config, names)
+        if self.block not in ("hr", "ir"):
+            raise ValueError(f"{config['type']} signal must target hr or ir registers, not '{config['target']}'")
+
+
+class SineSignal(GeneratorSignal):
+    def __init__(self, config, names):
+        super().__init__(config, names)
+        self.low, self.high = float(config["min"]), float(config["max"])
+        self.period = float(config.get("period", 1.0))
+        self.phase_step = float(config.get("phase_step", 0.0))
+
+    def attach(self, device, engine):
+        engine.add_sine(device.blocks[self.block], range(self.address, self.address + self.count), self.low,
+                        self.high, frequency=1 / self.period, phases=[i * self.phase_step for i in range(self.count)],
+                        every=self.every)
+
+
+class CounterSignal(GeneratorSignal):
+    def __init__(self, config, names):
+        super().__init__(config, names)
+        self.rate = float(config.get("rate", 1.0))
+        self.width = int(config.get("width", 16))
+        if self.width not in (16, 32):
+            raise ValueError("counter width must be 16 or 32")
+        self.big_endian = config.get("word_order", "big") == "big"
+
+    def attach(self, device, engine):
+        every = self.every or engine.tick
+        if self.width == 16:
+            addresses = [self.address]
+        else:
+            addresses = [(self.address, self.address + 1) if self.big_endian else (self.address + 1, self.address)]
+        engine.add_counter(device.blocks[self.block], addresses, step=round(self.rate * every), every=every,
+                           width=self.width)
+
+
+class RandomSignal(GeneratorSignal):
+    def __init__(self, config, names):
+        super().__init__(config, names)
+        self.low, self.high = int(config["min"]), int(config["max"])
+
+    def attach(self, device, engine):
+        engine.add_random(device.blocks[self.block], range(self.address, self.address + self.count), self.low,
+                          self.high, every=self.every)
+
+
+class EdgeToggleSignal(Signal):
+    def __init__(self, config, names):
+        super().__init__(config, names)
+        self.source_block, self.source = parse_address(config["source"], names)
+
+    def on_write(self, device, block, address, values):
+        if block != self.source_block:
+            return
+        for i, value in enumerate(values):
+            index = address + i - self.source
+            if 0 <= index < self.count and value and not device.previous(block, address + i):
+                current = device.read(self.block, self.address + index, 1)[0]
+                device.write(self.block, self.address + index, [not current])
+
+
+class AutoOffSignal(Signal):
+    def __init__(self, config, names):
+        super().__init__(config, names)
+        self.after = float(config["after"])
+        self._on_since: List[Optional[float]] = [None] * self.count
+
+    def attach(self, device, engine):
+        engine.add_hook(lambda t: self.tick(device, t), every=self.every)
+
+    def tick(self, device, t):
+        for i, value in enumerate(device.read(self.block, self.address, self.count)):
+            if not value:
+                self._on_since[i] = None
+            elif self._on_since[i] is None:
+                self._on_since[i] = t
+            elif t - self._on_since[i] >= self.after:
+                device.write(self.block, self.address + i, [False])
+                self._on_since[i] = None
+
+
+SIGNAL_TYPES = {
+    "sine": SineSignal,
+    "counter": CounterSignal,
+    "random": RandomSignal,
+    "edge_toggle": EdgeToggleSignal,
+    "auto_off": AutoOffSignal,
+}
+
+
+class FarmDeviceContext(LoggingDeviceContext):
+    """Device context that runs write-triggered signals right after client writes"""
+
+    def __init__(self, *args, device: "Device", **kwargs):
+        super().__init__(*args, **kwargs)
+        self.device = device
+
+    def setValues(self, fc_as_hex, address, values):
+        block = _WRITE_BLOCKS.get(fc_as_hex)
+        if block is None:
+            return super().setValues(fc_as_hex, address, values)
+        # Keep what was there for edge detection
+        before = self.device.read(block, address, len(values))
+        self.device.last_write = (block, address, [] if isinstance(before, ExcCodes) else list(before))
+        result = super().setValues(fc_as_hex, address, values)
+        if result is None:
+            self.device.on_write(block, address, values)
+        return result
+
+
+class Device:
+    """One simulated PLC: its data blocks, context and signals"""
+
+    def __init__(self, unit: int, profile_name: str, profile: dict, audit_log: audit.WriteAudit,
+                 port: Optional[int] = None):
+        self.unit = unit
+        self.port = port
+        self.profile = profile_name
+        size = int(profile.get("block_size", 1000))
+        names = profile.get("map", {})
+
+        # One extra slot: ModbusDeviceContext addresses blocks from 1
+        self.blocks = {
+            "di": CoilDataBlock(0, size + 1),
+            "co": CoilDataBlock(0, size + 1),
+            "hr": RegisterDataBlock(0, size + 1),
+            "ir": RegisterDataBlock(0, size + 1),
+        }
+        self.context = FarmDeviceContext(**self.blocks, audit=audit_log, device=self)
+        self.last_write: Tuple[str, int, list] = ("", 0, [])
+
+        for ref, values in profile.get("initial", {}).items():
+            block, address = parse_address(ref, names)
+            self.write(block, address, values if isinstance(values, list) else [values])
+        self.signals = [SIGNAL_TYPES[signal["type"]](signal, names) for signal in profile.get("signals", [])]
+
+    def read(self, block: str, address: int, count: int):
+        return self.blocks[block].getValues(address + 1, count)
+
+    def write(self, block: str, address: int, values):
+        return self.blocks[block].setValues(address + 1, values)
+
+    def previous(self, block: str, address: int):
+        """Value before the client write being handled"""
+        last_block, start, values = self.last_write
+        if last_block == block and 0 <= address - start < len(values):
+            return values[address - start]
+        return None
+
+    def on_write(self, block: str, address: int, values):
+        for signal in self.signals:
+            signal.on_write(self, block, address, values)
+
+    def attach(self, engine: SimEngine):
+        for signal in self.signals:
+            signal.attach(self, engine)
+
+
+def load_devices(config: dict, audit_log: audit.WriteAudit) -> List[Device]:
+    """Expand the config's device entries into Device objects"""
+    profiles = config.get("profiles", {})
+    port = int(config.get("port", 502))
+    port_per_device = bool(config.get("port_per_device", False))
+
+    devices = []
+    units = set()
+    for entry in config["devices"]:
+        if entry["profile"] not in profiles:
+            raise ValueError(f"Unknown profile '{entry['profile']}' for unit {entry['unit']}")
+        first = int(entry["unit"])
+        for unit in range(first, first + int(entry.get("count", 1))):
+            if not port_per_device and (unit in units or not 0 <= unit <= 247):
+                raise ValueError(f"Unit id {unit} is duplicated or outside 0-247")
+            units.add(unit)
+            device_port = port + len(devices) if port_per_device else port
+            devices.append(Device(unit, entry["profile"], profiles[entry["profile"]], audit_log, device_port))
+    return devices
+
+
+def _format_units(units: List[int]) -> str:
+    """Compact unit id listing, e.g. [1, 2, 3, 7] -> '1-3, 7'"""
+    spans = []
+    for unit in units:
+        if spans and unit == spans[-1][1] + 1:
+            spans[-1][1] = unit
+        else:
+            spans.append([unit, unit])
+    return ", ".join(f"{a}-{b}" if a != b else f"{a}" for a, b in spans)
+
+
+class PLCFarm:
+    def __init__(self, config: dict):
+        self.host = config.get("host", "0.0.0.0")
+        self.audit = audit.from_env()
+        self.devices = load_devices(config, self.audit)
+        self.engine = SimEngine(tick=float(config.get("tick", 0.1)), seed=config.get("seed"))
+        for device in self.devices:
+            device.attach(self.engine)
+
+        # Group devices per port; each port gets one server context
+        self.ports: Dict[int, Dict[int, FarmDeviceContext]] = {}
+        for device in self.devices:
+            self.ports.setdefault(device.port, {})[device.unit] = device.context
+
+    async def print_status(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            engine = self.engine.stats()
+            logger.info(f"Farm: {len(self.devices)} devices on {len(self.ports)} port(s), "
+                        f"{engine['channels']} channels, {engine['ticks']} ticks ({engine['missed_ticks']} missed, "
+                        f"{engine['mean_tick_us']} us/tick), {self.audit.stats()['recorded']} writes")
+
+    async def start(self):
+        identity = ModbusDeviceIdentification()
+        identity.VendorName = 'Mock PLC'
+        identity.ProductCode = 'MockFarm'
+        identity.ProductName = 'Mock Modbus PLC Farm'
+        identity.ModelName = 'Farm'
+        identity.MajorMinorRevision = '1.0'
+
+        profiles = {}
+        for device in self.devices:
+            profiles[device.profile] = profiles.get(device.profile, 0) + 1
+        logger.info(f"Starting PLC farm: {len(self.devices)} devices "
+                    f"({', '.join(f'{count} x {name}' for name, count in profiles.items())})")
+        for port, contexts in self.ports.items():
+            logger.info(f"  {self.host}:{port} -> unit id(s) {_format_units(sorted(contexts))}")
+
+        servers = [
+            audit.AuditTcpServer(
+                context=ModbusServerContext(devices=contexts, single=False),
+                identity=identity,
+                address=(self.host, port),
+                framer=FramerType.SOCKET
+            )
+            for port, contexts in self.ports.items()
+        ]
+        tasks = [
+            asyncio.create_task(self.engine.run()),
+            asyncio.create_task(self.print_status(float(os.getenv('STATUS_INTERVAL', '10')))),
+            asyncio.create_task(self.audit.run()),
+        ]
+        audit_port = int(os.getenv('AUDIT_PORT', '8502'))
+        audit_server = await self.audit.serve(os.getenv('AUDIT_HOST', '127.0.0.1'), audit_port) if audit_port > 0 else None
+
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in servers))
+        finally:
+            if audit_server is not None:
+                audit_server.close()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv('FARM_CONFIG', 'farm.json')
+    with open(path) as f:
+        config = json.load(f)
+    # Environment overrides, like main.py
+    config['host'] = os.getenv('MODBUS_HOST', config.get('host', '0.0.0.0'))
+    if os.getenv('MODBUS_PORT'):
+        config['port'] = int(os.getenv('MODBUS_PORT'))
+    await PLCFarm(config).start()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 """
 Basic Modbus TCP Server
-Simple Modbus server with 2-second status printing
+Simple Modbus server with periodic status change printing
 """
 
 import logging
 import asyncio
+import os
 from datetime import datetime
 
 import sys
@@ -19,10 +20,13 @@ if sys.version_info < (3, 11) or pymodbus.__version__ < "3.11":
     sys.exit(1)
 
 from pymodbus import ModbusDeviceIdentification
-from pymodbus.server import StartAsyncTcpServer
-from pymodbus.datastore import ModbusSequentialDataBlock, ModbusServerContext, ModbusDeviceContext
+from pymodbus.datastore import ModbusServerContext, ModbusDeviceContext
+from pymodbus.constants import ExcCodes
 from pymodbus.framer import FramerType
 
+import audit
+from datastore import BLOCK_NAMES, CoilDataBlock, RegisterDataBlock, intersect_ranges, parse_watch_ranges
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -30,72 +34,113 @@ logger = logging.getLogger(__name__)
 # Reduce noise from frequent polling operations
 logging.getLogger('pymodbus').setLevel(logging.WARNING)
 
+# Addresses per data block (up to 65536; blocks are packed, so full maps stay cheap)
+BLOCK_SIZE = int(os.getenv('MODBUS_BLOCK_SIZE', '1000'))
+
+# Status reporting: address ranges to watch ("co:0-15,hr:0-99"), report period,
+# and how many changed values to list per block in one report
+STATUS_WATCH = os.getenv('STATUS_WATCH', 'co:0-15,di:0-15,hr:0-15,ir:0-15')
+STATUS_INTERVAL = float(os.getenv('STATUS_INTERVAL', '2'))
+STATUS_MAX_CHANGES = int(os.getenv('STATUS_MAX_CHANGES', '32'))
+
 
 class LoggingDeviceContext(ModbusDeviceContext):
-    """Custom device context that logs all write operations"""
-    
+    """Custom device context that records all write operations in the audit log"""
+
+    def __init__(self, *args, audit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.audit = audit
+
     def setValues(self, fc_as_hex, address, values):
-        """Override setValues to log write operations"""
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        
-        # Map function codes to names
-        fc_names = {
-            5: "Write Single Coil",
-            6: "Write Single Register",
-            15: "Write Multiple Coils",
-            16: "Write Multiple Registers"
-        }
-        
-        fc_name = fc_names.get(fc_as_hex, f"Unknown FC({fc_as_hex})")
-        
-        # Log the write operation
-        logger.info(f"[{timestamp}] WRITE - {fc_name}: Address={address}, Values={values}")
-        
+        """Override setValues to record write operations (no I/O in the request path)"""
+        if self.audit is not None:
+            self.audit.record(fc_as_hex, address, values)
+
         # Call parent to perform the actual write
         return super().setValues(fc_as_hex, address, values)
 
 
 class MockPLCServer:
     def __init__(self):
+        # Write audit log, flushed and queried off the request path
+        self.audit = audit.from_env()
+
         # Create basic Modbus data store
         self.setup_modbus_datastore()
+        self.watch_ranges = parse_watch_ranges(STATUS_WATCH)
         
         # Task for periodic status printing
         self.status_task = None
     
     def setup_modbus_datastore(self):
         """Setup basic Modbus data store"""
-        # Create data blocks with 1000 registers/coils
-        self.store = LoggingDeviceContext(
-            di=ModbusSequentialDataBlock(0, [0] * 1000),  # Discrete Inputs
-            co=ModbusSequentialDataBlock(0, [0] * 1000),  # Coils
-            hr=ModbusSequentialDataBlock(0, [0] * 1000),  # Holding Registers
-            ir=ModbusSequentialDataBlock(0, [0] * 1000)   # Input Registers
-        )
+        # Create data blocks with BLOCK_SIZE registers/coils (one extra slot, since
+        # ModbusDeviceContext addresses blocks from 1); writes are tracked so the
+        # status task only looks at what changed
+        self.blocks = {
+            'di': CoilDataBlock(0, BLOCK_SIZE + 1),  # Discrete Inputs
+            'co': CoilDataBlock(0, BLOCK_SIZE + 1),  # Coils
+            'hr': RegisterDataBlock(0, BLOCK_SIZE + 1),  # Holding Registers
+            'ir': RegisterDataBlock(0, BLOCK_SIZE + 1),  # Input Registers
+        }
+        self.store = LoggingDeviceContext(**self.blocks, audit=self.audit)
 
         # Create server context
         self.context = ModbusServerContext(devices=self.store, single=True)
         self.slave_id = 0x00
-    
+
     async def print_status(self):
-        """Print current Modbus status every 2 seconds"""
+        """Print the watched ranges once, then only the values that changed"""
+        # Data blocks are addressed one above the protocol address (ModbusDeviceContext adds 1)
+        watched = {key: [(start + 1, end + 1) for start, end in ranges] for key, ranges in self.watch_ranges.items()}
+        snapshots = {}
+
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        print(f"\n[{timestamp}] Modbus Status:")
+        for key, ranges in watched.items():
+            for start, end in ranges:
+                values = self.blocks[key].getValues(start, end - start)
+                if isinstance(values, ExcCodes):
+                    print(f"  {BLOCK_NAMES[key]} ({start - 1}-{end - 2}): outside the data block")
+                    continue
+                # getValues is already a snapshot; ints print as a plain list (not array(...))
+                snapshots[(key, start)] = [int(v) for v in values]
+                print(f"  {BLOCK_NAMES[key]} ({start - 1}-{end - 2}): {snapshots[(key, start)]}")
+        for block in self.blocks.values():
+            block.dirty.take()
+
         while True:
-            await asyncio.sleep(2)
-            
-            # Read current values from all data blocks
-            coils = self.context[self.slave_id].getValues(1, 0, 1000)  # FC 1 = Read Coils
-            discrete_inputs = self.context[self.slave_id].getValues(2, 0, 1000)  # FC 2 = Read Discrete Inputs
-            holding_registers = self.context[self.slave_id].getValues(3, 0, 1000)  # FC 3 = Read Holding Registers
-            input_registers = self.context[self.slave_id].getValues(4, 0, 1000)  # FC 4 = Read Input Registers
-            
-            # Print first 16 values from each block as sample
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            print(f"\n[{timestamp}] Modbus Status:")
-            print(f"  Coils (0-15): {coils[:16] if len(coils) >= 16 else coils}")
-            print(f"  Discrete Inputs (0-15): {discrete_inputs[:16] if len(discrete_inputs) >= 16 else discrete_inputs}")
-            print(f"  Holding Registers (0-15): {holding_registers[:16] if len(holding_registers) >= 16 else holding_registers}")
-            print(f"  Input Registers (0-15): {input_registers[:16] if len(input_registers) >= 16 else input_registers}")
-    
+            await asyncio.sleep(STATUS_INTERVAL)
+
+            lines = []
+            for key, block in self.blocks.items():
+                if not block.dirty:
+                    continue
+                dirty = block.dirty.take()
+
+                # Only the dirty parts of watched ranges are read and compared
+                changes = []
+                for start, end in watched.get(key, ()):
+                    snapshot = snapshots.get((key, start))
+                    if snapshot is None:
+                        continue
+                    for changed_start, changed_end in intersect_ranges(dirty, [(start, end)]):
+                        values = block.getValues(changed_start, changed_end - changed_start)
+                        for offset, value in enumerate(values, changed_start - start):
+                            if snapshot[offset] != value:
+                                changes.append(f"{start + offset - 1}: {int(snapshot[offset])} -> {int(value)}")
+                                snapshot[offset] = value
+
+                if changes:
+                    if len(changes) > STATUS_MAX_CHANGES:
+                        changes[STATUS_MAX_CHANGES:] = [f"... (+{len(changes) - STATUS_MAX_CHANGES} more)"]
+                    lines.append(f"  {BLOCK_NAMES[key]}: {', '.join(changes)}")
+
+            if lines:
+                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                print(f"\n[{timestamp}] Modbus Status changes:")
+                print("\n".join(lines))
+
     async def start_server(self, host='0.0.0.0', port=502):
         """Start Modbus TCP server"""
         # Device identification
@@ -110,33 +155,42 @@ class MockPLCServer:
         logger.info(f"Starting Basic Modbus TCP Server on {host}:{port}")
         logger.info("=" * 80)
         logger.info("Modbus Address Map:")
-        logger.info("  Coils: 0-999")
-        logger.info("  Discrete Inputs: 0-999")
-        logger.info("  Holding Registers: 0-999")
-        logger.info("  Input Registers: 0-999")
+        logger.info(f"  Coils: 0-{BLOCK_SIZE - 1}")
+        logger.info(f"  Discrete Inputs: 0-{BLOCK_SIZE - 1}")
+        logger.info(f"  Holding Registers: 0-{BLOCK_SIZE - 1}")
+        logger.info(f"  Input Registers: 0-{BLOCK_SIZE - 1}")
         logger.info("=" * 80)
-        logger.info("Status will be printed every 2 seconds...")
+        logger.info(f"Status changes will be printed every {STATUS_INTERVAL:g} seconds (watching {STATUS_WATCH})...")
         logger.info("Server is ready to accept connections...")
 
-        # Start status printing task
+        # Start status printing and audit flushing tasks
         self.status_task = asyncio.create_task(self.print_status())
+        audit_task = asyncio.create_task(self.audit.run())
+        audit_port = int(os.getenv('AUDIT_PORT', '8502'))
+        audit_server = await self.audit.serve(os.getenv('AUDIT_HOST', '127.0.0.1'), audit_port) if audit_port > 0 else None
 
         try:
-            await StartAsyncTcpServer(
+            server = audit.AuditTcpServer(
                 context=self.context,
                 identity=identity,
                 address=(host, port),
                 framer=FramerType.SOCKET
             )
+            await server.serve_forever()
         except Exception as e:
             logger.error(f"Error starting server: {e}")
             raise
+        finally:
+            if audit_server is not None:
+                audit_server.close()
+            audit_task.cancel()
+            await asyncio.gather(audit_task, return_exceptions=True)
 
 
 async def main():
     """Main function"""
     server = MockPLCServer()
-    await server.start_server()
+    await server.start_server(os.getenv('MODBUS_HOST', '0.0.0.0'), int(os.getenv('MODBUS_PORT', '502')))
 
 
 if __name__ == "__main__":
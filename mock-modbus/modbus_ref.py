@@ -1,23 +1,35 @@
 """
 Modbus TCP Sensor Simulator (Py 3.11+ / 3.13 OK)
 - pymodbus 3.10+ API (ModbusDeviceContext/devices=) 사용
-- qasync로 asyncio + PyQt5 이벤트루프 통합
 - AddressMap을 그대로 반영, 0-based Modbus 주소
-- 10 Hz(0.1s) 주기 업데이트
+- sim_engine 단일 10ms 틱 스케줄러 (채널별 10ms/0.1s/1s 갱신)
+- GUI(modbus_ref_gui.py, PyQt5/qasync) 또는 headless(asyncio, uvloop 있으면 사용)
+- 제어는 GUI 대신 로컬 제어 소켓 + CLI로도 가능
+
+Usage:
+    python modbus_ref.py                    # GUI (PyQt5나 디스플레이 없으면 headless)
+    python modbus_ref.py --headless         # 컨테이너/CI
+    python modbus_ref.py status             # 실행 중인 시뮬레이터에 제어 명령
+    python modbus_ref.py set PLC_RUN 1
+    python modbus_ref.py pulse PB_START 150
 """
 
-import math
-import random
+import argparse
 import asyncio
-from typing import Dict, Tuple
-
-from PyQt5 import QtWidgets, QtCore
-from qasync import QEventLoop, asyncSlot
+import json
+import logging
+import math
+import os
+import signal
+import sys
+from typing import Dict, List, Optional, Set
 
 from pymodbus.server import StartAsyncTcpServer
-from pymodbus.datastore import (
-    ModbusServerContext, ModbusDeviceContext, ModbusSequentialDataBlock
-)
+from pymodbus.datastore import ModbusServerContext, ModbusDeviceContext
+
+from datastore import CoilDataBlock, RegisterDataBlock
+from register_map import Field, RegisterMap
+from sim_engine import SimEngine
 try:
     # 신버전 경로
     from pymodbus import ModbusDeviceIdentification
@@ -25,339 +37,196 @@ except Exception:  # pragma: no cover
     from pymodbus.device import ModbusDeviceIdentification  # 구버전 호환
 
 # =========================
-# Address Map (0-based)
+# Address Map (0-based) — register_map.json
 # =========================
+REGMAP = RegisterMap.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), "register_map.json"))
 # BIT(Coils)
-COILS: Dict[str, int] = {
-    # 모니터링
-    "RESET_DEVICE":     0x00000,
-    "DEVICE_RDY":       0x00001,
-    "INIT_CURSOR_DONE": 0x00002,
-    # 제어
-    "IS_RUNNING_SIGNAL":0x00003,
-
-    # 변위센서/엔코더 health
-    "LV1_OK":0x00005, "LV2_OK":0x00006, "LV3_OK":0x00007,
-    "LV4_OK":0x00008, "LV5_OK":0x00009, "LV6_OK":0x0000A,
-    "ENC1_OK":0x0000B, "ENC2_OK":0x0000C, "ENC3_OK":0x0000D,
-
-    # GUI 제어 (RUN/STOP/ERR)
-    "PLC_RUN":  0x00013,
-    "PLC_STOP": 0x00014,
-    "PLC_ERR":  0x00015,
-
-    # 입력/버튼
-    "SW_START": 0x0001C,
-    "SW_STOP":  0x0001D,
-    "SW_RESET": 0x0001E,
-    "PB_START": 0x00000,  # PB는 예시로 P영역을 코일로 맵핑
-    "PB_STOP":  0x00001,
-}
-
-# WORD(Holding Registers)
-HREGS: Dict[str, int] = {
-    "LV1":0, "LV2":1, "LV3":2,
-    "LV4":3, "LV5":4, "LV6":5,
-
-    "ENC1_H":9, "ENC1_L":8,
-    "ENC2_H":11, "ENC2_L":10,
-    "ENC3_H":13, "ENC3_L":12,
-
-    "ENC_MEAN_H":22, "ENC_MEAN_L":23,
-
-    "LGAP_IDX":36, "LGAP_STEPSIZE":39, "LGAP_STEP_POS_H": 37, "LGAP_STEP_POS_L": 38,
-    "RGAP_IDX":41, "RGAP_STEPSIZE":44, "RGAP_STEP_POS_H": 42, "RGAP_STEP_POS_L": 43,
-}
+COILS: Dict[str, int] = REGMAP.coils
+# WORD(Holding Registers): 타입 있는 필드 (u16/u32 ...)
+FIELDS: Dict[str, Field] = REGMAP.fields
+# 시뮬 엔진이 매 틱 덮어쓰는 필드 (build_engine에서 채움) — 제어 소켓 set 불가
+SIMULATED_FIELDS: Set[str] = set()
 
 # =========================
 # Modbus Datastore
 # =========================
+hr_block = RegisterDataBlock(0, 0x0500)
 device = ModbusDeviceContext(
-    di=ModbusSequentialDataBlock(0, [0]*0x0500),
-    co=ModbusSequentialDataBlock(0, [0]*0x0500),
-    hr=ModbusSequentialDataBlock(0, [0]*0x0500),
-    ir=ModbusSequentialDataBlock(0, [0]*0x0500),
+    di=CoilDataBlock(0, 0x0500),
+    co=CoilDataBlock(0, 0x0500),
+    hr=hr_block,
+    ir=RegisterDataBlock(0, 0x0500),
 )
 context = ModbusServerContext(devices=device, single=True)
 SLAVE_ID = 0x00  # single=True 권장 ID
 
+logger = logging.getLogger("modbus_ref")
+
 # --- helpers (추가) ---
 def _run_enabled() -> bool:
     """러닝 조건: (IS_RUNNING_SIGNAL or PLC_RUN) and not PLC_STOP"""
     # return (get_coil("IS_RUNNING_SIGNAL") or get_coil("PLC_RUN")) and (not get_coil("PLC_STOP"))
     return True
 
-def _set_u32_pair(name_hi: str, name_lo: str, value: int) -> None:
-    set_hr_u32(name_hi, name_lo, value & 0xFFFFFFFF)
-
-
 def set_coil(name: str, val: int) -> None:
     context[SLAVE_ID].setValues(1, COILS[name], [1 if val else 0])
 
 def get_coil(name: str) -> int:
-    return context[SLAVE_ID].getValues(1, COILS[name], 1)[0]
+    return int(context[SLAVE_ID].getValues(1, COILS[name], 1)[0])
+
+def get_field(name: str):
+    field = FIELDS[name]
+    return field.decode(context[SLAVE_ID].getValues(3, field.address, field.words))
 
-def set_hr(name: str, val: int) -> None:
-    context[SLAVE_ID].setValues(3, HREGS[name], [val & 0xFFFF])
+def set_field(name: str, value) -> None:
+    """필드 값을 인코딩해 모든 워드를 한 트랜잭션으로 기록 (u32 H/L가 찢어지지 않음)"""
+    field = FIELDS[name]
+    # ModbusDeviceContext는 블록 주소를 +1 해서 사용
+    with hr_block.transaction() as txn:
+        txn.setValues(field.address + 1, field.encode(value))
 
-def set_hr_u32(name_hi: str, name_lo: str, u32: int) -> None:
-    u32 &= 0xFFFFFFFF
-    context[SLAVE_ID].setValues(3, HREGS[name_hi], [(u32 >> 16) & 0xFFFF])
-    context[SLAVE_ID].setValues(3, HREGS[name_lo], [ u32        & 0xFFFF])
+async def pulse_coil(name: str, ms: int = 150) -> None:
+    """모멘터리 버튼: ms 동안 1 후 0"""
+    set_coil(name, 1)
+    await asyncio.sleep(ms / 1000)
+    set_coil(name, 0)
 
 # =========================
-# Simulation Tasks (async)
+# Simulation (단일 틱 엔진)
 # =========================
-async def task_displacement_sensors(stop: asyncio.Event) -> None:
-    """
-    1) health: 기본 on, 매 1초마다 1→2→3→4→5→6 순서로 잠깐 off 후 on
-    2) 값: 0.1초마다 2000~2200 사인파, 채널별 위상차
-    """
-    # 초기 health on
-    for k in ("LV1_OK","LV2_OK","LV3_OK","LV4_OK","LV5_OK","LV6_OK"):
+def init_health_coils() -> None:
+    """변위센서/엔코더 health 기본 on"""
+    for k in ("LV1_OK", "LV2_OK", "LV3_OK", "LV4_OK", "LV5_OK", "LV6_OK", "ENC1_OK", "ENC2_OK"):
         set_coil(k, 1)
 
-    phase = {
-        "LV1":0.0, "LV2":math.pi/6, "LV3":math.pi/3,
-        "LV4":math.pi/2, "LV5":2*math.pi/3, "LV6":5*math.pi/6
-    }
-    t = 0
-    idx_off = 0
-    names = ["LV1","LV2","LV3","LV4","LV5","LV6"]
-    ok_names = ["LV1_OK","LV2_OK","LV3_OK","LV4_OK","LV5_OK","LV6_OK"]
-
-    while not stop.is_set():
-        # 사인파 값 업데이트(10 Hz)
-        for n in names:
-            v = 2100 + 50 * math.sin(2*math.pi*(t*0.1) + phase[n])  # 2000~2200
-            set_hr(n, int(v))
-        t += 1
-
-        # # 1초마다 health 순차 off→on
-        # if t % 10 == 0:
-        #     k = idx_off % 6
-        #     set_coil(ok_names[k], 0)
-        #     await asyncio.sleep(0.2)  # 200ms 다운시간
-        #     set_coil(ok_names[k], 1)
-        #     idx_off += 1
-
-        await asyncio.sleep(0.1)
-# --- 교체: ENC1/ENC2 누적 펄스 태스크 ---
-async def task_encoder12(stop: asyncio.Event) -> None:
+def build_engine() -> SimEngine:
     """
-    ENC1/ENC2
-    - 누적 카운터: 러닝 중 0.1초마다 +125(=초당 +1250)
-    - health: 기본 on, 1초마다 ENC1→ENC2 교대로 200ms off 후 on
+    기존 태스크별 루프를 하나의 10ms 틱 엔진으로 통합.
+    채널마다 갱신 주기를 두고, 틱마다 바뀐 레지스터를 한 번에 기록한다.
     """
-    for k in ("ENC1_OK", "ENC2_OK"):
-        set_coil(k, 1)
-
-    enc1_cnt = 0
-    enc2_cnt = 0
-    tick = 0
-    off_toggle = 0  # 짝수: ENC1, 홀수: ENC2
-
-    while not stop.is_set():
-        if _run_enabled():
-            enc1_cnt = (enc1_cnt + 12) & 0xFFFFFFFF
-            enc2_cnt = (enc2_cnt + 12) & 0xFFFFFFFF
+    engine = SimEngine(tick=0.01)
+    # 주소/워드 순서는 레지스터 맵에서: u16은 주소, u32는 (H, L) 주소 쌍
+    def hr(name: str) -> int:
+        SIMULATED_FIELDS.add(name)
+        return FIELDS[name].address
 
-        _set_u32_pair("ENC1_H", "ENC1_L", enc1_cnt)
-        _set_u32_pair("ENC2_H", "ENC2_L", enc2_cnt)
+    def u32(name: str):
+        SIMULATED_FIELDS.add(name)
+        return FIELDS[name].word_addresses()
 
-        # # 1초마다 health 교대 off→on
-        # if tick % 10 == 0:
-        #     if off_toggle % 2 == 0:
-        #         set_coil("ENC1_OK", 0); await asyncio.sleep(0.2); set_coil("ENC1_OK", 1)
-        #     else:
-        #         set_coil("ENC2_OK", 0); await asyncio.sleep(0.2); set_coil("ENC2_OK", 1)
-        #     off_toggle += 1
+    # 변위센서 LV1~LV6: 0.1초마다 2050~2150 사인파(1 Hz), 채널별 위상차 π/6
+    engine.add_sine(hr_block, [hr(f"LV{i}") for i in range(1, 7)], low=2050, high=2150,
+                    frequency=1.0, phases=[i * math.pi / 6 for i in range(6)], every=0.1)
 
-        tick += 1
-        await asyncio.sleep(0.01)
-
-# --- 교체: ENC3 가변 펄스 태스크 ---
-async def task_encoder3(stop: asyncio.Event) -> None:
-    """
-    ENC3
-    - 누적 카운터: 러닝 중 0.1초마다 +Δ(t)
-      Δ(t) = 200 + 100*sin(2π·t/1s) ∈ [100, 300]
-    - health: 1초마다 토글
-    """
-    enc3_cnt = 0
-    tick = 0  # 0.1s 단위 틱
+    # ENC1/ENC2: 러닝 중 10ms마다 +12 누적 (u32)
+    engine.add_counter(hr_block, [u32("ENC1"), u32("ENC2")], step=12, every=0.01, width=32,
+                       enabled=_run_enabled)
 
-    # 초기 health(on) 보장
-    if get_coil("ENC3_OK") not in (0, 1):  # 미설정 시
-        set_coil("ENC3_OK", 1)
+    # ENC3: 0.1초마다 Δ(t) = 200 + 100*sin(2π·t), [100, 300] (u32)
+    engine.add_sine(hr_block, [u32("ENC3")], low=100, high=300, frequency=1.0, every=0.1, width=32)
 
-    while not stop.is_set():
-        # Δ(t): 1Hz 사인(0.1초 주기 샘플)
-        delta = int(200 + 100 * math.sin(2 * math.pi * (tick * 0.1)))
+    # ENC_MEAN: 10ms마다 +6 (러닝 여부와 무관)
+    engine.add_counter(hr_block, [u32("ENC_MEAN")], step=6, every=0.01, width=32)
 
-        if _run_enabled():
-            enc3_cnt = (max(0, delta)) & 0xFFFFFFFF  # 음수 방지(이론상 100~300라 필요X이지만 안전장치)
-
-        _set_u32_pair("ENC3_H", "ENC3_L", enc3_cnt)
-
-        # health 1초마다 토글
-        # if tick % 10 == 0:
-        #     set_coil("ENC3_OK", 0 if get_coil("ENC3_OK") else 1)
-
-        tick += 1
-        await asyncio.sleep(0.1)
-
-# --- 참고: 평균값 태스크(필요 시) ---
-async def task_encoder_mean(stop: asyncio.Event) -> None:
-    """
-    ENC_MEAN: 1초당 +1250 (사양 그대로; 러닝 여부와 무관)
-    """
-    mean = 0
-    tick = 0
-    while not stop.is_set():
-        mean = (mean + 6) & 0xFFFFFFFF  # 0.1초 당 +125
-        _set_u32_pair("ENC_MEAN_H", "ENC_MEAN_L", mean)
-        tick += 1
-        await asyncio.sleep(0.01)
-
-async def task_gaps(stop: asyncio.Event) -> None:
-    """
-    단차:
-    - index: 1초마다 +1
-    - height: 1초마다 1~10 랜덤 (좌/우 각각)
-    - position: 1250씩 증가
-    """
-    lidx = ridx = 0
-    t = 0
-    while not stop.is_set():
-        if t % 10 == 0:
-            lidx = (lidx + 1) & 0xFFFF
-            ridx = (ridx + 1) & 0xFFFF
-            set_hr("LGAP_IDX", lidx)
-            set_hr("RGAP_IDX", ridx)
-            set_hr("LGAP_STEPSIZE", random.randint(1, 10))
-            set_hr("RGAP_STEPSIZE", random.randint(1, 10))
-            set_hr("LGAP_STEP_POS_H", (lidx * 1250) >> 16)
-            set_hr("LGAP_STEP_POS_L", (lidx * 1250) & 0xFFFF)
-            set_hr("RGAP_STEP_POS_H", (ridx * 1250) >> 16)
-            set_hr("RGAP_STEP_POS_L", (ridx * 1250) & 0xFFFF)
-        t += 1
-        await asyncio.sleep(0.1)
+    # 단차: 1초마다 index +1, stepsize 1~10 랜덤, position +1250 (u32)
+    engine.add_counter(hr_block, [hr("LGAP_IDX"), hr("RGAP_IDX")], step=1, every=1.0)
+    engine.add_random(hr_block, [hr("LGAP_STEPSIZE"), hr("RGAP_STEPSIZE")], low=1, high=10, every=1.0)
+    engine.add_counter(hr_block, [u32("LGAP_STEP_POS"), u32("RGAP_STEP_POS")], step=1250, every=1.0, width=32)
+    return engine
 
 # =========================
-# PyQt GUI
+# Control socket / CLI
 # =========================
-class MainWindow(QtWidgets.QWidget):
-    """
-    - 제어: IS_RUNNING_SIGNAL, PLC_RUN/STOP/ERR, PB_START/PB_STOP (momentary)
-    - 모니터: RESET_DEVICE, DEVICE_RDY, INIT_CURSOR_DONE, SW_START/STOP/RESET
-    """
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Modbus Simulator Control Panel")
-        self.setMinimumWidth(520)
-
-        # Controls
-        self.chk_is_run = QtWidgets.QCheckBox("IS_RUNNING_SIGNAL (M00003)")
-        self.chk_plc_run = QtWidgets.QCheckBox("PLC_RUN (M00013)")
-        self.chk_plc_stop = QtWidgets.QCheckBox("PLC_STOP (M00014)")
-        self.chk_plc_err = QtWidgets.QCheckBox("PLC_ERR (M00015)")
-        self.btn_pb_start = QtWidgets.QPushButton("PB_START (P00000) momentary")
-        self.btn_pb_stop  = QtWidgets.QPushButton("PB_STOP  (P00001) momentary")
-
-        # Monitor labels
-        self.lbl_reset = QtWidgets.QLabel("RESET_DEVICE (M00000): ?")
-        self.lbl_rdy   = QtWidgets.QLabel("DEVICE_RDY   (M00001): ?")
-        self.lbl_init  = QtWidgets.QLabel("INIT_CURSOR_DONE (M00002): ?")
-        self.lbl_sw_st = QtWidgets.QLabel("SW_START (M0001C): ?")
-        self.lbl_sw_sp = QtWidgets.QLabel("SW_STOP  (M0001D): ?")
-        self.lbl_sw_rs = QtWidgets.QLabel("SW_RESET (M0001E): ?")
-
-        # Layout
-        g = QtWidgets.QGridLayout(self)
-        g.addWidget(QtWidgets.QLabel("■ Controls"), 0, 0, 1, 2)
-        g.addWidget(self.chk_is_run, 1, 0, 1, 2)
-        g.addWidget(self.chk_plc_run, 2, 0)
-        g.addWidget(self.chk_plc_stop,2, 1)
-        g.addWidget(self.chk_plc_err, 3, 0)
-        g.addWidget(self.btn_pb_start,4, 0)
-        g.addWidget(self.btn_pb_stop, 4, 1)
-
-        row = 5
-        g.addWidget(QtWidgets.QLabel("■ Monitors"), row, 0, 1, 2); row += 1
-        for w in (self.lbl_reset, self.lbl_rdy, self.lbl_init,
-                  self.lbl_sw_st, self.lbl_sw_sp, self.lbl_sw_rs):
-            g.addWidget(w, row, 0, 1, 2); row += 1
-
-        # Bind
-        self.chk_is_run.toggled.connect(lambda v: set_coil("IS_RUNNING_SIGNAL", int(v)))
-        self.chk_plc_run.toggled.connect(lambda v: set_coil("PLC_RUN",  int(v)))
-        self.chk_plc_stop.toggled.connect(lambda v: set_coil("PLC_STOP", int(v)))
-        self.chk_plc_err.toggled.connect(lambda v: set_coil("PLC_ERR",  int(v)))
-        self.btn_pb_start.clicked.connect(self._pulse_pb_start)
-        self.btn_pb_stop.clicked.connect(self._pulse_pb_stop)
-
-        # Poll timer for monitor update
-        self.timer = QtCore.QTimer(self)
-        self.timer.setInterval(100)  # 10 Hz
-        self.timer.timeout.connect(self.update_monitors)
-        self.timer.start()
-
-    @asyncSlot()
-    async def _pulse(self, coil_name: str, ms: int = 150):
-        set_coil(coil_name, 1)
-        await asyncio.sleep(ms / 1000)
-        set_coil(coil_name, 0)
-
-    def _pulse_pb_start(self):
-        asyncio.create_task(self._pulse("PB_START"))
-
-    def _pulse_pb_stop(self):
-        asyncio.create_task(self._pulse("PB_STOP"))
-
-    def update_monitors(self):
-        self.lbl_reset.setText(f"RESET_DEVICE (M00000): {get_coil('RESET_DEVICE')}")
-        self.lbl_rdy.setText(  f"DEVICE_RDY   (M00001): {get_coil('DEVICE_RDY')}")
-        self.lbl_init.setText( f"INIT_CURSOR_DONE (M00002): {get_coil('INIT_CURSOR_DONE')}")
-        self.lbl_sw_st.setText(f"SW_START (M0001C): {get_coil('SW_START')}")
-        self.lbl_sw_sp.setText(f"SW_STOP  (M0001D): {get_coil('SW_STOP')}")
-        self.lbl_sw_rs.setText(f"SW_RESET (M0001E): {get_coil('SW_RESET')}")
+# GUI 모니터 패널과 같은 코일
+MONITOR_COILS: List[str] = ["RESET_DEVICE", "DEVICE_RDY", "INIT_CURSOR_DONE", "SW_START", "SW_STOP", "SW_RESET"]
+# GUI 제어 패널과 같은 코일
+CONTROL_COILS: List[str] = ["IS_RUNNING_SIGNAL", "PLC_RUN", "PLC_STOP", "PLC_ERR", "PB_START", "PB_STOP"]
+
+CONTROL_HELP = """commands:
+  status                  monitor/control coils and holding registers
+  get <NAME>              coil or register field value
+  set <NAME> <VALUE>      write a coil (0/1) or a register field the simulation does not drive
+  pulse <COIL> [MS]       momentary 1 for MS (default 150) then 0
+  help"""
+
+def _status() -> dict:
+    return {
+        "monitors": {name: get_coil(name) for name in MONITOR_COILS},
+        "controls": {name: get_coil(name) for name in CONTROL_COILS},
+        "hr": {name: get_field(name) for name in FIELDS},
+    }
+
+async def handle_command(words: List[str]) -> dict:
+    """제어 명령 한 줄 실행 → 응답 JSON"""
+    if not words or words[0] == "help":
+        return {"ok": True, "help": CONTROL_HELP}
+    command, args = words[0].lower(), words[1:]
+    if command == "status":
+        return {"ok": True, **_status()}
+    if command not in ("get", "set", "pulse"):
+        raise ValueError(f"unknown command '{command}' (try help)")
+    if not args:
+        raise ValueError(f"'{command}' needs a coil or field name")
+    name = args[0].upper()
+    if name not in COILS and name not in FIELDS:
+        raise ValueError(f"unknown name '{name}'")
+    if command == "get":
+        return {"ok": True, name: get_coil(name) if name in COILS else get_field(name)}
+    if command == "set":
+        if len(args) != 2:
+            raise ValueError("usage: set <NAME> <VALUE>")
+        if name in COILS:
+            set_coil(name, int(args[1], 0))
+            return {"ok": True, name: get_coil(name)}
+        if name in SIMULATED_FIELDS:
+            raise ValueError(f"'{name}' is driven by the simulation and would be overwritten on the next tick")
+        field = FIELDS[name]
+        set_field(name, float(args[1]) if field.type == "f32" else int(args[1], 0))
+        return {"ok": True, name: get_field(name)}
+    # pulse
+    if name not in COILS:
+        raise ValueError(f"'{name}' is not a coil")
+    await pulse_coil(name, int(args[1]) if len(args) > 1 else 150)
+    return {"ok": True, name: get_coil(name)}
+
+async def _handle_control(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """줄 단위 명령, 줄 단위 JSON 응답"""
+    try:
+        while line := await reader.readline():
+            try:
+                response = await handle_command(line.decode("utf-8").split())
+            except (ValueError, UnicodeDecodeError) as e:
+                response = {"ok": False, "error": str(e)}
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve_control(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    try:
+        server = await asyncio.start_server(_handle_control, host, port)
+    except OSError as e:
+        logger.error(f"Failed to start control socket on {host}:{port}: {e}")
+        return None
+    logger.info(f"Control socket on {host}:{port} (python modbus_ref.py help)")
+    return server
+
+def send_command(words: List[str], host: str, port: int) -> dict:
+    """실행 중인 시뮬레이터에 명령 전송 (CLI)"""
+    import socket
+    with socket.create_connection((host, port), timeout=5) as sock:
+        sock.sendall((" ".join(words) + "\n").encode("utf-8"))
+        return json.loads(sock.makefile("rb").readline())
 
 # =========================
 # Bootstrap
 # =========================
-async def run_server_and_sim() -> None:
-    # 초기 상태: DEVICE_RDY=1 가정(필요시 조정)
-    set_coil("DEVICE_RDY", 1)
-
-    stop = asyncio.Event()
-    # 시뮬 태스크
-    tasks = [
-        asyncio.create_task(task_displacement_sensors(stop)),
-        asyncio.create_task(task_encoder12(stop)),
-        asyncio.create_task(task_encoder3(stop)),
-        asyncio.create_task(task_encoder_mean(stop)),
-        asyncio.create_task(task_gaps(stop)),
-    ]
-    # Modbus 서버
-    server = asyncio.create_task(StartAsyncTcpServer(
-        context=context, identity=_build_identity(), address=("0.0.0.0", 5020)
-    ))
-
-    # PyQt 앱
-    app = QtWidgets.QApplication([])
-    win = MainWindow(); win.show()
-
-    loop = QEventLoop(app)
-    asyncio.set_event_loop(loop)
-    try:
-        async with loop:
-            # GUI 이벤트 루프와 함께 대기
-            await asyncio.gather(server, *tasks)
-    finally:
-        stop.set()
-        for t in tasks:
-            t.cancel()
+MODBUS_HOST = os.getenv("MODBUS_HOST", "0.0.0.0")
+MODBUS_PORT = int(os.getenv("MODBUS_PORT", "5020"))
+CONTROL_HOST = os.getenv("CONTROL_HOST", "127.0.0.1")
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "5021"))  # 0이면 제어 소켓 끔
 
 def _build_identity():
     ident = ModbusDeviceIdentification()
@@ -368,51 +237,84 @@ def _build_identity():
     ident.MajorMinorRevision = "3.0"
     return ident
 
-async def _async_bootstrap(app: QtWidgets.QApplication):
-    """서버/시뮬 태스크를 띄우고, 앱 종료 시 정리까지 담당."""
-    stop = asyncio.Event()
-
-    # 앱 종료되면 stop 세트
-    app.aboutToQuit.connect(lambda: stop.set())
-
-    # === 여기서 기존 run_server_and_sim() 안에서 하던 것들을 시작 ===
-    # 예: 초기 상태
-    # set_coil("DEVICE_RDY", 1)
-
-    # 시뮬 태스크들
-    sim_tasks = [
-        asyncio.create_task(task_displacement_sensors(stop)),
-        asyncio.create_task(task_encoder12(stop)),
-        asyncio.create_task(task_encoder3(stop)),
-        asyncio.create_task(task_encoder_mean(stop)),
-        asyncio.create_task(task_gaps(stop)),
-    ]
+async def run_simulator(stop: asyncio.Event) -> None:
+    """Modbus 서버 + 시뮬 엔진 + 제어 소켓을 현재 루프에서 실행, stop까지 대기 (GUI/headless 공용)"""
+    # 변위센서/엔코더 health 기본 on
+    init_health_coils()
+    engine = build_engine()
+    tasks = [asyncio.create_task(engine.run(stop))]
 
     # Modbus 서버 태스크
-    server_task = asyncio.create_task(StartAsyncTcpServer(
-        context=context, identity=_build_identity(), address=("0.0.0.0", 5020)
-    ))
+    tasks.append(asyncio.create_task(StartAsyncTcpServer(
+        context=context, identity=_build_identity(), address=(MODBUS_HOST, MODBUS_PORT)
+    )))
+    control = await serve_control(CONTROL_HOST, CONTROL_PORT) if CONTROL_PORT > 0 else None
+    logger.info(f"Modbus simulator on {MODBUS_HOST}:{MODBUS_PORT}")
 
-    # stop 신호까지 대기
-    await stop.wait()
+    # stop 신호(또는 서버 종료)까지 대기
+    stopper = asyncio.create_task(stop.wait())
+    await asyncio.wait([stopper, tasks[1]], return_when=asyncio.FIRST_COMPLETED)
 
     # 종료 정리
-    server_task.cancel()
-    for t in sim_tasks:
+    stop.set()
+    if control is not None:
+        control.close()
+    for t in tasks:
         t.cancel()
-    # 취소 전파 후, 잠깐 대기
-    await asyncio.sleep(0)
-def main():
-    app = QtWidgets.QApplication([])
-    win = MainWindow()
-    win.show()
+    await asyncio.gather(stopper, *tasks, return_exceptions=True)
+    logger.info(f"Simulator stopped: {engine.stats()}")
 
-    loop = QEventLoop(app)
-    asyncio.set_event_loop(loop)
+async def _headless() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    await run_simulator(stop)
+
+def run_headless() -> None:
+    """GUI 없이 asyncio 루프에서 실행 (uvloop 설치 시 uvloop)"""
+    try:
+        import uvloop
+        loop_factory = uvloop.new_event_loop
+    except ImportError:
+        loop_factory = None
+    logger.info(f"Headless mode ({'uvloop' if loop_factory else 'asyncio'} event loop)")
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(_headless())
 
-    # with (동기) 컨텍스트 매니저 사용! (async with 금지)
-    with loop:
-        loop.run_until_complete(_async_bootstrap(app))
+def main():
+    parser = argparse.ArgumentParser(description="Modbus TCP sensor simulator",
+                                     epilog=CONTROL_HELP, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--headless", action="store_true", default=os.getenv("HEADLESS", "").lower() == "true",
+                        help="run without the PyQt5 panel (env HEADLESS=true)")
+    parser.add_argument("command", nargs="*", help="send a control command to a running simulator instead")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command:
+        try:
+            response = send_command(args.command, CONTROL_HOST, CONTROL_PORT)
+        except OSError as e:
+            sys.exit(f"Cannot reach the simulator control socket on {CONTROL_HOST}:{CONTROL_PORT}: {e}")
+        print(response["help"] if "help" in response else json.dumps(response, indent=2))
+        sys.exit(0 if response.get("ok") else 1)
+
+    if not args.headless and sys.platform != "win32" and not (os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY")):
+        # PyQt5가 설치되어 있어도 디스플레이 없이는 QApplication이 abort됨
+        logger.warning("No DISPLAY/WAYLAND_DISPLAY, running headless")
+        args.headless = True
+    if not args.headless:
+        try:
+            import modbus_ref_gui
+        except ImportError as e:
+            logger.warning(f"GUI unavailable ({e}), running headless")
+        else:
+            modbus_ref_gui.main()
+            return
+    run_headless()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,112 @@
+"""
+Modbus Simulator Control Panel (PyQt5)
+- modbus_ref의 서버/시뮬을 qasync 루프에서 실행하고 GUI로 코일 제어/모니터링
+- PyQt5, qasync 필요 (없으면 modbus_ref.py --headless 사용)
+"""
+
+import asyncio
+
+from PyQt5 import QtWidgets, QtCore
+from qasync import QEventLoop
+
+from modbus_ref import get_coil, pulse_coil, run_simulator, set_coil
+
+# =========================
+# PyQt GUI
+# =========================
+class MainWindow(QtWidgets.QWidget):
+    """
+    - 제어: IS_RUNNING_SIGNAL, PLC_RUN/STOP/ERR, PB_START/PB_STOP (momentary)
+    - 모니터: RESET_DEVICE, DEVICE_RDY, INIT_CURSOR_DONE, SW_START/STOP/RESET
+    """
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("Modbus Simulator Control Panel")
+        self.setMinimumWidth(520)
+
+        # Controls
+        self.chk_is_run = QtWidgets.QCheckBox("IS_RUNNING_SIGNAL (M00003)")
+        self.chk_plc_run = QtWidgets.QCheckBox("PLC_RUN (M00013)")
+        self.chk_plc_stop = QtWidgets.QCheckBox("PLC_STOP (M00014)")
+        self.chk_plc_err = QtWidgets.QCheckBox("PLC_ERR (M00015)")
+        self.btn_pb_start = QtWidgets.QPushButton("PB_START (P00000) momentary")
+        self.btn_pb_stop  = QtWidgets.QPushButton("PB_STOP  (P00001) momentary")
+
+        # Monitor labels
+        self.lbl_reset = QtWidgets.QLabel("RESET_DEVICE (M00000): ?")
+        self.lbl_rdy   = QtWidgets.QLabel("DEVICE_RDY   (M00001): ?")
+        self.lbl_init  = QtWidgets.QLabel("INIT_CURSOR_DONE (M00002): ?")
+        self.lbl_sw_st = QtWidgets.QLabel("SW_START (M0001C): ?")
+        self.lbl_sw_sp = QtWidgets.QLabel("SW_STOP  (M0001D): ?")
+        self.lbl_sw_rs = QtWidgets.QLabel("SW_RESET (M0001E): ?")
+
+        # Layout
+        g = QtWidgets.QGridLayout(self)
+        g.addWidget(QtWidgets.QLabel("■ Controls"), 0, 0, 1, 2)
+        g.addWidget(self.chk_is_run, 1, 0, 1, 2)
+        g.addWidget(self.chk_plc_run, 2, 0)
+        g.addWidget(self.chk_plc_stop,2, 1)
+        g.addWidget(self.chk_plc_err, 3, 0)
+        g.addWidget(self.btn_pb_start,4, 0)
+        g.addWidget(self.btn_pb_stop, 4, 1)
+
+        row = 5
+        g.addWidget(QtWidgets.QLabel("■ Monitors"), row, 0, 1, 2); row += 1
+        for w in (self.lbl_reset, self.lbl_rdy, self.lbl_init,
+                  self.lbl_sw_st, self.lbl_sw_sp, self.lbl_sw_rs):
+            g.addWidget(w, row, 0, 1, 2); row += 1
+
+        # Bind
+        self.chk_is_run.toggled.connect(lambda v: set_coil("IS_RUNNING_SIGNAL", int(v)))
+        self.chk_plc_run.toggled.connect(lambda v: set_coil("PLC_RUN",  int(v)))
+        self.chk_plc_stop.toggled.connect(lambda v: set_coil("PLC_STOP", int(v)))
+        self.chk_plc_err.toggled.connect(lambda v: set_coil("PLC_ERR",  int(v)))
+        self.btn_pb_start.clicked.connect(self._pulse_pb_start)
+        self.btn_pb_stop.clicked.connect(self._pulse_pb_stop)
+
+        # Poll timer for monitor update
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(100)  # 10 Hz
+        self.timer.timeout.connect(self.update_monitors)
+        self.timer.start()
+
+    def _pulse_pb_start(self):
+        asyncio.create_task(pulse_coil("PB_START"))
+
+    def _pulse_pb_stop(self):
+        asyncio.create_task(pulse_coil("PB_STOP"))
+
+    def update_monitors(self):
+        self.lbl_reset.setText(f"RESET_DEVICE (M00000): {get_coil('RESET_DEVICE')}")
+        self.lbl_rdy.setText(  f"DEVICE_RDY   (M00001): {get_coil('DEVICE_RDY')}")
+        self.lbl_init.setText( f"INIT_CURSOR_DONE (M00002): {get_coil('INIT_CURSOR_DONE')}")
+        self.lbl_sw_st.setText(f"SW_START (M0001C): {get_coil('SW_START')}")
+        self.lbl_sw_sp.setText(f"SW_STOP  (M0001D): {get_coil('SW_STOP')}")
+        self.lbl_sw_rs.setText(f"SW_RESET (M0001E): {get_coil('SW_RESET')}")
+
+# =========================
+# Bootstrap
+# =========================
+async def _async_bootstrap(app: QtWidgets.QApplication):
+    """서버/시뮬 태스크를 띄우고, 앱 종료 시 정리까지 담당."""
+    stop = asyncio.Event()
+
+    # 앱 종료되면 stop 세트
+    app.aboutToQuit.connect(lambda: stop.set())
+
+    await run_simulator(stop)
+
+def main():
+    app = QtWidgets.QApplication([])
+    win = MainWindow()
+    win.show()
+
+    loop = QEventLoop(app)
+    asyncio.set_event_loop(loop)
+
+    # with (동기) 컨텍스트 매니저 사용! (async with 금지)
+    with loop:
+        loop.run_until_complete(_async_bootstrap(app))
+
+if __name__ == "__main__":
+    main()
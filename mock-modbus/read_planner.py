@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+Read planner for Modbus pollers
+
+Replaces hand bisection (test_find_limit.py) and one-request-per-value polling
+with a measured, exported read schedule:
+
+1. discover: against a running server, bisect the largest FC1 and FC3 read
+   that succeeds at the given address, and fit the cost of a read as
+   request_cost + value_cost * count from timed reads of several sizes
+2. plan: pick the reads that cover the addresses of interest at the lowest
+   predicted cost (dynamic programming over the sorted addresses, so one
+   request reads through a gap only when that is cheaper than another round
+   trip, and no read exceeds the discovered limit)
+3. compare: poll the same values with one read per address and with the
+   plan, and report the measured cycle times
+
+Addresses come as ranges (--coils 0-7,16-23 --registers 0-5) or as names from
+a register map (--map register_map.json --fields ENC1,ENC2). The schedule is
+written as JSON ({"reads": [{"fc", "address", "count", "fields"}], ...}) for
+clients to load.
+
+    python read_planner.py --port 502 --coils 0-7,16-23 --discover --compare
+    python read_planner.py --port 5020 --map register_map.json --discover --output schedule.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+from register_map import MAX_COILS, MAX_REGISTERS, DEFAULT_MAP, Item, ReadPlan, RegisterMap, Span
+
+
+class CostModel:
+    """Per-request limits and the fitted cost of a read, per function code"""
+
+    def __init__(self, max_coils: int = MAX_COILS, max_registers: int = MAX_REGISTERS,
+                 request_cost: float = 0.001, coil_cost: float = 0.0, register_cost: float = 0.0):
+        """
+        Initialize the model.
+
+        Args:
+            max_coils, max_registers: Largest FC1/FC3 read
+            request_cost: Seconds per request, independent of its size
+            coil_cost, register_cost: Extra seconds per coil/register read
+        """
+        self.max_coils = max_coils
+        self.max_registers = max_registers
+        self.request_cost = request_cost
+        self.coil_cost = coil_cost
+        self.register_cost = register_cost
+
+    def value_cost(self, fc: int) -> float:
+        return self.coil_cost if fc == 1 else self.register_cost
+
+    def read_cost(self, fc: int, count: int) -> float:
+        return self.request_cost + self.value_cost(fc) * count
+
+    def plan_cost(self, plan: ReadPlan) -> float:
+        return sum(self.read_cost(read.fc, read.count) for read in plan.reads)
+
+    def to_dict(self) -> dict:
+        return {
+            "max_coils": self.max_coils,
+            "max_registers": self.max_registers,
+            "request_cost_ms": round(self.request_cost * 1000, 4),
+            "coil_cost_us": round(self.coil_cost * 1e6, 4),
+            "register_cost_us": round(self.register_cost * 1e6, 4),
+        }
+
+    def cover(self, fc: int, items: List[Item], limit: int) -> List[Span]:
+        """
+        Cheapest spans of at most limit addresses covering items (start, end, name).
+
+        best[j] is the cheapest way to read the first j items; the last read
+        of that solution covers items i..j-1, so best[j] = min over i of
+        best[i] + read_cost(span of items i..j-1).
+        """
+        items = sorted(items)
+        value_cost = self.value_cost(fc)
+        best = [0.0] + [math.inf] * len(items)
+        first = [0] * (len(items) + 1)
+        for j in range(1, len(items) + 1):
+            end = 0
+            for i in range(j - 1, -1, -1):
+                end = max(end, items[i][1])
+                span = end - items[i][0]
+                if span > limit:
+                    break
+                cost = best[i] + self.request_cost + value_cost * span
+                if cost < best[j]:
+                    best[j], first[j] = cost, i
+            if best[j] == math.inf:
+                raise ValueError(f"{items[j - 1][2]} does not fit in one FC{fc} read of {limit}")
+
+        spans: List[Span] = []
+        j = len(items)
+        while j:
+            i = first[j]
+            chunk = items[i:j]
+            spans.append((chunk[0][0], max(item[1] for item in chunk), [item[2] for item in chunk]))
+            j = i
+        return spans[::-1]
+
+
+def one_per_value(fc: int, items: List[Item], limit: int) -> List[Span]:
+    """One read per coil/field, the way an unplanned poller reads"""
+    return [(start, end, [name]) for start, end, name in sorted(items)]
+
+
+# -- discovery -----------------------------------------------------------------
+
+async def _read(client, fc: int, address: int, count: int, device_id: int):
+    if fc == 1:
+        return await client.read_coils(address, count=count, device_id=device_id)
+    return await client.read_holding_registers(address, count=count, device_id=device_id)
+
+
+async def _read_ok(client, fc: int, address: int, count: int, device_id: int) -> bool:
+    try:
+        response = await _read(client, fc, address, count, device_id)
+    except Exception:  # pymodbus raises ModbusException subclasses and timeouts
+        return False
+    return not response.isError()
+
+
+async def discover_limit(client, fc: int, address: int = 0, device_id: int = 0) -> int:
+    """Largest FC1/FC3 read that succeeds at address (0 if none does)"""
+    upper = MAX_COILS if fc == 1 else MAX_REGISTERS
+    if await _read_ok(client, fc, address, upper, device_id):
+        return upper
+    if not await _read_ok(client, fc, address, 1, device_id):
+        return 0
+    low, high = 1, upper  # low succeeds, high fails
+    while high - low > 1:
+        middle = (low + high) // 2
+        if await _read_ok(client, fc, address, middle, device_id):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+async def _median_read_time(client, fc: int, address: int, count: int, device_id: int, samples: int) -> float:
+    times = []
+    for _ in range(samples):
+        began = time.perf_counter()
+        await _read(client, fc, address, count, device_id)
+        times.append(time.perf_counter() - began)
+    return statistics.median(times)
+
+
+async def fit_cost(client, fc: int, limit: int, address: int = 0, device_id: int = 0,
+                   samples: int = 30) -> tuple:
+    """(seconds per request, seconds per value) from a least squares fit over several read sizes"""
+    counts = sorted({1, max(1, limit // 4), max(1, limit // 2), limit})
+    times = [await _median_read_time(client, fc, address, count, device_id, samples) for count in counts]
+    if len(counts) == 1:
+        return times[0], 0.0
+    mean_count, mean_time = statistics.fmean(counts), statistics.fmean(times)
+    slope = sum((c - mean_count) * (t - mean_time) for c, t in zip(counts, times)) / \
+        sum((c - mean_count) ** 2 for c in counts)
+    # Noise can make a tiny slope negative; a read never gets cheaper with size
+    slope = max(slope, 0.0)
+    return max(mean_time - slope * mean_count, 0.0), slope
+
+
+async def discover(client, coil_address: int = 0, register_address: int = 0, device_id: int = 0,
+                   samples: int = 30) -> CostModel:
+    """Limits and read costs of the server behind client"""
+    max_coils = await discover_limit(client, 1, coil_address, device_id)
+    max_registers = await discover_limit(client, 3, register_address, device_id)
+    if not max_coils and not max_registers:
+        raise IOError("neither FC1 nor FC3 reads succeed; check the address and device id")
+
+    model = CostModel(max_coils=max_coils or MAX_COILS, max_registers=max_registers or MAX_REGISTERS)
+    request_costs = []
+    if max_coils:
+        request_cost, model.coil_cost = await fit_cost(client, 1, max_coils, coil_address, device_id, samples)
+        request_costs.append(request_cost)
+    if max_registers:
+        request_cost, model.register_cost = await fit_cost(client, 3, max_registers, register_address, device_id,
+                                                           samples)
+        request_costs.append(request_cost)
+    model.request_cost = statistics.fmean(request_costs)
+    return model
+
+
+async def measure(client, plan: ReadPlan, device_id: int = 0, cycles: int = 100) -> dict:
+    """Poll with plan cycles times; per-cycle latency"""
+    times = []
+    for _ in range(cycles):
+        began = time.perf_counter()
+        await plan.read(client, device_id)
+        times.append(time.perf_counter() - began)
+    times.sort()
+    return {
+        "requests_per_cycle": len(plan),
+        "mean_ms": round(statistics.fmean(times) * 1000, 3),
+        "p50_ms": round(times[len(times) // 2] * 1000, 3),
+        "p99_ms": round(times[min(len(times) - 1, int(len(times) * 0.99))] * 1000, 3),
+    }
+
+
+# -- command line ----------------------------------------------------------------
+
+def parse_ranges(spec: Optional[str]) -> List[int]:
+    """'0-7,16,20-23' -> [0, 1, ..., 7, 16, 20, ..., 23]"""
+    addresses = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if item:
+            first, _, last = item.partition("-")
+            addresses.extend(range(int(first, 0), int(last or first, 0) + 1))
+    return sorted(set(addresses))
+
+
+def ranges_map(coils: List[int], registers: List[int]) -> RegisterMap:
+    """Register map with one u16 field per register and one coil per address, named co:N / hr:N"""
+    return RegisterMap({"coils": {f"co:{a}": a for a in coils}, "registers": {f"hr:{a}": a for a in registers}})
+
+
+def _schedule(plan: ReadPlan, model: CostModel, naive: ReadPlan, device_id: int) -> Dict[str, object]:
+    return {
+        "device_id": device_id,
+        "model": model.to_dict(),
+        "requests": len(plan),
+        "values_read": sum(read.count for read in plan.reads),
+        "predicted_ms": round(model.plan_cost(plan) * 1000, 3),
+        "one_per_value": {"requests": len(naive), "predicted_ms": round(model.plan_cost(naive) * 1000, 3)},
+        "reads": [read.to_dict() for read in plan.reads],
+    }
+
+
+async def run(args) -> dict:
+    if args.map or not (args.coils or args.registers):
+        regmap = RegisterMap.load(args.map or DEFAULT_MAP)
+        names = args.fields.split(",") if args.fields else None
+    else:
+        regmap = ranges_map(parse_ranges(args.coils), parse_ranges(args.registers))
+        names = None
+
+    model = CostModel(max_coils=regmap.max_coils, max_registers=regmap.max_registers,
+                      request_cost=args.request_cost_ms / 1000, coil_cost=args.value_cost_us / 1e6,
+                      register_cost=args.value_cost_us / 1e6)
+    client = None
+    if args.discover or args.compare:
+        from pymodbus.client import AsyncModbusTcpClient
+        client = AsyncModbusTcpClient(args.host, port=args.port, timeout=args.timeout)
+        if not await client.connect():
+            raise SystemExit(f"Cannot connect to {args.host}:{args.port}")
+    try:
+        if args.discover:
+            model = await discover(client, args.coil_address, args.register_address, args.device_id, args.samples)
+
+        plan = regmap.compile_plan(names, max_coils=model.max_coils, max_registers=model.max_registers,
+                                   cover=model.cover)
+        naive = regmap.compile_plan(names, cover=one_per_value)
+        schedule = _schedule(plan, model, naive, args.device_id)
+        if args.compare:
+            schedule["measured"] = {
+                "one_per_value": await measure(client, naive, args.device_id, args.cycles),
+                "plan": await measure(client, plan, args.device_id, args.cycles),
+            }
+        return schedule
+    finally:
+        if client is not None:
+            client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover Modbus read limits/costs and plan coalesced reads")
+    parser.add_argument("--coils", help="coil addresses of interest, e.g. 0-7,16-23")
+    parser.add_argument("--registers", help="holding register addresses of interest, e.g. 0-5,8-13")
+    parser.add_argument("--map", help=f"register map instead of ranges (default when no ranges: {DEFAULT_MAP})")
+    parser.add_argument("--fields", help="comma separated coil/field names from the map (default: all)")
+    parser.add_argument("--discover", action="store_true", help="measure limits and costs on the server")
+    parser.add_argument("--compare", action="store_true", help="time one-read-per-value polling against the plan")
+    parser.add_argument("--host", default=os.getenv("MODBUS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MODBUS_PORT", "502")))
+    parser.add_argument("--device-id", type=int, default=0)
+    parser.add_argument("--coil-address", type=int, default=0, help="start address for the FC1 limit probe")
+    parser.add_argument("--register-address", type=int, default=0, help="start address for the FC3 limit probe")
+    parser.add_argument("--samples", type=int, default=30, help="timed reads per size when fitting costs")
+    parser.add_argument("--cycles", type=int, default=100, help="poll cycles per variant for --compare")
+    parser.add_argument("--timeout", type=float, default=2.0)
+    parser.add_argument("--request-cost-ms", type=float, default=1.0, help="cost model without --discover")
+    parser.add_argument("--value-cost-us", type=float, default=0.0, help="cost model without --discover")
+    parser.add_argument("--output", help="write the schedule JSON here instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        schedule = asyncio.run(run(args))
+    except (ValueError, IOError) as e:
+        sys.exit(str(e))
+    document = json.dumps(schedule, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(document + "\n")
+        print(f"{schedule['requests']} request(s) instead of {schedule['one_per_value']['requests']}, "
+              f"schedule written to {args.output}")
+    else:
+        print(document)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Declarative register map for the mock PLCs and their clients
+
+A JSON map (see register_map.json) names every coil and typed register field
+once. The simulator writes fields through it and clients read them through
+it, so addresses and word order are not repeated (and hand-shifted) in code:
+
+    {
+      "max_read": {"coils": 2000, "registers": 125},
+      "coils": {"DEVICE_RDY": 1},
+      "registers": {
+        "LV1": 0,
+        "ENC1": {"address": 8, "type": "u32", "word_order": "little"},
+        "STATUS": {"address": 50, "type": "bits", "fields": {"READY": 0, "MODE": [4, 3]}}
+      }
+    }
+
+Register types: u16 (a bare address), s16, u32, s32, f32 (two registers,
+word_order big = high word first, the default, or little), and bits (named
+bit or [bit, width] fields of one register, decoded to a dict).
+
+compile_plan() groups the requested fields into the fewest FC1/FC3 reads
+that respect the per-request limits, and compiles one struct.Struct per read
+that decodes every field of that read in a single unpack:
+
+    regmap = RegisterMap.load("register_map.json")
+    plan = regmap.compile_plan()
+    values = await plan.read(client, device_id=0)   # {"ENC1": 2460, ...}
+
+Command line:
+    python register_map.py --plan                  # requests for all fields
+    python register_map.py --port 5020             # read and decode all fields
+    python register_map.py --port 5020 --fields ENC1,ENC2,DEVICE_RDY
+"""
+
+import json
+import os
+import struct
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+DEFAULT_MAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "register_map.json")
+
+# Modbus limits per request (FC1/FC2: 2000 bits, FC3/FC4: 125 registers)
+MAX_COILS = 2000
+MAX_REGISTERS = 125
+
+# type -> (registers, struct code for the big-endian words)
+TYPES = {
+    "u16": (1, "H"),
+    "s16": (1, "h"),
+    "bits": (1, "H"),
+    "u32": (2, "I"),
+    "s32": (2, "i"),
+    "f32": (2, "f"),
+}
+
+
+class Field:
+    """One typed register field"""
+
+    def __init__(self, name: str, spec):
+        if isinstance(spec, int):
+            spec = {"address": spec}
+        self.name = name
+        self.address = int(spec["address"])
+        self.type = spec.get("type", "u16")
+        if self.type not in TYPES:
+            raise ValueError(f"Field '{name}': unknown type '{self.type}' (expected one of {', '.join(TYPES)})")
+        self.words, self.code = TYPES[self.type]
+        self.word_order = spec.get("word_order", "big")
+        if self.word_order not in ("big", "little"):
+            raise ValueError(f"Field '{name}': word_order must be big or little")
+        if self.address < 0 or self.address + self.words > 0x10000:
+            raise ValueError(f"Field '{name}': address {self.address} out of range")
+
+        # bits: name -> (shift, mask)
+        self.bits: Dict[str, Tuple[int, int]] = {}
+        for bit_name, bit in spec.get("fields", {}).items():
+            shift, width = (bit, 1) if isinstance(bit, int) else bit
+            if not 0 <= shift < 16 or not 1 <= width <= 16 - shift:
+                raise ValueError(f"Field '{name}.{bit_name}': bits {shift}+{width} do not fit in a register")
+            self.bits[bit_name] = (shift, (1 << width) - 1)
+        self._struct = struct.Struct(">" + self.code)
+
+    @property
+    def end(self) -> int:
+        return self.address + self.words
+
+    def word_addresses(self) -> Tuple[int, ...]:
+        """Register addresses from the most to the least significant word"""
+        if self.words == 1:
+            return (self.address,)
+        return (self.address, self.address + 1) if self.word_order == "big" else (self.address + 1, self.address)
+
+    def encode(self, value) -> List[int]:
+        """Value -> register words in address order"""
+        if self.type == "bits" and isinstance(value, dict):
+            word = 0
+            for bit_name, bit_value in value.items():
+                shift, mask = self.bits[bit_name]
+                word |= (int(bit_value) & mask) << shift
+            value = word
+        elif self.code != "f":
+            # Wrap like the PLC counters do instead of raising on overflow
+            value = int(value) & ((1 << (16 * self.words)) - 1)
+            if self.code in "hi" and value >= 1 << (16 * self.words - 1):
+                value -= 1 << (16 * self.words)
+        words = list(struct.unpack(f">{self.words}H", self._struct.pack(value)))
+        return words if self.word_order == "big" else words[::-1]
+
+    def decode(self, words: Sequence[int]):
+        """Register words in address order -> value"""
+        if self.word_order == "little":
+            words = list(words)[::-1]
+        value = self._struct.unpack(struct.pack(f">{self.words}H", *words))[0]
+        return self._split_bits(value) if self.bits else value
+
+    def _split_bits(self, word: int) -> Dict[str, int]:
+        return {bit_name: (word >> shift) & mask for bit_name, (shift, mask) in self.bits.items()}
+
+
+class Read:
+    """One FC1 or FC3 request of a plan, with its compiled decoder"""
+
+    def __init__(self, fc: int, address: int, count: int, names: List[str], coil_addresses: Sequence[int] = ()):
+        self.fc = fc
+        self.address = address
+        self.count = count
+        self.names = names
+        self._coil_offsets = [address - self.address for address in coil_addresses]
+        self._unpack = None
+        self._order: Optional[List[int]] = None
+        self._post: List[Tuple[int, Field]] = []
+
+    def compile(self, fields: Dict[str, Field]):
+        """Build one struct for all fields of a register read"""
+        if self.fc != 3:
+            return
+        fmt, offset, order = ">", self.address, []
+        for index, name in enumerate(self.names):
+            field = fields[name]
+            if field.address > offset:
+                gap = field.address - offset
+                fmt += f"{2 * gap}x"
+                order.extend(range(offset - self.address, field.address - self.address))
+            fmt += field.code
+            # Reorder little word order fields to big so one ">..." struct covers them
+            start = field.address - self.address
+            order.extend(range(start, start + field.words) if field.word_order == "big"
+                         else range(start + field.words - 1, start - 1, -1))
+            offset = field.end
+            if field.bits:
+                self._post.append((index, field))
+        order.extend(range(offset - self.address, self.count))
+        self._unpack = struct.Struct(fmt).unpack
+        self._order = None if order == list(range(self.count)) else order
+        self._words = struct.Struct(f">{self.count}H").pack
+
+    def decode(self, values: Sequence) -> Dict[str, object]:
+        """Response bits/registers of this read -> {name: value}"""
+        if self.fc == 1:
+            return {name: int(values[offset]) for name, offset in zip(self.names, self._coil_offsets)}
+        if self._order is not None:
+            values = [values[i] for i in self._order]
+        decoded = list(self._unpack(self._words(*values)))
+        for index, field in self._post:
+            decoded[index] = field._split_bits(decoded[index])
+        return dict(zip(self.names, decoded))
+
+    def to_dict(self) -> dict:
+        return {"fc": self.fc, "address": self.address, "count": self.count, "fields": self.names}
+
+
+class ReadPlan:
+    """Reads that together fetch a set of coils and fields"""
+
+    def __init__(self, reads: List[Read]):
+        self.reads = reads
+
+    def __len__(self):
+        return len(self.reads)
+
+    def words_read(self) -> int:
+        return sum(read.count for read in self.reads if read.fc == 3)
+
+    async def read(self, client, device_id: int = 0) -> Dict[str, object]:
+        """Execute the plan with a pymodbus async client and decode everything"""
+        values: Dict[str, object] = {}
+        for read in self.reads:
+            if read.fc == 1:
+                response = await client.read_coils(read.address, count=read.count, device_id=device_id)
+                data = response.bits if not response.isError() else None
+            else:
+                response = await client.read_holding_registers(read.address, count=read.count, device_id=device_id)
+                data = response.registers if not response.isError() else None
+            if data is None:
+                raise IOError(f"FC{read.fc} read of {read.count} at {read.address} failed: {response}")
+            values.update(read.decode(data))
+        return values
+
+    def to_json(self) -> dict:
+        return {"requests": len(self.reads), "reads": [read.to_dict() for read in self.reads]}
+
+
+# (start, end, name) of a coil or field, and a [start, end) span read in one request with its names
+Item = Tuple[int, int, str]
+Span = Tuple[int, int, List[str]]
+
+
+def _cover(items: List[Item], limit: int, max_gap: Optional[int]) -> List[Span]:
+    """
+    Fewest [start, end) spans of at most limit addresses covering items (start, end, name).
+
+    Greedy from the lowest address is optimal for a fixed window length, since
+    fields cannot be split; max_gap optionally bounds the over-read between
+    two fields in one span.
+    """
+    spans: List[Span] = []
+    for start, end, name in sorted(items):
+        if spans:
+            span_start, span_end, names = spans[-1]
+            gap_ok = max_gap is None or start - span_end <= max_gap
+            if end - span_start <= limit and gap_ok:
+                spans[-1] = (span_start, max(span_end, end), names + [name])
+                continue
+        spans.append((start, end, [name]))
+    return spans
+
+
+class RegisterMap:
+    def __init__(self, config: dict):
+        self.coils: Dict[str, int] = {name: int(address) for name, address in config.get("coils", {}).items()}
+        self.fields: Dict[str, Field] = {name: Field(name, spec) for name, spec in config.get("registers", {}).items()}
+        limits = config.get("max_read", {})
+        self.max_coils = int(limits.get("coils", MAX_COILS))
+        self.max_registers = int(limits.get("registers", MAX_REGISTERS))
+
+        ordered = sorted(self.fields.values(), key=lambda f: f.address)
+        for previous, field in zip(ordered, ordered[1:]):
+            if field.address < previous.end:
+                raise ValueError(f"Register fields overlap: {previous.name}, {field.name}")
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_MAP) -> "RegisterMap":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def encode(self, name: str, value) -> List[int]:
+        return self.fields[name].encode(value)
+
+    def decode(self, name: str, words: Sequence[int]):
+        return self.fields[name].decode(words)
+
+    def compile_plan(self, names: Optional[Iterable[str]] = None, max_coils: Optional[int] = None,
+                     max_registers: Optional[int] = None, max_gap: Optional[int] = None,
+                     cover: Optional[Callable[[int, List[Item], int], List[Span]]] = None) -> ReadPlan:
+        """
+        Compile the fewest reads that fetch names (all coils and fields by default).
+
+        Args:
+            names: Coil and field names
+            max_coils, max_registers: Per request limits (default: the map's max_read)
+            max_gap: Largest unused gap, in addresses, to read through inside one request
+            cover: Custom grouping, cover(fc, items, limit) -> spans (e.g. read_planner's cost model);
+                   replaces the greedy fewest-requests grouping and max_gap
+        """
+        if cover is None:
+            cover = lambda fc, items, limit: _cover(items, limit, max_gap)
+        names = list(names) if names is not None else list(self.coils) + list(self.fields)
+        unknown = [name for name in names if name not in self.coils and name not in self.fields]
+        if unknown:
+            raise ValueError(f"Unknown coil/field name(s): {', '.join(unknown)}")
+
+        reads = []
+        # Several names may share one coil address (aliases); keep them all
+        coils = [(self.coils[name], self.coils[name] + 1, name) for name in names if name in self.coils]
+        for start, end, span_names in cover(1, coils, max_coils or self.max_coils) if coils else []:
+            reads.append(Read(1, start, end - start, span_names, [self.coils[name] for name in span_names]))
+        fields = [(self.fields[n].address, self.fields[n].end, n) for n in names if n in self.fields]
+        for start, end, span_names in cover(3, fields, max_registers or self.max_registers) if fields else []:
+            read = Read(3, start, end - start, span_names)
+            read.compile(self.fields)
+            reads.append(read)
+        return ReadPlan(reads)
+
+
+if __name__ == "__main__":
+    import argparse
+    import asyncio
+    import time
+
+    parser = argparse.ArgumentParser(description="Show the read plan for a register map, or read all fields")
+    parser.add_argument("map", nargs="?", default=DEFAULT_MAP)
+    parser.add_argument("--fields", help="comma separated coil/field names (default: all)")
+    parser.add_argument("--max-gap", type=int, help="largest gap to read through inside one request")
+    parser.add_argument("--plan", action="store_true", help="print the read plan as JSON and exit")
+    parser.add_argument("--host", default=os.getenv("MODBUS_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MODBUS_PORT", "5020")))
+    parser.add_argument("--device-id", type=int, default=0)
+    args = parser.parse_args()
+
+    regmap = RegisterMap.load(args.map)
+    plan = regmap.compile_plan(args.fields.split(",") if args.fields else None, max_gap=args.max_gap)
+    if args.plan:
+        print(json.dumps(plan.to_json(), indent=2))
+        raise SystemExit(0)
+
+    async def read_once():
+        from pymodbus.client import AsyncModbusTcpClient
+        client = AsyncModbusTcpClient(args.host, port=args.port)
+        if not await client.connect():
+            raise SystemExit(f"Cannot connect to {args.host}:{args.port}")
+        try:
+            began = time.perf_counter()
+            values = await plan.read(client, args.device_id)
+            elapsed = time.perf_counter() - began
+        finally:
+            client.close()
+        for name, value in values.items():
+            print(f"{name:20s} {value}")
+        print(f"{len(values)} values in {len(plan)} request(s), {elapsed * 1000:.1f} ms")
+
+    asyncio.run(read_once())
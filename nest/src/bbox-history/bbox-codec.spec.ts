@@ -0,0 +1,58 @@
+import { gzipSync } from 'zlib';
+import {
+  BboxDecodeError,
+  decodeBboxUpload,
+  inflateBboxBody,
+} from './bbox-codec';
+
+// Produced by detection-service bbox_codec.encode('camera_0', [
+//   (7, 1700000000.123, [[1, 2, 3, 4], [5, 6, 7, 8]]),
+//   (8, 1700000000.190, []),
+//   (9, 1700000000.256, [[40000, -5, 10, 20]]),
+// ])
+const payload = Buffer.from(
+  '53504242010003007b68e5cf8b01000003000000080063616d6572615f30070000000800' +
+    '00000900000000000000430000004200000002000000010001000500ff7f0200060' +
+    '0fbff030007000a00040008001400',
+  'hex',
+);
+
+describe('bbox codec', () => {
+  it('decodes the detection-service encoding', () => {
+    expect(decodeBboxUpload(payload)).toEqual({
+      cameraId: 'camera_0',
+      frames: [
+        {
+          frameCount: 7,
+          ts: new Date(1700000000123),
+          bboxes: [
+            [1, 2, 3, 4],
+            [5, 6, 7, 8],
+          ],
+        },
+        { frameCount: 8, ts: new Date(1700000000190), bboxes: [] },
+        {
+          frameCount: 9,
+          ts: new Date(1700000000256),
+          bboxes: [[32767, -5, 10, 20]],
+        },
+      ],
+    });
+  });
+
+  it('inflates gzip bodies', () => {
+    expect(inflateBboxBody(gzipSync(payload), 'gzip')).toEqual(payload);
+  });
+
+  it('rejects truncated payloads', () => {
+    expect(() => decodeBboxUpload(payload.subarray(0, -1))).toThrow(
+      BboxDecodeError,
+    );
+  });
+
+  it('rejects unknown encodings', () => {
+    expect(() => inflateBboxBody(payload, 'br')).toThrow(
+      'Unsupported Content-Encoding: br',
+    );
+  });
+});
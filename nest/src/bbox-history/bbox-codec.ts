@@ -0,0 +1,135 @@
+import * as zlib from 'zlib';
+
+/**
+ * Decoder for the compact bbox upload format (detection-service bbox_codec.py).
+ *
+ * Wire format v1, all integers little-endian:
+ *   header         magic "SPBB", u8 version (1), u8 flags (0), u16 frames F,
+ *                  i64 base timestamp (ms since epoch), u32 boxes N,
+ *                  u16 camera id length L                      (22 bytes)
+ *   camera_id      L bytes, UTF-8
+ *   frame_numbers  u32[F]
+ *   ts_deltas      u32[F]  ms since the previous frame (the first since base)
+ *   box_counts     u16[F]
+ *   x, y, w, h     i16[N] each; the boxes of all frames in frame order
+ *
+ * Keep in sync with detection-service/bbox_codec.py.
+ */
+export const BBOX_CONTENT_TYPE = 'application/x-spavilion-bbox';
+
+const MAGIC = 'SPBB';
+const VERSION = 1;
+const HEADER_SIZE = 22;
+// Upper bound for an inflated body, against compression bombs
+const MAX_DECODED_BYTES = 16 * 1024 * 1024;
+
+export interface DecodedBboxFrame {
+  frameCount: number;
+  ts: Date;
+  bboxes: number[][]; // [[x, y, w, h], ...]
+}
+
+export interface DecodedBboxUpload {
+  cameraId: string;
+  frames: DecodedBboxFrame[];
+}
+
+export class BboxDecodeError extends Error {
+  constructor(
+    message: string,
+    readonly unsupportedEncoding = false,
+  ) {
+    super(message);
+    this.name = 'BboxDecodeError';
+  }
+}
+
+/** Undo the Content-Encoding of an upload body (gzip, zstd or none). */
+export function inflateBboxBody(body: Buffer, encoding?: string): Buffer {
+  const name = (encoding ?? 'identity').trim().toLowerCase();
+  try {
+    if (name === 'identity' || name === '') {
+      return body;
+    }
+    if (name === 'gzip') {
+      return zlib.gunzipSync(body, { maxOutputLength: MAX_DECODED_BYTES });
+    }
+    if (name === 'zstd') {
+      // zlib gained zstd in Node 22.15 / 23.8
+      const zstdDecompressSync = (zlib as any).zstdDecompressSync;
+      if (typeof zstdDecompressSync === 'function') {
+        return zstdDecompressSync(body, { maxOutputLength: MAX_DECODED_BYTES });
+      }
+    }
+  } catch (error) {
+    throw new BboxDecodeError(`Cannot decompress ${name} body: ${error.message}`);
+  }
+  throw new BboxDecodeError(`Unsupported Content-Encoding: ${name}`, true);
+}
+
+/** Decode a v1 payload into frames of [x, y, w, h] boxes. */
+export function decodeBboxUpload(data: Buffer): DecodedBboxUpload {
+  if (data.length < HEADER_SIZE) {
+    throw new BboxDecodeError('Payload shorter than the header');
+  }
+  if (data.toString('latin1', 0, 4) !== MAGIC) {
+    throw new BboxDecodeError('Bad magic');
+  }
+  const version = data.readUInt8(4);
+  if (version !== VERSION) {
+    throw new BboxDecodeError(`Unsupported version ${version}`);
+  }
+
+  const frameTotal = data.readUInt16LE(6);
+  const base = Number(data.readBigInt64LE(8));
+  const boxTotal = data.readUInt32LE(16);
+  const cameraLength = data.readUInt16LE(20);
+
+  const expected = HEADER_SIZE + cameraLength + frameTotal * 10 + boxTotal * 8;
+  if (data.length !== expected) {
+    throw new BboxDecodeError(
+      `Payload is ${data.length} bytes, expected ${expected}`,
+    );
+  }
+
+  let offset = HEADER_SIZE;
+  const cameraId = data.toString('utf8', offset, offset + cameraLength);
+  offset += cameraLength;
+  const numbersOffset = offset;
+  const deltasOffset = numbersOffset + frameTotal * 4;
+  const countsOffset = deltasOffset + frameTotal * 4;
+  const columnsOffset = countsOffset + frameTotal * 2;
+
+  const frames: DecodedBboxFrame[] = [];
+  let ts = base;
+  let box = 0;
+  for (let i = 0; i < frameTotal; i++) {
+    ts += data.readUInt32LE(deltasOffset + i * 4);
+    const count = data.readUInt16LE(countsOffset + i * 2);
+    if (box + count > boxTotal) {
+      throw new BboxDecodeError('Box counts exceed the box total');
+    }
+
+    const bboxes: number[][] = [];
+    for (let j = box; j < box + count; j++) {
+      bboxes.push([
+        data.readInt16LE(columnsOffset + j * 2),
+        data.readInt16LE(columnsOffset + (boxTotal + j) * 2),
+        data.readInt16LE(columnsOffset + (2 * boxTotal + j) * 2),
+        data.readInt16LE(columnsOffset + (3 * boxTotal + j) * 2),
+      ]);
+    }
+    box += count;
+
+    frames.push({
+      frameCount: data.readUInt32LE(numbersOffset + i * 4),
+      ts: new Date(ts),
+      bboxes,
+    });
+  }
+  if (box !== boxTotal) {
+    throw new BboxDecodeError('Box counts do not add up to the box total');
+  }
+
+  return { cameraId, frames };
+}
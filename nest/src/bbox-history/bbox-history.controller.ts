@@ -2,13 +2,29 @@ import {
   Controller,
   Post,
   Body,
+  Headers,
   HttpException,
   HttpStatus,
   Logger,
+  Req,
 } from '@nestjs/common';
-import { ApiTags, ApiOperation, ApiResponse, ApiBody } from '@nestjs/swagger';
+import {
+  ApiTags,
+  ApiOperation,
+  ApiResponse,
+  ApiBody,
+  ApiConsumes,
+} from '@nestjs/swagger';
+import { Request } from 'express';
 import { PrismaService } from '../prisma/prisma.service';
 import { CreateBboxHistoryDto } from '../dto/bbox-history.dto';
+import {
+  BBOX_CONTENT_TYPE,
+  BboxDecodeError,
+  DecodedBboxUpload,
+  decodeBboxUpload,
+  inflateBboxBody,
+} from './bbox-codec';
 
 @ApiTags('bbox-history')
 @Controller('api/bbox_history')
@@ -35,17 +51,7 @@ export class BboxHistoryController {
     try {
       const { bboxes, frame_count, camera_id } = dto;
 
-      // Save raw bbox data
-      const history = await this.prisma.bboxHistory.create({
-        data: {
-          bboxes: bboxes,
-          frameCount: frame_count,
-          cameraId: camera_id || 'default',
-        },
-      });
-
-      // Update heatmap aggregation
-      await this.updateHeatmap(bboxes, history.ts);
+      const history = await this.saveBboxes(bboxes, frame_count, camera_id);
 
       return {
         success: true,
@@ -60,6 +66,98 @@ export class BboxHistoryController {
     }
   }
 
+  @Post('binary')
+  @ApiOperation({
+    summary: '바운딩 박스 히스토리 생성 (압축 바이너리 포맷)',
+    description:
+      'detection-service의 BBOX_WIRE_FORMAT=binary 업로드. 포맷은 bbox-codec.ts 참고, Content-Encoding: gzip 또는 zstd',
+  })
+  @ApiConsumes(BBOX_CONTENT_TYPE)
+  @ApiResponse({
+    status: 201,
+    description: '바운딩 박스 히스토리 생성 성공',
+    schema: {
+      example: {
+        success: true,
+        ids: ['123', '124'],
+      },
+    },
+  })
+  @ApiResponse({ status: 400, description: '잘못된 페이로드' })
+  @ApiResponse({ status: 415, description: '지원하지 않는 Content-Type/Encoding' })
+  async createBboxHistoryBinary(
+    @Req() req: Request,
+    @Headers('content-encoding') encoding?: string,
+  ) {
+    if (!Buffer.isBuffer(req.body)) {
+      throw new HttpException(
+        `Content-Type must be ${BBOX_CONTENT_TYPE}`,
+        HttpStatus.UNSUPPORTED_MEDIA_TYPE,
+      );
+    }
+
+    let upload: DecodedBboxUpload;
+    try {
+      upload = decodeBboxUpload(inflateBboxBody(req.body, encoding));
+    } catch (error) {
+      if (error instanceof BboxDecodeError) {
+        throw new HttpException(
+          error.message,
+          error.unsupportedEncoding
+            ? HttpStatus.UNSUPPORTED_MEDIA_TYPE
+            : HttpStatus.BAD_REQUEST,
+        );
+      }
+      throw error;
+    }
+
+    try {
+      const ids: string[] = [];
+      for (const frame of upload.frames) {
+        const history = await this.saveBboxes(
+          frame.bboxes,
+          frame.frameCount,
+          upload.cameraId,
+          frame.ts,
+        );
+        ids.push(history.id.toString());
+      }
+
+      return {
+        success: true,
+        ids,
+      };
+    } catch (error) {
+      this.logger.error(`Failed to create bbox history: ${error.message}`);
+      throw new HttpException(
+        `Failed to create bbox history: ${error.message}`,
+        HttpStatus.INTERNAL_SERVER_ERROR,
+      );
+    }
+  }
+
+  private async saveBboxes(
+    bboxes: number[][],
+    frameCount?: number,
+    cameraId?: string,
+    ts?: Date,
+  ) {
+    // Save raw bbox data
+    const history = await this.prisma.bboxHistory.create({
+      data: {
+        ts,
+        bboxes: bboxes,
+        frameCount: frameCount,
+        cameraId: cameraId || 'default',
+      },
+    });
+
+    // Update heatmap aggregation
+    await this.updateHeatmap(bboxes, history.ts);
+
+    return history;
+  }
+
   private async updateHeatmap(bboxes: number[][], timestamp: Date) {
     try {
       // Get the hour timestamp (truncate to hour)
@@ -1,7 +1,12 @@
-import { Module } from '@nestjs/common';
+import { MiddlewareConsumer, Module, NestModule } from '@nestjs/common';
 import { BboxHistoryController } from './bbox-history.controller';
+import { RawBboxBodyMiddleware } from './raw-bbox-body.middleware';
 
 @Module({
   controllers: [BboxHistoryController],
 })
-export class BboxHistoryModule {}
+export class BboxHistoryModule implements NestModule {
+  configure(consumer: MiddlewareConsumer) {
+    consumer.apply(RawBboxBodyMiddleware).forRoutes('api/bbox_history/binary');
+  }
+}
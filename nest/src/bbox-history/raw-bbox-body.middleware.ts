@@ -0,0 +1,50 @@
+import {
+  Injectable,
+  NestMiddleware,
+  PayloadTooLargeException,
+} from '@nestjs/common';
+import { NextFunction, Request, Response } from 'express';
+import { BBOX_CONTENT_TYPE } from './bbox-codec';
+
+// Compressed upload size limit (a v1 frame of 1000 boxes is ~8 KB raw)
+const MAX_UPLOAD_BYTES = 1024 * 1024;
+
+/**
+ * Collects binary bbox uploads into req.body as a Buffer.
+ *
+ * express' raw body parser inflates gzip itself and rejects other encodings,
+ * so the body is read untouched here and decompressed by the controller.
+ */
+@Injectable()
+export class RawBboxBodyMiddleware implements NestMiddleware {
+  use(req: Request, _res: Response, next: NextFunction) {
+    if (!req.is(BBOX_CONTENT_TYPE)) {
+      next();
+      return;
+    }
+
+    const chunks: Buffer[] = [];
+    let size = 0;
+    let done = false;
+    const finish = (error?: Error) => {
+      if (!done) {
+        done = true;
+        next(error);
+      }
+    };
+
+    req.on('data', (chunk: Buffer) => {
+      size += chunk.length;
+      if (size > MAX_UPLOAD_BYTES) {
+        finish(new PayloadTooLargeException());
+        return;
+      }
+      chunks.push(chunk);
+    });
+    req.on('end', () => {
+      req.body = Buffer.concat(chunks);
+      finish();
+    });
+    req.on('error', finish);
+  }
+}
@@ -1,5 +1,5 @@
 import { ConfigService } from '@nestjs/config';
-import { ModbusService } from './modbus.service';
+import { ModbusService, planCoilReads } from './modbus.service';
 
 const defaultStatus = {
   heat: false,
@@ -49,3 +49,37 @@ describe('ModbusService (mock mode)', () => {
     expect(service.getStatuses().toJSON().fan).toBe(false);
   });
 });
+
+describe('planCoilReads', () => {
+  it('covers contiguous coils with one read', () => {
+    expect(planCoilReads([3, 0, 1, 2, 7, 6, 5, 4])).toEqual([{ start: 0, count: 8 }]);
+  });
+
+  it('splits reads at long gaps', () => {
+    expect(planCoilReads([0, 1, 500])).toEqual([
+      { start: 0, count: 2 },
+      { start: 500, count: 1 },
+    ]);
+  });
+});
+
+describe('ModbusService (polling)', () => {
+  it('reads all status coils in a single FC1 request', async () => {
+    const service = new ModbusService(new ConfigService({ modbus: { mock: false } }));
+    const readCoils = jest.fn().mockResolvedValue({
+      data: [true, false, false, true, false, false, false, true],
+    });
+    Object.assign(service, { client: { readCoils } });
+
+    await (service as unknown as { refreshStatuses(): Promise<void> }).refreshStatuses();
+
+    expect(readCoils).toHaveBeenCalledTimes(1);
+    expect(readCoils).toHaveBeenCalledWith(0, 8);
+    expect(service.getStatuses().toJSON()).toEqual({
+      ...defaultStatus,
+      heat: true,
+      'light-red': true,
+      display: true,
+    });
+  });
+});
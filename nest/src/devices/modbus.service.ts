@@ -6,7 +6,35 @@ import { DeviceStatusDto, DeviceStatusRecord } from './dto/device-status.dto';
 
 type DeviceRegisterMap = Record<DeviceTarget, number>;
 
+interface CoilRead {
+  start: number;
+  count: number;
+}
+
 const POLL_INTERVAL_MS = 100;
+// Largest FC1 read a Modbus server must accept
+const MAX_COILS_PER_READ = 2000;
+// Reading over an unused gap this long is still cheaper than another round trip
+// (mock-modbus read_planner.py: one request costs ~0.3 ms, a coil next to nothing)
+const MAX_COIL_GAP = 64;
+
+/**
+ * Group coil addresses into as few FC1 reads as possible, the schedule
+ * mock-modbus/read_planner.py produces for these coils.
+ */
+export function planCoilReads(registers: number[]): CoilRead[] {
+  const reads: CoilRead[] = [];
+  for (const register of [...new Set(registers)].sort((a, b) => a - b)) {
+    const last = reads[reads.length - 1];
+    const end = last ? last.start + last.count : 0;
+    if (last && register - end <= MAX_COIL_GAP && register - last.start < MAX_COILS_PER_READ) {
+      last.count = register - last.start + 1;
+    } else {
+      reads.push({ start: register, count: 1 });
+    }
+  }
+  return reads;
+}
 
 @Injectable()
 export class ModbusService implements OnModuleInit, OnModuleDestroy {
@@ -24,6 +52,8 @@ export class ModbusService implements OnModuleInit, OnModuleDestroy {
     'light-white': 6,
     display: 7,
   };
+  // All status coils in one FC1 request per poll instead of one per target
+  private readonly coilReads = planCoilReads(Object.values(this.registerMap));
 
   constructor(private readonly configService: ConfigService) {
     this.statuses = DEVICE_TARGETS.reduce<DeviceStatusRecord>((acc, target) => {
@@ -144,9 +174,14 @@ export class ModbusService implements OnModuleInit, OnModuleDestroy {
     if (!this.client) {
       return;
     }
-    for (const target of DEVICE_TARGETS) {
-      const register = this.registerMap[target];
-      this.statuses[target] = await this.readCoil(register);
+    for (const { start, count } of this.coilReads) {
+      const response = await this.client.readCoils(start, count);
+      for (const target of DEVICE_TARGETS) {
+        const register = this.registerMap[target];
+        if (register >= start && register < start + count) {
+          this.statuses[target] = Boolean(response.data?.[register - start]);
+        }
+      }
     }
   }
 